@@ -0,0 +1,4 @@
+import sys
+from facalc.cli import main
+
+sys.exit(main())
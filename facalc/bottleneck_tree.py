@@ -0,0 +1,166 @@
+from __future__ import annotations
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from facalc.factories import _Factory, SubFactory, OutputPoint, Bottleneck, LinearProblem, NumericProblem
+from facalc.shared_problems import SharedProblems, SharedProblemsHandle, attach
+
+
+@dataclass(eq=False)
+class BottleneckTreeNode:
+    """
+    The maximal rate after removing a set of caps, together with the subtrees obtained by additionally removing each
+    of the caps that bind at that rate. Nodes reached by removing the same caps in a different order are shared.
+    """
+    removed: frozenset[Bottleneck]
+    rate: float
+    binding: tuple[Bottleneck, ...]
+    children: dict[Bottleneck, BottleneckTreeNode] = field(default_factory=dict)
+
+    @property
+    def is_unbounded(self) -> bool:
+        return self.rate == float("inf")
+
+
+@dataclass(frozen=True)
+class BottleneckTree:
+    output_point: OutputPoint
+    root: BottleneckTreeNode
+    nodes: dict[frozenset[Bottleneck], BottleneckTreeNode]
+    num_solves: int
+
+    def chains(self) -> list[tuple[tuple[float, Bottleneck], ...]]:
+        """
+        Returns every path from the root to a node without explored children, as a chain in the format of
+        SingleAnalysisResults.bottlenecks.
+        """
+        chains = []
+
+        def walk(node: BottleneckTreeNode, chain: tuple[tuple[float, Bottleneck], ...]):
+            if not node.children:
+                chains.append(chain)
+                return
+            for cap, child in node.children.items():
+                walk(child, chain+((node.rate, cap),))
+
+        walk(self.root, ())
+        return chains
+
+    def display(self) -> str:
+        lines = [f"{self.root.rate:.2f}/s for {self.output_point}"]
+
+        def walk(node: BottleneckTreeNode, depth: int):
+            for cap, child in node.children.items():
+                rate = "infinite" if child.is_unbounded else f"{child.rate:.2f}/s"
+                lines.append(f"{'  '*depth}- {rate} by removing {cap.display()}")
+                walk(child, depth+1)
+
+        walk(self.root, 1)
+        return "\n".join(lines)
+
+
+_worker_problem: NumericProblem | None = None
+
+
+def _init_worker(handle: SharedProblemsHandle):
+    global _worker_problem
+    _worker_problem = attach(handle)[0]
+
+
+def _solve_removed(problem: NumericProblem, active: tuple[int, ...]) -> tuple[float, tuple[int, ...]]:
+    solution = problem.solve(np.array(active, dtype=int))
+    if solution is None:
+        return float("inf"), ()
+    return float(solution.rate), tuple(active[i] for i, x in enumerate(solution.max_slack) if x < 1e-9)
+
+
+def _solve_in_worker(active: tuple[int, ...]) -> tuple[float, tuple[int, ...]]:
+    return _solve_removed(_worker_problem, active)
+
+
+def explore_bottlenecks(factory: _Factory | SubFactory, output_point: OutputPoint, max_depth: int = 3,
+                        max_nodes: int = 10000, jobs: int | None = 1) -> BottleneckTree:
+    """
+    Explores the bottlenecks of an output point exactly: where the chain of SingleAnalysisResults only removes the first
+    binding cap at every step, this removes each binding cap in turn, level by level. The first branch of every node on
+    the chain is the chain itself, all other problems of one level are solved in parallel, and every set of removed caps
+    is solved only once.
+
+    :param factory: the factory containing the output point
+    :param output_point: the output point to explore
+    :param max_depth: the maximal number of caps removed along a path
+    :param max_nodes: the maximal number of tree nodes (and thus solves)
+    :param jobs: the number of worker processes, None for the number of cpus. With one job everything is solved in this
+    process
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    problem: LinearProblem = factory.compile(output_point)
+    numeric = problem.numeric
+    all_caps = tuple(range(len(problem.caps)))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # tree nodes are identified by the indices of the removed caps
+    solved: dict[frozenset[int], tuple[float, tuple[int, ...]]] = {}
+    # the first branch is the bottleneck chain of the analysis, so where binding caps tie the tree follows its choice
+    solution = problem.solve()
+    if solution is None:
+        solved[frozenset()] = (float("inf"), ())
+    else:
+        chain = problem.bottleneck_chain(solution, max_depth)
+        steps = chain.get_steps(max_depth)
+        removed: frozenset[int] = frozenset()
+        for depth in range(len(steps)+1):
+            solved[removed] = (float(chain.rate_after(depth)), chain.binding_after(depth))
+            if depth < len(steps):
+                removed = removed | {steps[depth][1]}
+    level = [frozenset()]
+    # the workers attach to the problem in shared memory and are only sent the caps to keep
+    shared = SharedProblems([numeric]) if jobs > 1 else None
+    executor = ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(shared.handle,)) if jobs > 1 else None
+    try:
+        for depth in range(max_depth):
+            next_level = []
+            for removed in level:
+                for cap_index in solved[removed][1]:
+                    candidate = removed | {cap_index}
+                    if candidate not in next_level:
+                        next_level.append(candidate)
+            # the nodes of the bottleneck chain are solved already
+            candidates = [candidate for candidate in next_level if candidate not in solved]
+            candidates = candidates[:max(0, max_nodes-len(solved))]
+            if candidates:
+                active_sets = [tuple(i for i in all_caps if i not in candidate) for candidate in candidates]
+                if executor is None:
+                    outcomes = [_solve_removed(numeric, active) for active in active_sets]
+                else:
+                    outcomes = list(executor.map(_solve_in_worker, active_sets,
+                                                 chunksize=max(1, len(active_sets)//jobs)))
+                solved.update(zip(candidates, outcomes))
+            level = [candidate for candidate in next_level if candidate in solved]
+            if not level:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            shared.close()
+
+    # assemble the tree
+    nodes: dict[frozenset[int], BottleneckTreeNode] = {}
+    for removed, (rate, binding) in solved.items():
+        nodes[removed] = BottleneckTreeNode(
+            frozenset(problem.caps[i] for i in removed), rate, tuple(problem.caps[i] for i in binding)
+        )
+    for removed, node in nodes.items():
+        for cap_index in solved[removed][1]:
+            child = nodes.get(removed | {cap_index})
+            if child is not None:
+                node.children[problem.caps[cap_index]] = child
+    return BottleneckTree(
+        output_point,
+        nodes[frozenset()],
+        {node.removed: node for node in nodes.values()},
+        len(solved)
+    )
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import cProfile
+import importlib
+import importlib.util
+import json
+import os
+import pstats
+import sys
+from typing import Any, Sequence
+from facalc.factories import (_Factory, SubFactory, OutputPoint, FullAnalysisResults, FactoryAnalysisException,
+                              _describe_node)
+from facalc.lp_export import MPS_FORMAT, LP_FORMAT, export_analysis
+
+
+DEFAULT_BUILDER = "build_factory"
+
+
+def load_world(spec: str) -> SubFactory:
+    """
+    Loads a factory from a world spec: a python file or module name, optionally followed by ':' and the name of the
+    function which builds the factory, build_factory by default. The directory of a python file is added to the import
+    path first, such that it can import the other modules of its world.
+    """
+    target, _, builder_name = spec.partition(":")
+    builder_name = builder_name or DEFAULT_BUILDER
+    if target.endswith(".py") or os.path.sep in target:
+        path = os.path.abspath(target)
+        if not os.path.isfile(path):
+            raise ValueError(f"World file {target} does not exist.")
+        directory = os.path.dirname(path)
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+        module_spec = importlib.util.spec_from_file_location(
+            os.path.splitext(os.path.basename(path))[0], path)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    builder = getattr(module, builder_name, None)
+    if builder is None:
+        raise ValueError(f"World {target} has no function {builder_name}.")
+    factory = builder()
+    if not isinstance(factory, SubFactory):
+        raise ValueError(f"{builder_name} of world {target} should return a sub factory, such as that of new_factory.")
+    return factory
+
+
+def select_output_points(factory: SubFactory, only: Sequence[str] | None) -> list[OutputPoint]:
+    """
+    Returns the output points of the factory, or only those whose material or description is in only.
+    """
+    output_points = list(factory._output_points)
+    if not only:
+        return output_points
+    selected = [output_point for output_point in output_points
+                if output_point.material in only or str(output_point) in only]
+    found = {output_point.material for output_point in selected} | {str(output_point) for output_point in selected}
+    missing = [name for name in only if name not in found]
+    if missing:
+        raise ValueError(f"No output points for {', '.join(missing)}.")
+    return selected
+
+
+def _number(value: float) -> float | None:
+    return None if value == float("inf") else float(value)
+
+
+def results_to_json(results: FullAnalysisResults, depth: int | None, factory: _Factory) -> dict[str, Any]:
+    """
+    The results as JSON, where the location of every output point is referred to by its index in the factory as in the
+    server and the exported variable maps, next to a description of it.
+    """
+    indices = {node: i for i, node in enumerate(factory.nodes)}
+    outputs = []
+    for output_point, single_results in results.single_results.items():
+        outputs.append({
+            "material": output_point.material,
+            "node": indices.get(output_point.location),
+            "location": _describe_node(output_point.location),
+            "rate": _number(single_results.result_rate),
+            "bottlenecks": [{"rate": _number(rate), "cap": cap.display()}
+                            for rate, cap in single_results.get_bottlenecks(depth)],
+        })
+    return {"outputs": outputs}
+
+
+def run(args: argparse.Namespace) -> str:
+    factory = load_world(args.world)
+    output_points = select_output_points(factory, args.only)
+    if args.export_lp is not None:
+        return "\n".join(export_analysis(factory, args.export_lp, output_points, args.lp_format, args.depth))
+    jobs = None if args.jobs == 0 else args.jobs
+    root: _Factory = factory.factory
+    single_results = root.analyse_many(output_points, args.progress, args.depth, jobs, args.cache_dir)
+    results = FullAnalysisResults.from_single_analyses(zip(output_points, single_results))
+    if args.format == "json":
+        return json.dumps(results_to_json(results, args.depth, root), indent=2)
+    return results.display()
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="facalc",
+        description="Analyses the maximal rate and bottlenecks of every output point of a factory."
+    )
+    parser.add_argument("world", help="python file or module building the factory, optionally followed by "
+                                      f":function, by default :{DEFAULT_BUILDER}")
+    parser.add_argument("--only", nargs="+", metavar="OUTPUT",
+                        help="only analyse the output points of these materials")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes solving problems, 0 for the number of cpus (default 1)")
+    parser.add_argument("--cache-dir", help="directory in which solutions are cached between runs")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="number of bottlenecks to compute per output point (default 2)")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="output format (default text)")
+    parser.add_argument("--progress", action="store_true", help="print progress to stderr")
+    parser.add_argument("--export-lp", metavar="DIRECTORY",
+                        help="instead of printing the results, write the linear programming problems of every output "
+                             "point to DIRECTORY, including the trash and bottleneck variants up to --depth")
+    parser.add_argument("--lp-format", choices=(MPS_FORMAT, LP_FORMAT), default=MPS_FORMAT,
+                        help="file format of --export-lp (default mps)")
+    parser.add_argument("--profile", nargs="?", const="-", metavar="FILE",
+                        help="profile the run and write the statistics to FILE, or print the slowest functions to "
+                             "stderr if no file is given")
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs should be non-negative")
+    if args.depth < 0:
+        parser.error("--depth should be non-negative")
+    # progress is printed to stderr, such that the output stays parsable
+    profiler = cProfile.Profile() if args.profile is not None else None
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                output = run(args)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    except ValueError as e:
+        print(f"facalc: error: {e}", file=sys.stderr)
+        return 2
+    except FactoryAnalysisException as e:
+        print(f"facalc: analysis failed: {e}", file=sys.stderr)
+        return 1
+    print(output)
+    if profiler is not None:
+        if args.profile == "-":
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+        else:
+            profiler.dump_stats(args.profile)
+    return 0
@@ -1,10 +1,15 @@
 from __future__ import annotations
 import numpy as np
 import scipy
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 import abc
-import weakref
-from typing import Iterable, Any
+import copy
+import hashlib
+import os
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Sequence, Any, Callable, ContextManager
+from facalc.simplex import WarmSimplex
 
 
 class MachineType(abc.ABC):
@@ -33,42 +38,233 @@ class MachineType(abc.ABC):
     def get_cap_description(self) -> str:
         return "[no description]"
 
+    @property
+    def machines_per_rate(self) -> float:
+        """
+        The number of physical machines needed per unit of rate of a machine group of this type.
+        """
+        return 1.
+
+
+class NodeGraph:
+    """
+    The connections between factory nodes. Instead of every node keeping lists of references to its neighbours, the
+    connections of all nodes of a graph are stored in shared integer arrays. Nodes and materials are numbered, the
+    connections of a node in one direction for one material form a line, and the connections of a line, as well as the
+    lines of a node, are linked lists through these arrays, kept in the order in which they were connected.
+    """
+    _ARRAYS = ("_first_line", "_last_line", "_line_material", "_next_line", "_first_edge", "_last_edge", "_ends",
+               "_next_edge")
+    __slots__ = ("nodes", "materials", "_material_ids", "_line_ids") + _ARRAYS
+
+    INPUT = 0
+    OUTPUT = 1
 
-class FactoryNode(abc.ABC):
     def __init__(self):
-        self._inputs: dict[str, list[weakref.ReferenceType[FactoryNode]]] = dict()
-        self._outputs: dict[str, list[weakref.ReferenceType[FactoryNode]]] = dict()
+        self.nodes: list[FactoryNode] = []
+        self.materials: list[str] = []
+        self._material_ids: dict[str, int] = {}
+        # lines are found by (2*node+direction) << 32 | material
+        self._line_ids: dict[int, int] = {}
+        # per 2*node+direction
+        self._first_line = array("i")
+        self._last_line = array("i")
+        # per line
+        self._line_material = array("i")
+        self._next_line = array("i")
+        self._first_edge = array("i")
+        self._last_edge = array("i")
+        # per 2*edge+direction, the node at that end of the edge and the next edge of the line it belongs to
+        self._ends = array("i")
+        self._next_edge = array("i")
+
+    def add(self, node: FactoryNode):
+        if node._graph is self:
+            return
+        if node._graph is not None:
+            raise ValueError("A node can only be part of one graph.")
+        node._graph = self
+        node._index = len(self.nodes)
+        self.nodes.append(node)
+        self._first_line.extend((-1, -1))
+        self._last_line.extend((-1, -1))
+
+    @staticmethod
+    def joining(*nodes: FactoryNode) -> NodeGraph:
+        """
+        Returns a graph containing all given nodes, adding nodes which are not part of a graph yet and merging the
+        graphs of the others into the largest one.
+        """
+        graphs = {id(node._graph): node._graph for node in nodes if node._graph is not None}
+        graph = max(graphs.values(), key=lambda x: len(x.nodes), default=None)
+        if graph is None:
+            graph = NodeGraph()
+        for other in graphs.values():
+            if other is not graph:
+                graph._absorb(other)
+        for node in nodes:
+            graph.add(node)
+        return graph
+
+    def _absorb(self, other: NodeGraph):
+        edges = list(other.edges())
+        for node in other.nodes:
+            node._graph = None
+            self.add(node)
+        other.__init__()
+        for frm, to, material in edges:
+            self.connect(frm, to, material)
+
+    def _new_line(self, slot: int, key: int, material_id: int) -> int:
+        line = len(self._line_material)
+        self._line_ids[key] = line
+        self._line_material.append(material_id)
+        self._next_line.append(-1)
+        self._first_edge.append(-1)
+        self._last_edge.append(-1)
+        if self._last_line[slot] == -1:
+            self._first_line[slot] = line
+        else:
+            self._next_line[self._last_line[slot]] = line
+        self._last_line[slot] = line
+        return line
+
+    def connect(self, frm: FactoryNode, to: FactoryNode, material: str):
+        """ connects two nodes of this graph without any checks, see _Factory.connect """
+        self.connect_many(((frm, to, material),))
+
+    def connect_many(self, connections: Iterable[tuple[FactoryNode, FactoryNode, str]]):
+        """ makes many connections between nodes of this graph at once, without any checks """
+        material_ids = self._material_ids
+        line_ids = self._line_ids
+        ends = self._ends
+        next_edge = self._next_edge
+        first_edge = self._first_edge
+        last_edge = self._last_edge
+        for frm, to, material in connections:
+            material_id = material_ids.get(material)
+            if material_id is None:
+                material_id = material_ids[material] = len(self.materials)
+                self.materials.append(material)
+            edge = len(ends) >> 1
+            ends.extend((frm._index, to._index))
+            next_edge.extend((-1, -1))
+            # the input line of 'to' lists 'frm' and the output line of 'frm' lists 'to'
+            for slot, direction in ((2*to._index, NodeGraph.INPUT), (2*frm._index+1, NodeGraph.OUTPUT)):
+                key = slot << 32 | material_id
+                line = line_ids.get(key)
+                if line is None:
+                    line = self._new_line(slot, key, material_id)
+                if last_edge[line] == -1:
+                    first_edge[line] = edge
+                else:
+                    next_edge[2*last_edge[line]+direction] = edge
+                last_edge[line] = edge
+
+    def materials_of(self, node: FactoryNode, direction: int) -> tuple[str, ...]:
+        materials = []
+        line = self._first_line[2*node._index+direction]
+        while line != -1:
+            materials.append(self.materials[self._line_material[line]])
+            line = self._next_line[line]
+        return tuple(materials)
+
+    def has_line(self, node: FactoryNode, direction: int, material: str) -> bool:
+        material_id = self._material_ids.get(material)
+        return material_id is not None and ((2*node._index+direction) << 32 | material_id) in self._line_ids
+
+    def neighbours(self, node: FactoryNode, direction: int, material: str) -> list[FactoryNode]:
+        material_id = self._material_ids.get(material)
+        if material_id is None:
+            return []
+        line = self._line_ids.get((2*node._index+direction) << 32 | material_id)
+        if line is None:
+            return []
+        neighbours = []
+        edge = self._first_edge[line]
+        # the neighbour of an input line is at the start of the edge, that of an output line at its end
+        while edge != -1:
+            neighbours.append(self.nodes[self._ends[2*edge+direction]])
+            edge = self._next_edge[2*edge+direction]
+        return neighbours
+
+    def edges(self) -> Iterable[tuple[FactoryNode, FactoryNode, str]]:
+        """ all connections in the order in which they were made """
+        lines = [-1]*(len(self._ends) >> 1)
+        for line in range(len(self._line_material)):
+            edge = self._first_edge[line]
+            while edge != -1:
+                lines[edge] = line
+                edge = self._next_edge[2*edge+NodeGraph.INPUT]
+        for edge, line in enumerate(lines):
+            yield (self.nodes[self._ends[2*edge]], self.nodes[self._ends[2*edge+1]],
+                   self.materials[self._line_material[line]])
+
+    def snapshot(self) -> tuple:
+        """ the current connections, which can be brought back by restore """
+        return (len(self.nodes), self.materials.copy(), self._material_ids.copy(), self._line_ids.copy(),
+                *(copy.copy(getattr(self, name)) for name in NodeGraph._ARRAYS))
+
+    def restore(self, snapshot: tuple):
+        """ restores the connections of a snapshot, removing the nodes added since from the graph """
+        num_nodes, self.materials, self._material_ids, self._line_ids, *arrays = snapshot
+        for node in self.nodes[num_nodes:]:
+            node._graph = None
+        del self.nodes[num_nodes:]
+        for name, value in zip(NodeGraph._ARRAYS, arrays):
+            setattr(self, name, copy.copy(value))
+
+    def retain(self, keep: Callable[[FactoryNode, FactoryNode, str], bool]):
+        """ removes all connections for which keep returns False, keeping the order of the others """
+        edges = [edge for edge in self.edges() if keep(*edge)]
+        nodes = self.nodes
+        self.__init__()
+        for node in nodes:
+            node._graph = None
+            self.add(node)
+        for edge in edges:
+            self.connect(*edge)
+
 
-    def add_input(self, node: FactoryNode, material: str):
-        if material not in self._inputs:
-            self._inputs[material] = []
-        self._inputs[material].append(weakref.ref(node))
+class FactoryNode(abc.ABC):
+    __slots__ = ("_graph", "_index", "__weakref__")
 
-    def add_output(self, node: FactoryNode, material: str):
-        if material not in self._outputs:
-            self._outputs[material] = []
-        self._outputs[material].append(weakref.ref(node))
+    def __init__(self):
+        self._graph: NodeGraph | None = None
+        self._index = -1
 
     @property
-    def input_materials(self):
-        return self._inputs.keys()
+    def input_materials(self) -> tuple[str, ...]:
+        if self._graph is None:
+            return tuple()
+        return self._graph.materials_of(self, NodeGraph.INPUT)
 
     @property
-    def output_materials(self):
-        return self._outputs.keys()
+    def output_materials(self) -> tuple[str, ...]:
+        if self._graph is None:
+            return tuple()
+        return self._graph.materials_of(self, NodeGraph.OUTPUT)
+
+    def has_input(self, material: str) -> bool:
+        return self._graph is not None and self._graph.has_line(self, NodeGraph.INPUT, material)
+
+    def has_output(self, material: str) -> bool:
+        return self._graph is not None and self._graph.has_line(self, NodeGraph.OUTPUT, material)
 
-    def inputs(self, material: str) -> Iterable[FactoryNode]:
-        if material not in self._inputs:
+    def inputs(self, material: str) -> Sequence[FactoryNode]:
+        if self._graph is None:
             return tuple()
-        return (x() for x in self._inputs[material])
+        return self._graph.neighbours(self, NodeGraph.INPUT, material)
 
-    def outputs(self, material: str) -> Iterable[FactoryNode]:
-        if material not in self._outputs:
+    def outputs(self, material: str) -> Sequence[FactoryNode]:
+        if self._graph is None:
             return tuple()
-        return (x() for x in self._outputs[material])
+        return self._graph.neighbours(self, NodeGraph.OUTPUT, material)
 
 
 class MachineGroup(FactoryNode):
+    __slots__ = ("machine_type", "machine_cap")
+
     def __init__(self, machine_type: MachineType, machine_cap: float | None = None):
         self.machine_type = machine_type
         self.machine_cap = machine_cap
@@ -94,6 +290,8 @@ class MachineGroup(FactoryNode):
 
 
 class Source(FactoryNode):
+    __slots__ = ("material", "max_rate")
+
     def __init__(self, material: str, max_rate: float | None = None):
         self.material = material
         self.max_rate = max_rate
@@ -104,6 +302,8 @@ class Source(FactoryNode):
 
 
 class TrashPoint(FactoryNode):
+    __slots__ = ("location", "material", "max_rate", "weight")
+
     def __init__(self, location: FactoryNode, material: str, max_rate: float | None = None, weight: float = 1.):
         self.location = location
         self.material = material
@@ -116,6 +316,8 @@ class TrashPoint(FactoryNode):
 
 
 class Buffer(FactoryNode):
+    __slots__ = ("name", "rate_caps")
+
     def __init__(self, name: str, rate_caps: dict[str, float] | None):
         if rate_caps is None:
             rate_caps = dict()
@@ -222,11 +424,121 @@ class FactoryRates:
 
 
 
+class BottleneckChain:
+    """
+    The bottlenecks of a solved problem, computed on demand by repeatedly removing the first binding cap and solving
+    again. The steps reuse one simplex method, which starts from the optimal basis of the previous step, so every step
+    costs a few pivots and only as many steps are computed as are requested.
+    """
+    def __init__(self, problem: LinearProblem, solution: LinearSolution, max_depth: int | None = None):
+        self.problem = problem
+        self.max_depth = max_depth
+        self.caps = problem.caps
+        self._base: BottleneckChain | None = None
+        self._steps: list[tuple[float, int]] = []
+        self._active = list(range(len(problem.caps)))
+        self._rate = solution.rate
+        self._binding = [i for i, x in enumerate(solution.max_slack) if x < 1e-9]
+        # the indices of the caps binding before every step and after the last one
+        self._bindings: list[tuple[int, ...]] = [tuple(self._binding)]
+        self._solution: LinearSolution | None = solution
+        self._simplex: WarmSimplex | None = None
+
+    def translated(self, caps: tuple[Bottleneck, ...]) -> BottleneckChain:
+        """
+        Returns the same chain for a problem with the same canonical key but different caps, sharing the computation.
+        """
+        chain = copy.copy(self)
+        chain.caps = caps
+        chain._base = self if self._base is None else self._base
+        return chain
+
+    @property
+    def complete(self) -> bool:
+        if self._base is not None:
+            return self._base.complete
+        return not self._binding or (self.max_depth is not None and len(self._steps) >= self.max_depth)
+
+    def get_steps(self, depth: int | None = None) -> list[tuple[float, int]]:
+        """
+        Returns the first depth steps of the chain as (rate, index of the removed cap) pairs, or all steps if depth is
+        None.
+        """
+        if self._base is not None:
+            return self._base.get_steps(depth)
+        while not self.complete and (depth is None or len(self._steps) < depth):
+            removed = self._active.pop(self._binding[0])
+            self._steps.append((self._rate, removed))
+            current = self._solve_without(removed)
+            if current is None:  # if the problem is unbounded, there are no bottlenecks left
+                self._rate = float("inf")
+                self._binding = []
+                self._bindings.append(())
+                break
+            self._rate = current.rate
+            self._binding = [i for i, x in enumerate(current.slack) if x < 1e-9]
+            self._bindings.append(tuple(self._active[i] for i in self._binding))
+        return self._steps if depth is None else self._steps[:depth]
+
+    def _solve_without(self, removed: int) -> LinearSolution | None:
+        """
+        Solves the problem with the caps that are still active. The first step starts a simplex method from the optimal
+        basis of the solution, after which removing a cap relaxes its bound and the next solve pivots on from the
+        previous basis. On numerical trouble the remaining steps are solved from scratch.
+        """
+        numeric = self.problem.numeric
+        try:
+            if self._solution is not None:
+                self._simplex = numeric.warm_simplex(self._solution)
+                self._solution = None
+            if self._simplex is not None:
+                self._simplex.relax(removed)
+                return numeric.solve_warm(self._simplex)
+        except np.linalg.LinAlgError:
+            self._simplex = None
+        return self.problem.solve(np.array(self._active, dtype=int))
+
+    def get(self, depth: int | None = None) -> tuple[tuple[float, Bottleneck], ...]:
+        return tuple((rate, self.caps[i]) for rate, i in self.get_steps(depth))
+
+    def binding_after(self, depth: int) -> tuple[int, ...]:
+        """
+        Returns the indices of the caps binding after removing the first depth bottlenecks, or all of them if there are
+        fewer, in increasing order, such that the first one is the next bottleneck.
+        """
+        if self._base is not None:
+            return self._base.binding_after(depth)
+        self.get_steps(depth)
+        return self._bindings[min(depth, len(self._bindings)-1)]
+
+    def rate_after(self, depth: int) -> float:
+        """
+        Returns the rate after removing the first depth bottlenecks, or all of them if there are fewer, computing only
+        those bottlenecks.
+        """
+        if self._base is not None:
+            return self._base.rate_after(depth)
+        self.get_steps(depth)
+        return self._steps[depth][0] if depth < len(self._steps) else self._rate
+
+
 @dataclass(frozen=True)
 class SingleAnalysisResults:
     result_rate: float
     rates: FactoryRates
-    bottlenecks: tuple[tuple[float, Bottleneck], ...]
+    _bottlenecks: tuple[tuple[float, Bottleneck], ...] | BottleneckChain
+
+    @property
+    def bottlenecks(self) -> tuple[tuple[float, Bottleneck], ...]:
+        return self.get_bottlenecks()
+
+    def get_bottlenecks(self, depth: int | None = None) -> tuple[tuple[float, Bottleneck], ...]:
+        """
+        Returns the first depth bottlenecks, or all of them if depth is None, computing them if necessary.
+        """
+        if isinstance(self._bottlenecks, BottleneckChain):
+            return self._bottlenecks.get(depth)
+        return self._bottlenecks[:depth]
 
     @property
     def source_costs(self) -> dict[Source, float]:
@@ -258,23 +570,138 @@ class SingleAnalysisResults:
         return "\n".join(lines)
 
     def display_one_line(self) -> str:
+        bottlenecks = self.get_bottlenecks(2)
         if self.result_rate < 1e-9:
             return "0.00/s"
-        elif len(self.bottlenecks) == 0:
+        elif len(bottlenecks) == 0:
             return f"infinite"
-        elif len(self.bottlenecks) == 1:
-            return f"{self.result_rate:.2f}/s bottlenecked by {self.bottlenecks[0][1].display()} for ever"
+        elif len(bottlenecks) == 1:
+            return f"{self.result_rate:.2f}/s bottlenecked by {bottlenecks[0][1].display()} for ever"
         else:
-            bottleneck_factor = self.bottlenecks[1][0]/self.bottlenecks[0][0]
-            return (f"{self.result_rate:.2f}/s bottlenecked by {self.bottlenecks[0][1].display()} "
+            bottleneck_factor = bottlenecks[1][0]/bottlenecks[0][0]
+            return (f"{self.result_rate:.2f}/s bottlenecked by {bottlenecks[0][1].display()} "
                     f"for another {bottleneck_factor:.1f}x")
 
 
+@dataclass(frozen=True)
+class BottleneckEntry:
+    """
+    A step of the bottleneck chain of an output point: at the given depth of the chain the output point is limited to
+    rate by the bottleneck, and removing it raises the rate to next_rate.
+    """
+    output_point: OutputPoint
+    depth: int
+    rate: float
+    next_rate: float
+
+    @property
+    def headroom(self) -> float:
+        """ the factor by which the rate rises when the bottleneck is removed """
+        return self.next_rate/self.rate if self.rate > 0. else float("inf")
+
+    @property
+    def unbounded(self) -> bool:
+        """ whether the rate of the output point becomes infinite when the bottleneck is removed """
+        return self.next_rate == float("inf")
+
+    @property
+    def blocked_rate(self) -> float:
+        """ the rate gained by removing the bottleneck, infinite if the output point then becomes unbounded """
+        return self.next_rate-self.rate
+
+
+class BottleneckIndex:
+    """
+    The bottleneck chains of many output points inverted: for every bottleneck the output points it limits.
+    """
+    def __init__(self, entries: dict[Bottleneck, list[BottleneckEntry]]):
+        self.entries = entries
+
+    def __getitem__(self, bottleneck: Bottleneck) -> tuple[BottleneckEntry, ...]:
+        return tuple(self.entries.get(bottleneck, ()))
+
+    def __contains__(self, bottleneck: Bottleneck) -> bool:
+        return bottleneck in self.entries
+
+    def output_points(self, bottleneck: Bottleneck, max_depth: int | None = None) -> list[OutputPoint]:
+        """
+        Returns the output points limited by the bottleneck, only counting those for which it is one of the first
+        max_depth bottlenecks if max_depth is given.
+        """
+        return [entry.output_point for entry in self.entries.get(bottleneck, ())
+                if max_depth is None or entry.depth < max_depth]
+
+    def unbounded_output_points(self, bottleneck: Bottleneck, max_depth: int | None = None) -> list[OutputPoint]:
+        """
+        Returns the output points whose rate becomes infinite when the bottleneck is removed, see output_points.
+        """
+        return [entry.output_point for entry in self.entries.get(bottleneck, ())
+                if entry.unbounded and (max_depth is None or entry.depth < max_depth)]
+
+    def blocked_rate(self, bottleneck: Bottleneck, max_depth: int | None = None) -> float:
+        """
+        The sum over the output points of the rate gained by removing the bottleneck. Output points which become
+        unbounded are left out, see unbounded_output_points.
+        """
+        return sum(entry.blocked_rate for entry in self.entries.get(bottleneck, ())
+                   if not entry.unbounded and (max_depth is None or entry.depth < max_depth))
+
+    def sorted_by_blocked_rate(self, max_depth: int | None = None) -> list[tuple[Bottleneck, float]]:
+        """
+        Returns the bottlenecks blocking a positive finite rate by decreasing blocked rate. Bottlenecks which only make
+        output points unbounded are listed by unbounded_bottlenecks instead.
+        """
+        rates = ((bottleneck, self.blocked_rate(bottleneck, max_depth)) for bottleneck in self.entries)
+        return sorted(((bottleneck, rate) for bottleneck, rate in rates if rate > 0.), key=lambda item: -item[1])
+
+    def unbounded_bottlenecks(self, max_depth: int | None = None) -> list[tuple[Bottleneck, list[OutputPoint]]]:
+        """
+        Returns the bottlenecks whose removal makes output points unbounded, with those output points, by decreasing
+        number of output points.
+        """
+        unbounded = ((bottleneck, self.unbounded_output_points(bottleneck, max_depth)) for bottleneck in self.entries)
+        return sorted(((bottleneck, output_points) for bottleneck, output_points in unbounded if output_points),
+                      key=lambda item: -len(item[1]))
+
+    def display(self, max_depth: int | None = 1) -> str:
+        lines = [" -- bottlenecks by blocked rate -- "]
+        for bottleneck, rate in self.sorted_by_blocked_rate(max_depth):
+            unbounded = self.unbounded_output_points(bottleneck, max_depth)
+            materials = ", ".join(output_point.material for output_point in self.output_points(bottleneck, max_depth)
+                                  if output_point not in unbounded)
+            lines.append(f"{rate:.2f}/s by {bottleneck.display()}: {materials}")
+        unbounded_bottlenecks = self.unbounded_bottlenecks(max_depth)
+        if unbounded_bottlenecks:
+            lines.append(" -- bottlenecks without which output is unbounded -- ")
+            for bottleneck, output_points in unbounded_bottlenecks:
+                materials = ", ".join(output_point.material for output_point in output_points)
+                lines.append(f"{bottleneck.display()}: {materials}")
+        return "\n".join(lines)
+
+
 @dataclass(frozen=True)
 class FullAnalysisResults:
     max_rates: FactoryRates
     single_results: dict[OutputPoint, SingleAnalysisResults]
 
+    def bottleneck_index(self, depth: int | None = None) -> BottleneckIndex:
+        """
+        Inverts the bottleneck chains of the output points, computing the first depth bottlenecks of every output point
+        or all of them if depth is None.
+        """
+        entries: dict[Bottleneck, list[BottleneckEntry]] = {}
+        for output_point, result in self.single_results.items():
+            bottlenecks = result.get_bottlenecks(depth)
+            for k, (rate, bottleneck) in enumerate(bottlenecks):
+                if k+1 < len(bottlenecks):
+                    next_rate = bottlenecks[k+1][0]
+                elif isinstance(result._bottlenecks, BottleneckChain):
+                    next_rate = result._bottlenecks.rate_after(k+1)
+                else:
+                    next_rate = float("inf")
+                entries.setdefault(bottleneck, []).append(BottleneckEntry(output_point, k, rate, next_rate))
+        return BottleneckIndex(entries)
+
     @classmethod
     def from_single_analyses(cls, results: Iterable[tuple[OutputPoint, SingleAnalysisResults]]) -> FullAnalysisResults:
         max_rates = FactoryRates({}, {}, {}, {})
@@ -291,28 +718,642 @@ class FullAnalysisResults:
         return "\n".join(lines)
 
 
+@dataclass(frozen=True)
+class JointAnalysisResults:
+    result_rate: float
+    output_rates: dict[OutputPoint, float]
+    rates: FactoryRates
+    bottlenecks: tuple[tuple[float, Bottleneck], ...]
+
+    def display(self, bottlenecks: bool = True) -> str:
+        lines = [f"final rate: {self.display_one_line()}", " -- joint output rates -- "]
+        for output_point, rate in self.output_rates.items():
+            lines.append(f"{output_point.material}: {rate:.2f}/s")
+        if bottlenecks and len(self.bottlenecks) >= 2:
+            lines.append(" -- bottlenecks -- ")
+            for i in range(len(self.bottlenecks)):
+                if i != len(self.bottlenecks)-1:
+                    lines.append(f"{self.bottlenecks[i+1][0]:.2f} by removing {self.bottlenecks[i][1].display()}")
+                else:
+                    lines.append(f"infinite by removing {self.bottlenecks[i][1].display()}")
+        return "\n".join(lines)
+
+    def display_one_line(self) -> str:
+        if self.result_rate < 1e-9:
+            return "0.00/s"
+        elif len(self.bottlenecks) == 0:
+            return f"infinite"
+        elif len(self.bottlenecks) == 1:
+            return f"{self.result_rate:.2f}/s bottlenecked by {self.bottlenecks[0][1].display()} for ever"
+        else:
+            bottleneck_factor = self.bottlenecks[1][0]/self.bottlenecks[0][0]
+            return (f"{self.result_rate:.2f}/s bottlenecked by {self.bottlenecks[0][1].display()} "
+                    f"for another {bottleneck_factor:.1f}x")
+
+
 class FactoryAnalysisException(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class LinearSolution:
+    rate: float
+    x: np.ndarray
+    # slack of the active inequalities at x
+    slack: np.ndarray
+    # slack and marginals of the active inequalities at the maximal rate before minimizing trash rates
+    max_slack: np.ndarray
+    marginals: np.ndarray
+
+
+def _append_row(matrix: np.ndarray, row: np.ndarray) -> np.ndarray:
+    if scipy.sparse.issparse(matrix):
+        return scipy.sparse.vstack((matrix, scipy.sparse.csr_array(row[np.newaxis])), format="csr")
+    return np.concatenate((matrix, np.array([row])))
+
+
+@dataclass(frozen=True)
+class NumericProblem:
+    """
+    The numerical data of a LinearProblem without any references to nodes, such that it can be sent to other processes.
+    """
+    objective: np.ndarray
+    trash_weights_vector: np.ndarray
+    trash_points_start: int
+    num_trash_points: int
+    equalities_matrix: np.ndarray
+    equalities_values: np.ndarray
+    inequalities_matrix: np.ndarray
+    inequalities_bounds: np.ndarray
+
+    def solve(self, active: np.ndarray | None = None, inequalities_bounds: np.ndarray | None = None
+              ) -> LinearSolution | None:
+        """
+        Maximizes the output rate and then, if any trash point is used, minimizes the weighted trash rates while keeping
+        the output rate maximal.
+
+        :param active: boolean mask or indices of the inequalities to take into account, by default all of them
+        :param inequalities_bounds: bounds replacing the bounds of the inequalities, by default the caps of the factory
+        :return: the solution, or None if the output rate is unbounded
+        """
+        if inequalities_bounds is None:
+            inequalities_bounds = self.inequalities_bounds
+        inequalities_matrix = self.inequalities_matrix
+        if active is not None:
+            inequalities_matrix = inequalities_matrix[active]
+            inequalities_bounds = inequalities_bounds[active]
+        # noinspection PyDeprecation
+        result = scipy.optimize.linprog(
+            -self.objective, inequalities_matrix, inequalities_bounds,
+            self.equalities_matrix, self.equalities_values
+        )
+        if result.status == 3:
+            return None
+        elif result.status != 0:
+            raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
+        optimal_rate = self.objective.dot(result.x)
+        max_slack = result.slack
+        marginals = result.ineqlin.marginals
+        # if there are relevant trash points, minimize for the weighted sum of their rates
+        if any(result.x[self.trash_points_start+i] > 1e-9 for i in range(self.num_trash_points)):
+            # noinspection PyDeprecation
+            result = scipy.optimize.linprog(
+                self.trash_weights_vector, inequalities_matrix, inequalities_bounds,
+                _append_row(self.equalities_matrix, self.objective),
+                np.concatenate((self.equalities_values, np.array([optimal_rate])))
+            )
+            if result.status != 0:
+                raise FactoryAnalysisException("Failed to solve the linear programming problem to minimize trash rates"
+                                               " somehow.")
+        return LinearSolution(optimal_rate, result.x, result.slack, max_slack, marginals)
+
+    def warm_simplex(self, solution: LinearSolution) -> WarmSimplex:
+        """
+        Returns a simplex method for this problem started from the optimal basis of a solution of it, see solve_warm.
+        Raises np.linalg.LinAlgError if no basis can be found.
+        """
+        problem = self.dense()
+        return WarmSimplex(problem.objective, problem.equalities_matrix, problem.equalities_values,
+                           problem.inequalities_matrix, problem.inequalities_bounds, solution.x)
+
+    def solve_warm(self, simplex: WarmSimplex) -> LinearSolution | None:
+        """
+        Solves this problem like solve, without the inequalities relaxed in the simplex method, by pivoting from the
+        basis it was left in by the previous solve. Raises np.linalg.LinAlgError on numerical trouble.
+        """
+        if not simplex.maximize():
+            return None
+        x = simplex.solution()
+        optimal_rate = self.objective.dot(x)
+        active = ~simplex.relaxed
+        max_slack = simplex.slack()[active].copy()
+        marginals = -simplex.duals()[simplex.num_equalities:][active]
+        if np.any(x[self.trash_points_start:self.trash_points_start+self.num_trash_points] > 1e-9):
+            # minimize the weighted trash rates by only pivoting on variables which do not lower the output rate
+            tolerance = 1e-9*max(1., np.max(np.abs(self.objective)))
+            allowed = np.abs(simplex.reduced_costs(simplex.objective)) <= tolerance
+            simplex.maximize(-self.trash_weights_vector, allowed)
+        return LinearSolution(optimal_rate, simplex.solution().copy(), simplex.slack()[active].copy(), max_slack,
+                              marginals)
+
+    def dense(self) -> NumericProblem:
+        """ this problem with dense matrices, such as those of shared problems, which are sparse """
+        if not scipy.sparse.issparse(self.inequalities_matrix):
+            return self
+        return replace(self, equalities_matrix=self.equalities_matrix.toarray(),
+                       inequalities_matrix=self.inequalities_matrix.toarray())
+
+    def solve_rates(self, inequalities_bounds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the maximal output rate for many sets of bounds of the inequalities, without minimizing trash rates.
+        The optimal basis of each linear programming problem which is solved is reused for all other sets of bounds
+        for which it stays feasible, so only one problem is solved per distinct optimal basis.
+
+        :param inequalities_bounds: array of shape (number of sets of bounds, number of inequalities)
+        :return: the maximal rates, infinite if unbounded, and a boolean array of the same shape as the bounds with
+        the binding inequalities
+        """
+        if scipy.sparse.issparse(self.inequalities_matrix):
+            return self.dense().solve_rates(inequalities_bounds)
+        inequalities_bounds = np.asarray(inequalities_bounds, dtype=float)
+        num_bounds = len(inequalities_bounds)
+        rates = np.zeros(num_bounds, float)
+        binding = np.zeros(inequalities_bounds.shape, bool)
+        unsolved = np.ones(num_bounds, bool)
+        num_equalities = len(self.equalities_matrix)
+        matrix = np.concatenate((self.equalities_matrix, self.inequalities_matrix))
+        while np.any(unsolved):
+            i = int(np.flatnonzero(unsolved)[0])
+            # noinspection PyDeprecation
+            result = scipy.optimize.linprog(
+                -self.objective, self.inequalities_matrix, inequalities_bounds[i],
+                self.equalities_matrix, self.equalities_values
+            )
+            if result.status == 3:
+                # whether the rate is unbounded does not depend on the bounds, as long as the problem is feasible
+                rates[unsolved] = float("inf")
+                break
+            elif result.status != 0:
+                raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
+            rates[i] = self.objective.dot(result.x)
+            binding[i] = result.slack < 1e-9
+            unsolved[i] = False
+            # the basic variables follow from the equalities and binding inequalities of the basis for any bounds
+            basic = result.x > 1e-12
+            tight = np.concatenate((np.ones(num_equalities, bool), binding[i]))
+            inverse = np.linalg.pinv(matrix[np.ix_(tight, basic)])
+            indices = np.flatnonzero(unsolved)
+            right_hand_sides = np.concatenate((
+                np.tile(self.equalities_values, (len(indices), 1)), inequalities_bounds[indices]
+            ), axis=1)
+            x = np.zeros((len(indices), len(self.objective)), float)
+            x[:, basic] = right_hand_sides[:, tight] @ inverse.T
+            values = x @ matrix.T
+            scale = 1e-9*np.maximum(1., np.abs(right_hand_sides))
+            slack = right_hand_sides[:, num_equalities:]-values[:, num_equalities:]
+            feasible = (
+                np.all(np.abs(values[:, tight]-right_hand_sides[:, tight]) <= scale[:, tight], axis=1)
+                & np.all(np.abs(values[:, :num_equalities]-right_hand_sides[:, :num_equalities])
+                         <= scale[:, :num_equalities], axis=1)
+                & np.all(slack >= -scale[:, num_equalities:], axis=1)
+                & np.all(x >= -1e-9, axis=1)
+            )
+            # a feasible basic solution of an optimal basis is optimal, as the reduced costs do not depend on the bounds
+            indices = indices[feasible]
+            rates[indices] = x[feasible] @ self.objective
+            binding[indices] = slack[feasible] < 1e-9
+            unsolved[indices] = False
+        return rates, binding
+
+
+@dataclass(frozen=True)
+class LinearProblem:
+    """
+    The linear programming problem for the maximal rate of one or more output points. The variables are the rates of
+    the output points, followed by the rates of the machine groups, the buffer transfers and the trash points. The
+    objective vector determines the rate which is maximized, for a single output point it is the rate of that point.
+    """
+    output_points: tuple[OutputPoint, ...]
+    sources: tuple[Source, ...]
+    machine_groups: tuple[MachineGroup, ...]
+    buffer_lines: tuple[tuple[Buffer, str], ...]
+    buffer_transfers: tuple[tuple[Buffer | Source, Buffer, str], ...]
+    trash_points: tuple[TrashPoint, ...]
+    equalities_matrix: np.ndarray
+    equalities_values: np.ndarray
+    inequalities_matrix: np.ndarray
+    inequalities_bounds: np.ndarray
+    caps: tuple[Bottleneck, ...]
+    source_rate_vectors: dict[Source, np.ndarray]
+    buffer_throughput_vectors: dict[tuple[Buffer, str], np.ndarray]
+    objective: np.ndarray
+    # supply rates of (node, material) pairs outside the boundary of the problem, if it has one
+    boundary_rate_vectors: dict[tuple[FactoryNode, str], np.ndarray] = field(default_factory=dict)
+
+    @property
+    def output_point(self) -> OutputPoint:
+        return self.output_points[0]
+
+    @property
+    def num_variables(self) -> int:
+        return self.equalities_matrix.shape[1]
+
+    @property
+    def machine_groups_start(self) -> int:
+        return len(self.output_points)
+
+    @property
+    def buffer_transfers_start(self) -> int:
+        return self.machine_groups_start+len(self.machine_groups)
+
+    @property
+    def trash_points_start(self) -> int:
+        return self.buffer_transfers_start+len(self.buffer_transfers)
+
+    @property
+    def to_minimize_vector(self) -> np.ndarray:
+        return -self.objective
+
+    @property
+    def trash_weights_vector(self) -> np.ndarray:
+        vector = np.zeros(self.num_variables, float)
+        for i, trash_point in enumerate(self.trash_points):
+            vector[self.trash_points_start+i] = trash_point.weight
+        return vector
+
+    @property
+    def numeric(self) -> NumericProblem:
+        return NumericProblem(
+            self.objective, self.trash_weights_vector, self.trash_points_start, len(self.trash_points),
+            self.equalities_matrix, self.equalities_values, self.inequalities_matrix, self.inequalities_bounds
+        )
+
+    def solve(self, active: np.ndarray | None = None, inequalities_bounds: np.ndarray | None = None
+              ) -> LinearSolution | None:
+        """
+        Maximizes the output rate, see NumericProblem.solve.
+        """
+        return self.numeric.solve(active, inequalities_bounds)
+
+    def get_rates(self, x: np.ndarray) -> FactoryRates:
+        trash_points_start = self.trash_points_start
+        return FactoryRates(
+            {source: v.dot(x) for source, v in self.source_rate_vectors.items()},
+            {key: v.dot(x) for key, v in self.buffer_throughput_vectors.items()},
+            {machine_group: x[self.machine_groups_start+i] for i, machine_group in enumerate(self.machine_groups)},
+            {trash_point: x[trash_points_start+i]
+             for i, trash_point in enumerate(self.trash_points) if x[trash_points_start+i] > 1e-9}
+        )
+
+    def infinite_results(self) -> SingleAnalysisResults:
+        return SingleAnalysisResults(
+            float("inf"),
+            FactoryRates(
+                {source: float("inf") for source in self.sources},
+                {x: float("inf") for x in self.buffer_lines},
+                {machine_group: float("inf") for machine_group in self.machine_groups},
+                {},
+            ),
+            ()
+        )
+
+    def with_ratios(self, ratios: Sequence[float]) -> LinearProblem:
+        """
+        Returns the problem in which the rates of the output points are fixed multiples of the given ratios, with the
+        multiple as the rate to maximize.
+        """
+        ratios = np.array(ratios, dtype=float)
+        if ratios.shape != (len(self.output_points),):
+            raise ValueError("Expected one ratio per output point.")
+        if np.any(ratios < 0.) or not np.any(ratios > 0.):
+            raise ValueError("Ratios should be non-negative and not all zero.")
+        reference = int(np.flatnonzero(ratios)[0])
+        equations = []
+        for k in range(len(self.output_points)):
+            if k == reference:
+                continue
+            equation = np.zeros(self.num_variables, float)
+            equation[k] = ratios[reference]
+            equation[reference] = -ratios[k]
+            equations.append(equation)
+        objective = np.zeros(self.num_variables, float)
+        objective[reference] = 1./ratios[reference]
+        return replace(
+            self,
+            equalities_matrix=np.concatenate((
+                self.equalities_matrix, np.array(equations, dtype=float).reshape(-1, self.num_variables)
+            )),
+            equalities_values=np.concatenate((self.equalities_values, np.zeros(len(equations)))),
+            objective=objective
+        )
+
+    def with_weights(self, weights: Sequence[float]) -> LinearProblem:
+        """
+        Returns the problem in which the weighted sum of the rates of the output points is maximized.
+        """
+        weights = np.array(weights, dtype=float)
+        if weights.shape != (len(self.output_points),):
+            raise ValueError("Expected one weight per output point.")
+        objective = np.zeros(self.num_variables, float)
+        objective[:len(self.output_points)] = weights
+        return replace(self, objective=objective)
+
+    def with_source_caps(self, sources: Iterable[Source]) -> tuple[LinearProblem, dict[Source, int]]:
+        """
+        Returns the problem with a cap on every given source which supplies it, with a zero bound for sources which
+        had no cap, together with the index of the inequality of the cap of every such source.
+        """
+        rows = {cap.source: j for j, cap in enumerate(self.caps) if isinstance(cap, SourceRateCap)}
+        new_rows, new_caps = [], []
+        for source in sources:
+            if source in rows or source not in self.source_rate_vectors:
+                continue
+            rows[source] = len(self.caps)+len(new_caps)
+            new_rows.append(self.source_rate_vectors[source])
+            new_caps.append(SourceRateCap(source))
+        if not new_rows:
+            return self, rows
+        return replace(
+            self,
+            inequalities_matrix=np.concatenate((self.inequalities_matrix, np.array(new_rows))),
+            inequalities_bounds=np.concatenate((self.inequalities_bounds, np.zeros(len(new_rows)))),
+            caps=self.caps+tuple(new_caps)
+        ), rows
+
+    def cap_row(self, cap: Bottleneck) -> np.ndarray | None:
+        """ the row of the inequality of a cap, whether or not the problem has it, or None if it does not apply """
+        row = np.zeros(self.num_variables, float)
+        if isinstance(cap, SourceRateCap):
+            return self.source_rate_vectors.get(cap.source)
+        if isinstance(cap, BufferRateCap):
+            return self.buffer_throughput_vectors.get((cap.buffer, cap.material))
+        if isinstance(cap, MachineRateCap) and cap.machine_group in self.machine_groups:
+            row[self.machine_groups_start+self.machine_groups.index(cap.machine_group)] = 1.
+            return row
+        if isinstance(cap, TrashPointRateCap) and cap.trash_point in self.trash_points:
+            row[self.trash_points_start+self.trash_points.index(cap.trash_point)] = 1.
+            return row
+        if isinstance(cap, OutputPointRateCap) and cap.output_point in self.output_points:
+            row[self.output_points.index(cap.output_point)] = 1.
+            return row
+        return None
+
+    def patch_bounds(self, patches: dict[Bottleneck, float | None]
+                     ) -> tuple[np.ndarray, list[np.ndarray], list[float], list[Bottleneck]]:
+        """
+        Returns the bounds of the inequalities with the patches applied, infinite for removed caps, together with the
+        rows, bounds and caps the problem needs for caps it does not have yet.
+
+        :param patches: the new bound of every patched cap, None to remove a cap
+        """
+        rows = {cap: j for j, cap in enumerate(self.caps)}
+        bounds = self.inequalities_bounds.copy()
+        new_rows, new_bounds, new_caps = [], [], []
+        for cap, bound in patches.items():
+            if cap in rows:
+                bounds[rows[cap]] = float("inf") if bound is None else bound
+            elif bound is not None:
+                row = self.cap_row(cap)
+                if row is not None:
+                    new_rows.append(row)
+                    new_bounds.append(bound)
+                    new_caps.append(cap)
+        return bounds, new_rows, new_bounds, new_caps
+
+    def with_caps(self, patches: dict[Bottleneck, float | None]) -> LinearProblem:
+        """ Returns the problem with the bounds of caps patched, see patch_bounds. """
+        bounds, new_rows, new_bounds, new_caps = self.patch_bounds(patches)
+        # removed caps are dropped, as the solver does not accept infinite bounds
+        kept = np.isfinite(bounds)
+        return replace(
+            self,
+            inequalities_matrix=np.concatenate((self.inequalities_matrix[kept],
+                                                np.array(new_rows, dtype=float).reshape(-1, self.num_variables))),
+            inequalities_bounds=np.concatenate((bounds[kept], np.array(new_bounds, dtype=float))),
+            caps=tuple(cap for cap, keep in zip(self.caps, kept) if keep)+tuple(new_caps)
+        )
+
+    def bottleneck_chain(self, solution: LinearSolution, max_depth: int | None = None) -> BottleneckChain:
+        return BottleneckChain(self, solution, max_depth)
+
+    def results_from(self, solution: LinearSolution | None, max_depth: int | None = None) -> SingleAnalysisResults:
+        """
+        Returns the results for a solution of this problem, with the bottlenecks computed on demand.
+
+        :param solution: the solution, or None if the problem is unbounded
+        :param max_depth: the maximal number of bottlenecks to compute, by default the full chain
+        """
+        if solution is None:
+            return self.infinite_results()
+        return SingleAnalysisResults(
+            solution.rate,
+            self.get_rates(solution.x),
+            self.bottleneck_chain(solution, max_depth)
+        )
+
+    def analyse(self, max_depth: int | None = None) -> SingleAnalysisResults:
+        return self.results_from(self.solve(), max_depth)
+
+    def canonical_key(self) -> bytes:
+        """
+        Returns a digest of the numerical data of the problem. Problems with the same key have the same solutions and
+        bottleneck indices, even if they belong to different nodes.
+        """
+        digest = hashlib.sha1()
+        for array in (self.objective, self.trash_weights_vector, self.equalities_matrix, self.equalities_values,
+                      self.inequalities_matrix, self.inequalities_bounds):
+            digest.update(str(array.shape).encode())
+            digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+        return digest.digest()
+
+    def translate_results(self, other: LinearProblem, other_solution: LinearSolution | None,
+                          other_results: SingleAnalysisResults) -> SingleAnalysisResults:
+        """
+        Translates the results of another problem with the same canonical key to the nodes of this problem.
+        """
+        if other_solution is None:
+            return self.infinite_results()
+        if isinstance(other_results._bottlenecks, BottleneckChain):
+            bottlenecks = other_results._bottlenecks.translated(self.caps)
+        else:
+            caps = dict(zip(other.caps, self.caps))
+            bottlenecks = tuple((rate, caps[bottleneck]) for rate, bottleneck in other_results._bottlenecks)
+        return SingleAnalysisResults(
+            other_results.result_rate,
+            self.get_rates(other_solution.x),
+            bottlenecks
+        )
+
+    def analyse_joint(self) -> JointAnalysisResults:
+        solution = self.solve()
+        if solution is None:
+            infinite_results = self.infinite_results()
+            return JointAnalysisResults(
+                float("inf"),
+                {output_point: float("inf") for output_point in self.output_points},
+                infinite_results.rates,
+                ()
+            )
+        return JointAnalysisResults(
+            solution.rate,
+            {output_point: solution.x[k] for k, output_point in enumerate(self.output_points)},
+            self.get_rates(solution.x),
+            self.bottleneck_chain(solution).get()
+        )
+
+
+def _describe_node(node: FactoryNode) -> str:
+    if isinstance(node, MachineGroup):
+        return f"a machine group of {node.machine_type.display_info(1.)}"
+    return str(node)
+
+
+class FactoryBuilder:
+    """
+    Collects connections, which build validates in one pass and then makes. The kind of every node class and the
+    materials of every machine type are looked up once per batch rather than once per connection, and the errors of
+    all invalid connections are reported together, in which case none of the connections is made.
+    """
+    def __init__(self):
+        self.connections: list[tuple[FactoryNode, FactoryNode, tuple[str, ...]]] = []
+        self._kinds: dict[type, type | None] = {}
+        self._machine_materials: dict[int, tuple[MachineType, Any, Any]] = {}
+        # connections of the batch which are not made yet, but are taken into account by the validation
+        self._machine_inputs: set[tuple[FactoryNode, str]] = set()
+        self._machine_outputs: set[tuple[FactoryNode, str]] = set()
+        self._trash_inputs: set[FactoryNode] = set()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def connect(self, frm: FactoryNode, to: FactoryNode, *materials: str):
+        """ records a connection, see _Factory.connect """
+        self.connections.append((frm, to, materials))
+
+    def _kind(self, node: FactoryNode) -> type | None:
+        cls = type(node)
+        if cls not in self._kinds:
+            self._kinds[cls] = next((kind for kind in (Source, MachineGroup, TrashPoint, Buffer)
+                                     if issubclass(cls, kind)), None)
+        return self._kinds[cls]
+
+    def _materials_of(self, machine_type: MachineType) -> tuple[Any, Any]:
+        # keyed by id, as machine types need not be hashable; the machine type is kept such that the id stays unique
+        entry = self._machine_materials.get(id(machine_type))
+        if entry is None:
+            entry = (machine_type, machine_type.input_rates.keys(), machine_type.output_rates.keys())
+            self._machine_materials[id(machine_type)] = entry
+        return entry[1], entry[2]
+
+    def resolve(self, frm: FactoryNode, to: FactoryNode, materials: tuple[str, ...]) -> tuple[str, ...]:
+        """
+        Validates a connection against the connections made so far and those resolved before in this batch, returning
+        its materials, which are auto-detected if none are given. Raises a ValueError for invalid connections.
+        """
+        frm_kind = self._kind(frm)
+        to_kind = self._kind(to)
+        if frm_kind is TrashPoint or (to_kind is TrashPoint and (to.input_materials or to in self._trash_inputs)):
+            raise ValueError("Cannot make any additional connections to trash points.")
+        if to_kind is Source:
+            raise ValueError("Cannot connect anything towards a source.")
+        frm_inputs, frm_outputs = self._materials_of(frm.machine_type) if frm_kind is MachineGroup else ((), ())
+        to_inputs, to_outputs = self._materials_of(to.machine_type) if to_kind is MachineGroup else ((), ())
+        for material in materials:
+            if frm_kind is Source and material != frm.material:
+                raise ValueError("Cannot connect from a source with a different material than the source material.")
+            if frm_kind is MachineGroup:
+                if frm.has_output(material) or (frm, material) in self._machine_outputs:
+                    raise ValueError("Per material a machine group can have only one output")
+                if material not in frm_outputs:
+                    raise ValueError(f"A machine of this type cannot have '{material}' as an output.")
+            if to_kind is MachineGroup:
+                if to.has_input(material) or (to, material) in self._machine_inputs:
+                    raise ValueError("Per material a machine group can have only one input")
+                if material not in to_inputs:
+                    raise ValueError(f"A machine of this type cannot have '{material}' as an input.")
+
+        if not materials and frm_kind is Source:
+            materials = (frm.material,)
+        if not materials and frm_kind is MachineGroup and len(frm_outputs) == 1:
+            materials = (next(iter(frm_outputs)),)
+        if not materials and to_kind is MachineGroup and len(to_inputs) == 1:
+            materials = (next(iter(to_inputs)),)
+        if not materials:
+            raise ValueError("Unable to auto-detect material.")
+        if frm_kind is MachineGroup:
+            self._machine_outputs.update((frm, material) for material in materials)
+        if to_kind is MachineGroup:
+            self._machine_inputs.update((to, material) for material in materials)
+        if to_kind is TrashPoint:
+            self._trash_inputs.add(to)
+        return materials
+
+    @staticmethod
+    def make(frm: FactoryNode, to: FactoryNode, materials: tuple[str, ...]):
+        """ makes a connection without validating it """
+        graph = frm._graph
+        if graph is None or graph is not to._graph:
+            graph = NodeGraph.joining(frm, to)
+        for material in materials:
+            graph.connect(frm, to, material)
+
+    def build(self):
+        """
+        Validates all recorded connections and makes them if all of them are valid, or raises a ValueError listing the
+        invalid ones otherwise. Either way no connections are left recorded.
+        """
+        connections, self.connections = self.connections, []
+        resolved = []
+        errors = []
+        for i, (frm, to, materials) in enumerate(connections):
+            try:
+                resolved.append((frm, to, self.resolve(frm, to, materials)))
+            except ValueError as e:
+                errors.append(f"- connection {i+1} from {_describe_node(frm)} to {_describe_node(to)}: {e}")
+        self._machine_inputs.clear()
+        self._machine_outputs.clear()
+        self._trash_inputs.clear()
+        if errors:
+            raise ValueError(f"{len(errors)} of {len(connections)} connections are invalid:\n"+"\n".join(errors))
+        graphs: dict[int, tuple[NodeGraph, list[tuple[FactoryNode, FactoryNode, str]]]] = {}
+        for frm, to, materials in resolved:
+            graph = frm._graph
+            if graph is None or graph is not to._graph:
+                # merging graphs renumbers nodes, so the connections gathered so far are made first
+                for other, edges in graphs.values():
+                    other.connect_many(edges)
+                graphs.clear()
+                graph = NodeGraph.joining(frm, to)
+            if id(graph) not in graphs:
+                graphs[id(graph)] = (graph, [])
+            graphs[id(graph)][1].extend((frm, to, material) for material in materials)
+        for graph, edges in graphs.values():
+            graph.connect_many(edges)
+
+
 class _Factory:
     def __init__(self):
         self.nodes: list[FactoryNode] = []
+        self.graph = NodeGraph()
+        self._builder: FactoryBuilder | None = None
 
     def add_buffer(self, name: str, rate_caps: dict[str, float] | None = None) -> Buffer:
         if rate_caps is None:
             rate_caps = dict()
         buffer = Buffer(name, rate_caps)
+        self.graph.add(buffer)
         self.nodes.append(buffer)
         return buffer
 
     def add_source(self, material: str, max_rate: float | None = None):
         source = Source(material, max_rate)
+        self.graph.add(source)
         self.nodes.append(source)
         return source
 
     def add_machine_group(self, machine_type: MachineType, machine_cap: float | None = None):
         machine_group = MachineGroup(machine_type, machine_cap)
+        self.graph.add(machine_group)
         self.nodes.append(machine_group)
         return machine_group
 
@@ -324,48 +1365,47 @@ class _Factory:
         self.nodes.append(trash_point)
         return trash_point
 
-    @staticmethod
-    def connect(frm: FactoryNode, to: FactoryNode, *materials: str):
+    def connect(self, frm: FactoryNode, to: FactoryNode, *materials: str):
         """
         Connects the output of node 'frm' to the input of node 'to' for the specified materials.
-        If no materials are specified, one will be auto-detected when there is only one choice
+        If no materials are specified, one will be auto-detected when there is only one choice.
+        Within a bulk block the connection is only recorded, and validated and made when the block ends.
 
         :param frm: the source of the connection
         :param to: the target of the connection
         :param materials: materials to connect. If none specified, one will be auto-detected when there is only one choice
         """
-        if isinstance(frm, TrashPoint) or (isinstance(to, TrashPoint) and to.input_materials):
-            raise ValueError("Cannot make any additional connections to trash points.")
-        if isinstance(to, Source):
-            raise ValueError("Cannot connect anything towards a source.")
-        for material in materials:
-            if isinstance(frm, Source) and material != frm.material:
-                raise ValueError("Cannot connect from a source with a different material than the source material.")
-            if isinstance(frm, MachineGroup):
-                if material in frm.output_materials:
-                    raise ValueError("Per material a machine group can have only one output")
-                if material not in frm.machine_type.output_materials:
-                    raise ValueError(f"A machine of this type cannot have '{material}' as an output.")
-            if isinstance(to, MachineGroup):
-                if material in to.input_materials:
-                    raise ValueError("Per material a machine group can have only one input")
-                if material not in to.machine_type.input_materials:
-                    raise ValueError(f"A machine of this type cannot have '{material}' as an input.")
-
-        if not materials and isinstance(frm, Source):
-            materials = (frm.material,)
-        if not materials and isinstance(frm, MachineGroup) and len(frm.machine_type.output_rates.keys()) == 1:
-            materials = (list(frm.machine_type.output_rates.keys())[0],)
-        if not materials and isinstance(to, MachineGroup) and len(to.machine_type.input_rates.keys()) == 1:
-            materials = (list(to.machine_type.input_rates.keys())[0],)
-        if not materials:
-            raise ValueError("Unable to auto-detect material.")
-        for material in materials:
-            to.add_input(frm, material)
-            frm.add_output(to, material)
+        if self._builder is not None:
+            self._builder.connect(frm, to, *materials)
+            return
+        builder = FactoryBuilder()
+        builder.make(frm, to, builder.resolve(frm, to, materials))
+
+    @contextmanager
+    def bulk(self) -> Iterator[FactoryBuilder]:
+        """
+        Records the connections made within the with block, which are validated in one pass and made when the block
+        ends, see FactoryBuilder. Connections recorded so far are also made when the factory is compiled within the
+        block. If the block raises an exception, the recorded connections are dropped.
+        """
+        if self._builder is not None:
+            yield self._builder
+            return
+        self._builder = FactoryBuilder()
+        try:
+            yield self._builder
+            self._builder.build()
+        finally:
+            self._builder = None
+
+    def build(self):
+        """ makes the connections recorded within a bulk block so far """
+        if self._builder is not None and self._builder.connections:
+            self._builder.build()
 
     @staticmethod
-    def search_nodes(location: FactoryNode, material: str, hit_search: tuple[set, ...] | None = None):
+    def search_nodes(location: FactoryNode, material: str, hit_search: tuple[set, ...] | None = None,
+                     boundary: set[FactoryNode] | None = None):
         sources: list[Source] = []
         machine_groups: list[MachineGroup] = []
         buffer_lines: list[tuple[Buffer, str]] = []
@@ -383,6 +1423,8 @@ class _Factory:
         while to_search:
             new_to_search: list[tuple[FactoryNode, str | None]] = []
             for node, material in to_search:
+                if boundary is not None and node not in boundary:
+                    continue
                 if isinstance(node, MachineGroup):
                     if node in hit_machine_groups:
                         did_hit = True
@@ -417,16 +1459,39 @@ class _Factory:
         else:
             return sources, machine_groups, buffer_lines, buffer_transfers, did_hit
 
-    def analyse(self, output_point: OutputPoint) -> SingleAnalysisResults:
-        if isinstance(output_point.location, Source):
-            raise FactoryAnalysisException("Taking output directly from a source is not supported.")
-        if (isinstance(output_point.location, MachineGroup) and
-                output_point.material in output_point.location.output_materials):
-            raise FactoryAnalysisException("Taking output from a machine group which already has "
-                                           "output is not supported")
-        if any(isinstance(node, TrashPoint) for node in output_point.location.outputs(output_point.material)):
-            raise FactoryAnalysisException("Taking output from a node and material which already has a trash point is "
-                                           "not supported")
+    def compile(self, output_point: OutputPoint, boundary: Iterable[FactoryNode] | None = None,
+                trash_points: Iterable[TrashPoint] | None = None) -> LinearProblem:
+        return self.compile_joint((output_point,), boundary, trash_points)
+
+    def compile_joint(self, output_points: Sequence[OutputPoint], boundary: Iterable[FactoryNode] | None = None,
+                      trash_points: Iterable[TrashPoint] | None = None) -> LinearProblem:
+        """
+        Sets up the linear programming problem in which all given output points take output at the same time, with the
+        rate of the first output point as objective.
+
+        :param output_points: the output points
+        :param boundary: if given, only these nodes are taken into account. Buffers and sources outside the boundary
+        which supply nodes inside it are treated as unlimited supplies, see LinearProblem.boundary_rate_vectors
+        :param trash_points: the trash points to consider, by default all trash points of the factory. Passing only
+        those in the connected component of the output points saves searching the others
+        """
+        self.build()
+        output_points = tuple(output_points)
+        if not output_points:
+            raise ValueError("At least one output point is required.")
+        for output_point in output_points:
+            if isinstance(output_point.location, Source):
+                raise FactoryAnalysisException("Taking output directly from a source is not supported.")
+            if (isinstance(output_point.location, MachineGroup) and
+                    output_point.material in output_point.location.output_materials):
+                raise FactoryAnalysisException("Taking output from a machine group which already has "
+                                               "output is not supported")
+            if any(isinstance(node, TrashPoint) for node in output_point.location.outputs(output_point.material)):
+                raise FactoryAnalysisException("Taking output from a node and material which already has a trash "
+                                               "point is not supported")
+        output_keys = {(output_point.location, output_point.material) for output_point in output_points}
+        if boundary is not None:
+            boundary = set(boundary)
         # find relevant nodes and trash points
         sources: list[Source]
         machine_groups: list[MachineGroup]
@@ -434,23 +1499,40 @@ class _Factory:
         buffer_transfers: list[tuple[Buffer | Source, Buffer, str]]
         (
             sources, machine_groups, buffer_lines, buffer_transfers
-        ) = self.search_nodes(output_point.location, output_point.material)
+        ) = self.search_nodes(output_points[0].location, output_points[0].material, boundary=boundary)
         sources_set = set(sources)
         machine_groups_set = set(machine_groups)
         buffer_lines_set = set(buffer_lines)
         buffer_transfers_set = set(buffer_transfers)
-
+        for output_point in output_points[1:]:
+            (
+                new_sources, new_machine_groups, new_buffer_lines, new_buffer_transfers, did_hit
+            ) = self.search_nodes(output_point.location, output_point.material,
+                                  (sources_set, machine_groups_set, buffer_lines_set), boundary)
+            sources.extend(new_sources)
+            sources_set.update(new_sources)
+            machine_groups.extend(new_machine_groups)
+            machine_groups_set.update(new_machine_groups)
+            buffer_lines.extend(new_buffer_lines)
+            buffer_lines_set.update(new_buffer_lines)
+            buffer_transfers.extend(new_buffer_transfers)
+            buffer_transfers_set.update(new_buffer_transfers)
+
+        candidate_trash_points = [node for node in (self.nodes if trash_points is None else trash_points)
+                                  if isinstance(node, TrashPoint)]
         trash_points: list[TrashPoint] = []
         did_something = True
         while did_something:
             did_something = False
-            for trash_point in self.nodes:
-                if not isinstance(trash_point, TrashPoint) or trash_point in trash_points:
+            for trash_point in candidate_trash_points:
+                if trash_point in trash_points:
+                    continue
+                if boundary is not None and trash_point.location not in boundary:
                     continue
                 (
                     new_sources, new_machine_groups, new_buffer_lines, new_buffer_transfers, did_hit
                 ) = self.search_nodes(trash_point.location, trash_point.material,
-                                      (sources_set, machine_groups_set, buffer_lines_set))
+                                      (sources_set, machine_groups_set, buffer_lines_set), boundary)
                 if not did_hit:
                     continue
                 did_something = True
@@ -465,9 +1547,13 @@ class _Factory:
                 buffer_transfers_set.update(new_buffer_transfers)
 
         # set up the linear programming problem
-        num_variables = 1+len(machine_groups)+len(buffer_transfers)+len(trash_points)
-        buffer_transfers_start = 1+len(machine_groups)
-        trash_points_start = 1+len(machine_groups)+len(buffer_transfers)
+        machine_groups_start = len(output_points)
+        buffer_transfers_start = machine_groups_start+len(machine_groups)
+        trash_points_start = buffer_transfers_start+len(buffer_transfers)
+        num_variables = trash_points_start+len(trash_points)
+        machine_group_indices = {machine_group: i for i, machine_group in enumerate(machine_groups)}
+        buffer_transfer_indices = {transfer: i for i, transfer in enumerate(buffer_transfers)}
+        trash_point_indices = {trash_point: i for i, trash_point in enumerate(trash_points)}
         equalities: list[tuple[np.ndarray, float]] = []
         inequalities: list[tuple[np.ndarray, float, Bottleneck]] = []
         # stop all machine groups for which one of the inputs or outputs is not relevant or disconnected
@@ -475,30 +1561,30 @@ class _Factory:
             found_disconnect = False
             for material in machine_group.machine_type.output_materials:
                 if material not in machine_group.output_materials:
-                    if output_point.location != machine_group or material != output_point.material:
+                    if (machine_group, material) not in output_keys:
                         found_disconnect = True
                         break
                     continue
                 node = tuple(machine_group.outputs(material))[0]
                 if (
-                    (isinstance(node, MachineGroup) and node not in machine_groups)
-                    or (isinstance(node, TrashPoint) and node not in trash_points)
-                    or (isinstance(node, Buffer) and (node, material) not in buffer_lines)
-                ) and (output_point.location != machine_group or material != output_point.material):
+                    (isinstance(node, MachineGroup) and node not in machine_group_indices)
+                    or (isinstance(node, TrashPoint) and node not in trash_point_indices)
+                    or (isinstance(node, Buffer) and (node, material) not in buffer_lines_set)
+                ) and (machine_group, material) not in output_keys:
                     found_disconnect = True
                     break
             if machine_group.has_unconnected_inputs:
                 found_disconnect = True
             if found_disconnect:
                 coefficients = np.zeros(num_variables, float)
-                coefficients[1+i] = 1
+                coefficients[machine_groups_start+i] = 1
                 equalities.append((coefficients, 0.))
         # add inequalities for rate cap on machine groups
         for i, machine_group in enumerate(machine_groups):
             if machine_group.machine_cap is None:
                 continue
             coefficients = np.zeros(num_variables, float)
-            coefficients[1+i] = 1
+            coefficients[machine_groups_start+i] = 1
             inequalities.append((
                 coefficients,
                 machine_group.machine_cap,
@@ -510,10 +1596,13 @@ class _Factory:
                 for node in machine_group.inputs(material):
                     if not isinstance(node, MachineGroup):
                         continue
+                    if boundary is not None and node not in boundary:
+                        raise FactoryAnalysisException("Machine groups outside the boundary cannot directly supply "
+                                                       "machine groups inside it.")
                     equation = np.zeros(num_variables, float)
-                    equation[1+i] = machine_group.machine_type.input_rates[material]
-                    input_index = machine_groups.index(node)
-                    equation[1+input_index] = -node.machine_type.output_rates[material]
+                    equation[machine_groups_start+i] = machine_group.machine_type.input_rates[material]
+                    input_index = machine_group_indices[node]
+                    equation[machine_groups_start+input_index] = -node.machine_type.output_rates[material]
                     equalities.append((equation, 0.))
         # add inequalities on source output
         source_rate_vectors = {}
@@ -521,14 +1610,14 @@ class _Factory:
             source_rate_vector = np.zeros(num_variables, float)
             for node in source.outputs(source.material):
                 if isinstance(node, MachineGroup):
-                    if not node in machine_groups:
+                    if node not in machine_group_indices:
                         continue
-                    index = machine_groups.index(node)
-                    source_rate_vector[1+index] = node.machine_type.input_rates[source.material]
+                    index = machine_group_indices[node]
+                    source_rate_vector[machine_groups_start+index] = node.machine_type.input_rates[source.material]
                 elif isinstance(node, Buffer):
-                    if not (source, node, source.material) in buffer_transfers:
+                    if (source, node, source.material) not in buffer_transfer_indices:
                         continue
-                    index = buffer_transfers.index((source, node, source.material))
+                    index = buffer_transfer_indices[(source, node, source.material)]
                     source_rate_vector[buffer_transfers_start+index] = 1.
             source_rate_vectors[source] = source_rate_vector
             if source.max_rate is not None:
@@ -544,30 +1633,34 @@ class _Factory:
             input_vector = np.zeros(num_variables, float)
             for node in buffer.inputs(material):
                 if isinstance(node, Buffer | Source):
-                    index = buffer_transfers_start+buffer_transfers.index((node, buffer, material))
+                    index = buffer_transfers_start+buffer_transfer_indices[(node, buffer, material)]
                     input_vector[index] = 1.
                 elif isinstance(node, MachineGroup):
-                    index = 1+machine_groups.index(node)
+                    if node not in machine_group_indices:
+                        raise FactoryAnalysisException("Machine groups outside the boundary cannot directly supply "
+                                                       "buffers inside it.")
+                    index = machine_groups_start+machine_group_indices[node]
                     input_vector[index] = node.machine_type.output_rates[material]
             output_vector = np.zeros(num_variables, float)
             for node in buffer.outputs(material):
                 if isinstance(node, Buffer):
-                    if (node, material) not in buffer_lines:
+                    if (node, material) not in buffer_lines_set:
                         continue
-                    index = buffer_transfers_start+buffer_transfers.index((buffer, node, material))
+                    index = buffer_transfers_start+buffer_transfer_indices[(buffer, node, material)]
                     output_vector[index] = 1.
                 elif isinstance(node, MachineGroup):
-                    if node not in machine_groups:
+                    if node not in machine_group_indices:
                         continue
-                    index = 1+machine_groups.index(node)
+                    index = machine_groups_start+machine_group_indices[node]
                     output_vector[index] = node.machine_type.input_rates[material]
                 elif isinstance(node, TrashPoint):
-                    if node not in trash_points:
+                    if node not in trash_point_indices:
                         continue
-                    index = trash_points_start+trash_points.index(node)
+                    index = trash_points_start+trash_point_indices[node]
                     output_vector[index] = 1.
-            if output_point.location is buffer and output_point.material == material:
-                output_vector[0] = 1
+            for k, output_point in enumerate(output_points):
+                if output_point.location is buffer and output_point.material == material:
+                    output_vector[k] = 1
             equalities.append((input_vector-output_vector, 0.))
             buffer_throughput_vectors[(buffer, material)] = input_vector
             # add input cap
@@ -578,24 +1671,29 @@ class _Factory:
                     BufferRateCap(buffer, material)
                 ))
         # add relation between output and machine group if the output or a trash point is directly from a machine
-        if isinstance(output_point.location, MachineGroup):
+        for k, output_point in enumerate(output_points):
+            if not isinstance(output_point.location, MachineGroup):
+                continue
             equation = np.zeros(num_variables, float)
-            equation[0] = -1
-            machine_index = machine_groups.index(output_point.location)
-            equation[1+machine_index] = output_point.location.machine_type.output_rates[output_point.material]
+            equation[k] = -1
+            machine_index = machine_group_indices[output_point.location]
+            equation[machine_groups_start+machine_index] = (
+                output_point.location.machine_type.output_rates[output_point.material])
             equalities.append((equation, 0))
         for i, trash_point in enumerate(trash_points):
             if not isinstance(trash_point.location, MachineGroup):
                 continue
             equation = np.zeros(num_variables, float)
             equation[trash_points_start+i] = -1
-            machine_index = machine_groups.index(trash_point.location)
-            equation[1+machine_index] = trash_point.location.machine_type.output_rates[trash_point.material]
+            machine_index = machine_group_indices[trash_point.location]
+            equation[machine_groups_start+machine_index] = trash_point.location.machine_type.output_rates[trash_point.material]
             equalities.append((equation, 0))
         # add maximum output and trash rate cap
-        if output_point.max_rate is not None:
+        for k, output_point in enumerate(output_points):
+            if output_point.max_rate is None:
+                continue
             equation = np.zeros(num_variables, float)
-            equation[0] = 1.
+            equation[k] = 1.
             inequalities.append((equation, output_point.max_rate, OutputPointRateCap(output_point)))
         for i, trash_point in enumerate(trash_points):
             if trash_point.max_rate is None:
@@ -604,117 +1702,204 @@ class _Factory:
             equation[trash_points_start+i] = 1.
             inequalities.append((equation, trash_point.max_rate, TrashPointRateCap(trash_point)))
 
-        # solve and store result
-        to_minimize_vector = np.zeros(num_variables, float)
-        to_minimize_vector[0] = -1
-        if inequalities:
-            inequalities_matrix = np.stack([coefficients for coefficients, bounds, description in inequalities])
-            inequalities_bounds = np.array([bounds for coefficients, bounds, description in inequalities], dtype=float)
-        else:
-            inequalities_matrix = np.zeros((0, num_variables), float)
-            inequalities_bounds = np.zeros(0, float)
-        if equalities:
-            equalities_matrix = np.stack([coefficients for coefficients, value in equalities])
-            equalities_values = np.array([value for coefficients, value in equalities], dtype=float)
-        else:
-            equalities_matrix = np.zeros((0, num_variables), float)
-            equalities_values = np.zeros(0, float)
-        # noinspection PyDeprecation
-        result = scipy.optimize.linprog(
-            to_minimize_vector, inequalities_matrix, inequalities_bounds, equalities_matrix, equalities_values
+        # determine the rates at which nodes outside the boundary supply materials
+        boundary_rate_vectors: dict[tuple[FactoryNode, str], np.ndarray] = {}
+        if boundary is not None:
+            for i, (frm, to, material) in enumerate(buffer_transfers):
+                if frm not in boundary:
+                    vector = boundary_rate_vectors.setdefault((frm, material), np.zeros(num_variables, float))
+                    vector[buffer_transfers_start+i] = 1.
+            for i, machine_group in enumerate(machine_groups):
+                for material in machine_group.input_materials:
+                    for node in machine_group.inputs(material):
+                        if node in boundary:
+                            continue
+                        vector = boundary_rate_vectors.setdefault((node, material), np.zeros(num_variables, float))
+                        vector[machine_groups_start+i] = machine_group.machine_type.input_rates[material]
+
+        objective = np.zeros(num_variables, float)
+        objective[0] = 1.
+        return LinearProblem(
+            output_points=output_points,
+            sources=tuple(sources),
+            machine_groups=tuple(machine_groups),
+            buffer_lines=tuple(buffer_lines),
+            buffer_transfers=tuple(buffer_transfers),
+            trash_points=tuple(trash_points),
+            equalities_matrix=(np.stack([coefficients for coefficients, value in equalities]) if equalities
+                               else np.zeros((0, num_variables), float)),
+            equalities_values=np.array([value for coefficients, value in equalities], dtype=float),
+            inequalities_matrix=(np.stack([coefficients for coefficients, bounds, description in inequalities])
+                                 if inequalities else np.zeros((0, num_variables), float)),
+            inequalities_bounds=np.array([bounds for coefficients, bounds, description in inequalities], dtype=float),
+            caps=tuple(description for coefficients, bounds, description in inequalities),
+            source_rate_vectors=source_rate_vectors,
+            buffer_throughput_vectors=buffer_throughput_vectors,
+            objective=objective,
+            boundary_rate_vectors=boundary_rate_vectors
         )
-        # check for infinite or invalid results
-        if result.status == 3:
-            return SingleAnalysisResults(
-                float("inf"),
-                FactoryRates(
-                    {source: float("inf") for source in sources},
-                    {x: float("inf") for x in buffer_lines},
-                    {machine_group: float("inf") for machine_group in machine_groups},
-                    {},
-                ),
-                ()
-            )
-        elif result.status != 0:
-            raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
-        optimal_rate = result.x[0]
-        bottlenecks_indices = [i for i, x in enumerate(result.slack) if x < 1e-9]
-
-        # if there are relevant trash points, minimize for the weighted sum of their rates
-        if any(result.x[trash_points_start+i] > 1e-9 for i in range(len(trash_points))):
-            rate_vector = np.zeros(num_variables, dtype=float)
-            rate_vector[0] = 1.
-            new_equalities_matrix = np.concatenate((equalities_matrix, np.array([rate_vector])))
-            new_equalities_values = np.concatenate((equalities_values, np.array([optimal_rate])))
-            new_to_minimize_vector = np.zeros(num_variables, dtype=float)
-            for i, trash_point in enumerate(trash_points):
-                new_to_minimize_vector[trash_points_start+i] = trash_point.weight
-            # noinspection PyDeprecation
-            result = scipy.optimize.linprog(
-                new_to_minimize_vector, inequalities_matrix, inequalities_bounds,
-                new_equalities_matrix, new_equalities_values
-            )
-            if result.status != 0:
-                raise FactoryAnalysisException("Failed to solve the linear programming problem to minimize trash rates"
-                                               " somehow.")
 
+    def analyse(self, output_point: OutputPoint, max_depth: int | None = None) -> SingleAnalysisResults:
+        return self.compile(output_point).analyse(max_depth)
 
-        # store some information from the results (which are possibly changed to minimize trashing)
-        source_rates = {source: v.dot(result.x) for source, v in source_rate_vectors.items()}
-        buffer_throughput = {key: v.dot(result.x) for key, v in buffer_throughput_vectors.items()}
-        machine_rates = {machine_group: result.x[1+i] for i, machine_group in enumerate(machine_groups)}
-        trash_rates = {trash_point: result.x[trash_points_start+i]
-                       for i, trash_point in enumerate(trash_points) if result.x[trash_points_start+i] > 1e-9}
-
-        # calculate bottleneck results
-        current_rate = optimal_rate
-        ordered_bottlenecks: list[tuple[float, Bottleneck]] = []
-        while bottlenecks_indices:
-            bottleneck_index = bottlenecks_indices[0]
-            ordered_bottlenecks.append((current_rate, inequalities[bottleneck_index][2]))
-
-            # solve the system again but with one less inequalties
-            inequalities.pop(bottleneck_index)
-            if inequalities:
-                inequalities_matrix = np.stack([coefficients for coefficients, bounds, description in inequalities])
-                inequalities_bounds = np.array([bounds for coefficients, bounds, description in inequalities], dtype=float)
-            else:
-                inequalities_matrix = np.zeros((0, num_variables), float)
-                inequalities_bounds = np.zeros(0, float)
-            # noinspection PyDeprecation
-            result = scipy.optimize.linprog(
-                to_minimize_vector, inequalities_matrix, inequalities_bounds, equalities_matrix, equalities_values
-            )
-            if result.status not in (0, 3):
-                raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
-            elif result.status == 3:  # if the problem is unbounded, there are no bottlenecks left
-                break
-            current_rate = result.x[0]
-            # if there are relevant trash points, minimize for the weighted sum of their rates
-            if any(result.x[trash_points_start + i] > 1e-9 for i in range(len(trash_points))):
-                rate_vector = np.zeros(num_variables, dtype=float)
-                rate_vector[0] = 1.
-                new_equalities_matrix = np.concatenate((equalities_matrix, np.array([rate_vector])))
-                new_equalities_values = np.concatenate((equalities_values, np.array([current_rate])))
-                new_to_minimize_vector = np.zeros(num_variables, dtype=float)
-                for i, trash_point in enumerate(trash_points):
-                    new_to_minimize_vector[trash_points_start + i] = trash_point.weight
-                # noinspection PyDeprecation
-                result = scipy.optimize.linprog(
-                    new_to_minimize_vector, inequalities_matrix, inequalities_bounds,
-                    new_equalities_matrix, new_equalities_values
-                )
-                if result.status != 0:
-                    raise FactoryAnalysisException(
-                        "Failed to solve the linear programming problem to minimize trash rates"
-                        " somehow.")
-            # obtain the new bottlenecks from the results
-            bottlenecks_indices = [i for i, x in enumerate(result.slack) if x < 1e-9]
-        return SingleAnalysisResults(
-            optimal_rate,
-            FactoryRates(source_rates, buffer_throughput, machine_rates, trash_rates),
-            tuple(ordered_bottlenecks)
-        )
+    def connected_components(self) -> list[list[FactoryNode]]:
+        """
+        Splits the nodes into groups which are not connected to each other, in order of first appearance.
+        """
+        self.build()
+        nodes = list(self.nodes)
+        parents = {node: node for node in nodes}
+
+        def find(node: FactoryNode) -> FactoryNode:
+            while parents[node] is not node:
+                parents[node] = parents[parents[node]]
+                node = parents[node]
+            return node
+
+        # nodes outside the node list (such as stand ins) are added to the list when they are found
+        for node in nodes:
+            for material in node.input_materials:
+                for other in node.inputs(material):
+                    if other not in parents:
+                        parents[other] = other
+                        nodes.append(other)
+                    root, other_root = find(node), find(other)
+                    if root is not other_root:
+                        parents[other_root] = root
+        components: dict[FactoryNode, list[FactoryNode]] = {}
+        for node in nodes:
+            components.setdefault(find(node), []).append(node)
+        return list(components.values())
+
+    def compile_many(self, output_points: Sequence[OutputPoint]) -> list[LinearProblem]:
+        """
+        Compiles the problem of every output point as analyse_many does. The problems are the same as those of
+        compile, as the node search only follows connections and so never leaves the connected component of the output
+        point anyway; the components are only used to narrow down the trash points each problem checks for a
+        connection, instead of trying every trash point of the factory.
+        """
+        component_trash_points: dict[FactoryNode, list[TrashPoint]] = {}
+        for component in self.connected_components():
+            trash_points = [node for node in component if isinstance(node, TrashPoint)]
+            for node in component:
+                component_trash_points[node] = trash_points
+        return [self.compile(output_point, trash_points=component_trash_points.get(output_point.location, ()))
+                for output_point in output_points]
+
+    def analyse_many(self, output_points: Sequence[OutputPoint], print_progress: bool = False,
+                     max_depth: int | None = None, jobs: int | None = 1,
+                     cache_dir: str | None = None) -> list[SingleAnalysisResults]:
+        """
+        Analyses several output points. The problems are compiled with compile_many, and problems with the same
+        canonical key are solved only once. Bottlenecks are computed
+        when they are first accessed, up to max_depth bottlenecks per output point.
+
+        :param output_points: the output points to analyse
+        :param print_progress: whether to print which output point is being analysed
+        :param max_depth: the maximal number of bottlenecks to compute per output point, by default the full chain
+        :param jobs: the number of worker processes solving the problems, None for the number of cpus. With one job
+        everything is solved in this process
+        :param cache_dir: if given, solutions are stored in this directory by canonical key and reused by later runs
+        """
+        problems = [(problem, problem.canonical_key()) for problem in self.compile_many(output_points)]
+        unique: dict[bytes, LinearProblem] = {}
+        for problem, key in problems:
+            unique.setdefault(key, problem)
+        solutions = _solve_unique(unique, jobs, cache_dir)
+
+        known: dict[bytes, tuple[LinearProblem, LinearSolution | None, SingleAnalysisResults]] = {}
+        results = []
+        for i, (problem, key) in enumerate(problems):
+            if print_progress:
+                print(f"analysing output point {i+1}/{len(output_points)}", end="\r")
+            if key in known:
+                results.append(problem.translate_results(*known[key]))
+                continue
+            if key not in solutions:
+                solutions[key] = problem.solve()
+                if cache_dir is not None:
+                    _save_solution(cache_dir, key, solutions[key])
+            single_results = problem.results_from(solutions[key], max_depth)
+            known[key] = (problem, solutions[key], single_results)
+            results.append(single_results)
+        if print_progress:
+            print("done!")
+        return results
+
+
+def _solve_unique(unique: dict[bytes, LinearProblem], jobs: int | None, cache_dir: str | None
+                  ) -> dict[bytes, LinearSolution | None]:
+    """
+    Loads the cached solutions of problems by canonical key and, with more than one job, solves the others in worker
+    processes. With one job the problems which are not cached are left to the caller, which solves them when needed.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    solutions: dict[bytes, LinearSolution | None] = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for key in unique:
+            cached = _load_solution(cache_dir, key)
+            if cached is not False:
+                solutions[key] = cached
+    to_solve = [key for key in unique if key not in solutions]
+    if jobs > 1 and len(to_solve) > 1:
+        # imported here, as the shared problems module builds on this one
+        from facalc.shared_problems import solve_in_workers
+        solutions.update(zip(to_solve, solve_in_workers([unique[key].numeric for key in to_solve], jobs)))
+    if cache_dir is not None:
+        for key in to_solve:
+            if key in solutions:
+                _save_solution(cache_dir, key, solutions[key])
+    return solutions
+
+
+def solve_problems(problems: Sequence[LinearProblem], jobs: int | None = 1, cache_dir: str | None = None
+                   ) -> list[LinearSolution | None]:
+    """
+    Solves several problems as analyse_many does: problems with the same canonical key are solved only once.
+
+    :param jobs: the number of worker processes solving the problems, None for the number of cpus
+    :param cache_dir: if given, solutions are stored in this directory by canonical key and reused by later runs
+    """
+    keys = [problem.canonical_key() for problem in problems]
+    unique: dict[bytes, LinearProblem] = {}
+    for problem, key in zip(problems, keys):
+        unique.setdefault(key, problem)
+    solutions = _solve_unique(unique, jobs, cache_dir)
+    for key, problem in unique.items():
+        if key not in solutions:
+            solutions[key] = problem.solve()
+            if cache_dir is not None:
+                _save_solution(cache_dir, key, solutions[key])
+    return [solutions[key] for key in keys]
+
+
+def _load_solution(cache_dir: str, key: bytes) -> LinearSolution | None | bool:
+    """ loads a cached solution, which is None for unbounded problems, or returns False if there is none """
+    path = os.path.join(cache_dir, key.hex()+".npz")
+    if not os.path.exists(path):
+        return False
+    try:
+        with np.load(path) as data:
+            if bool(data["unbounded"]):
+                return None
+            return LinearSolution(float(data["rate"]), data["x"], data["slack"], data["max_slack"], data["marginals"])
+    except (OSError, ValueError, KeyError):
+        # a damaged cache file is solved again and overwritten
+        return False
+
+
+def _save_solution(cache_dir: str, key: bytes, solution: LinearSolution | None):
+    path = os.path.join(cache_dir, key.hex()+".npz")
+    # write to a temporary file first, such that concurrent runs never read half written files
+    temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+    if solution is None:
+        np.savez(temporary_path, unbounded=True)
+    else:
+        np.savez(temporary_path, unbounded=False, rate=solution.rate, x=solution.x, slack=solution.slack,
+                 max_slack=solution.max_slack, marginals=solution.marginals)
+    os.replace(temporary_path, path)
 
 
 class SubFactory:
@@ -757,15 +1942,42 @@ class SubFactory:
     def connect(self, frm: FactoryNode, to: FactoryNode, *materials: str):
         self.parent.connect(frm, to, *materials)
 
-    def analyse(self, print_progress: bool = False) -> FullAnalysisResults:
-        sub_results = []
-        for i, output_point in enumerate(self._output_points):
-            if print_progress:
-                print(f"analysing output point {i+1}/{len(self._output_points)}", end="\r")
-            sub_results.append((output_point, self.factory.analyse(output_point)))
-        if print_progress:
-            print("done!")
-        return FullAnalysisResults.from_single_analyses(sub_results)
+    def bulk(self) -> ContextManager[FactoryBuilder]:
+        """ see _Factory.bulk """
+        return self.factory.bulk()
+
+    def analyse(self, print_progress: bool = False, max_depth: int | None = None, jobs: int | None = 1,
+                cache_dir: str | None = None) -> FullAnalysisResults:
+        """
+        Analyses every output point of this sub factory on its own, see _Factory.analyse_many.
+        """
+        sub_results = self.factory.analyse_many(self._output_points, print_progress, max_depth, jobs, cache_dir)
+        return FullAnalysisResults.from_single_analyses(zip(self._output_points, sub_results))
+
+    def analyse_joint(self, ratios: dict[OutputPoint, float] | None = None,
+                      weights: dict[OutputPoint, float] | None = None) -> JointAnalysisResults:
+        """
+        Analyses the factory with all output points taking output at the same time using a single linear programming
+        problem, as opposed to analyse which maximizes every output point on its own.
+
+        :param ratios: if given, the rates of these output points are kept in the given ratios and the multiple of
+        the ratios is maximized
+        :param weights: if given, the weighted sum of the rates of these output points is maximized. If neither ratios
+        nor weights are given, the sum of the rates of all output points of this (sub)factory is maximized
+        """
+        if ratios is not None and weights is not None:
+            raise ValueError("Cannot specify both ratios and weights.")
+        if ratios is not None:
+            output_points = tuple(ratios.keys())
+            return self.factory.compile_joint(output_points).with_ratios(
+                [ratios[output_point] for output_point in output_points]
+            ).analyse_joint()
+        if weights is None:
+            weights = {output_point: 1. for output_point in self._output_points}
+        output_points = tuple(weights.keys())
+        return self.factory.compile_joint(output_points).with_weights(
+            [weights[output_point] for output_point in output_points]
+        ).analyse_joint()
 
     def default_print_info(self, results: FullAnalysisResults):
         print(results.display())
@@ -1,8 +1,11 @@
 import json
 from facalc.factories import *
 import enum
+from dataclasses import fields, is_dataclass
+from functools import cached_property
 from math import ceil
 import os.path
+import weakref
 
 
 class Module(enum.Enum):
@@ -55,6 +58,12 @@ CRAFTER_LEVEL_TO_SPEED = {
     3: 1.0
 }
 
+CRAFTER_LEVEL_TO_MODULE_SLOTS = {
+    1: 0,
+    2: 2,
+    3: 4
+}
+
 @dataclass(frozen=True)
 class CrafterRecipe:
     time: float
@@ -74,12 +83,12 @@ class Crafter(MachineType):
     def crafting_speed(self) -> float:
         return CRAFTER_LEVEL_TO_SPEED[self.crafter_level]
 
-    @property
+    @cached_property
     def input_rates(self) -> dict[str, float]:
         return {name: amount / self.recipe.time * self.crafting_speed * (1.+modules_to_speed_bonus(self.modules))
                 for name, amount in self.recipe.inp.items()}
 
-    @property
+    @cached_property
     def output_rates(self) -> dict[str, float]:
         return {
             self.recipe.outp: self.recipe.outp_count * self.crafting_speed / self.recipe.time * (1.+modules_to_speed_bonus(self.modules))
@@ -95,6 +104,10 @@ class Crafter(MachineType):
     def get_cap_description(self) -> str:
         return f"{self.recipe.outp} crafter cap"
 
+    @property
+    def module_slots(self) -> int:
+        return CRAFTER_LEVEL_TO_MODULE_SLOTS[self.crafter_level]
+
 
 @dataclass(frozen=True)
 class FurnaceRecipe:
@@ -110,12 +123,12 @@ class ElectronicFurnace(MachineType):
     recipe: FurnaceRecipe
     modules: tuple[Module, ...] = tuple()
 
-    @property
+    @cached_property
     def input_rates(self) -> dict[str, float]:
         return {name: 2 * amount / self.recipe.time * (1.+modules_to_speed_bonus(self.modules))
                 for name, amount in self.recipe.inp.items()}
 
-    @property
+    @cached_property
     def output_rates(self) -> dict[str, float]:
         return {
             self.recipe.outp: 2 * self.recipe.outp_count / self.recipe.time * (1.+modules_to_speed_bonus(self.modules))
@@ -131,6 +144,10 @@ class ElectronicFurnace(MachineType):
     def get_cap_description(self) -> str:
         return f"{self.recipe.outp} furnace cap"
 
+    @property
+    def module_slots(self) -> int:
+        return 2
+
 
 def get_ore_rate(num_electric_drills: int | None, resource_bonus: float = 0., modules: tuple[Module, ...] = ()):
     if num_electric_drills is None:
@@ -164,21 +181,34 @@ class Lab(MachineType):
         self.speed_bonus = speed_bonus
         self.modules = modules
 
+    @property
+    def research_speed(self) -> float:
+        return 1.+self.speed_bonus+modules_to_speed_bonus(self.modules)
+
     @property
     def input_rates(self) -> dict[str, float]:
         return {
-            SCIENCE_PACKS[c]: (1.+self.speed_bonus+modules_to_speed_bonus(self.modules)) for c in self.science_types
+            SCIENCE_PACKS[c]: self.research_speed for c in self.science_types
         }
 
     @property
     def output_rates(self) -> dict[str, float]:
         return {
-            f"{self.science_types} science": (1.+self.speed_bonus+modules_to_speed_bonus(self.modules))
-                                             * (1.+modules_to_production_bonus(self.modules))
+            f"{self.science_types} science": self.research_speed * (1.+modules_to_production_bonus(self.modules))
         }
 
     def display_info(self, rate: float) -> str:
-        return f"{ceil(rate*self.time/(1.+self.speed_bonus))} {self.science_types} labs"
+        return f"{ceil(rate*self.machines_per_rate)} {self.science_types} labs"
+
+    @property
+    def machines_per_rate(self) -> float:
+        # one lab uses research_speed/time of every science pack per second and one unit of rate uses research_speed,
+        # so the research speed, modules included, cancels out
+        return self.time
+
+    @property
+    def module_slots(self) -> int:
+        return 2
 
 
 @dataclass(frozen=True)
@@ -196,12 +226,12 @@ class ChemicalPlant(MachineType):
     recipe: ChemicalPlantRecipe
     modules: tuple[Module, ...] = tuple()
 
-    @property
+    @cached_property
     def input_rates(self) -> dict[str, float]:
         return {name: amount / self.recipe.time * (1.+modules_to_speed_bonus(self.modules))
                 for name, amount in self.recipe.inp.items()}
 
-    @property
+    @cached_property
     def output_rates(self) -> dict[str, float]:
         return {
             self.recipe.outp: self.recipe.outp_count / self.recipe.time * (1.+modules_to_speed_bonus(self.modules))
@@ -217,6 +247,10 @@ class ChemicalPlant(MachineType):
     def get_cap_description(self) -> str:
         return f"{self.recipe.outp} chemical plant cap"
 
+    @property
+    def module_slots(self) -> int:
+        return 3
+
 
 @dataclass(frozen=True)
 class CompleteRecipe:
@@ -255,11 +289,11 @@ class OilRefinery(MachineType):
     recipe: CompleteRecipe
     modules: tuple[Module, ...] = tuple()
 
-    @property
+    @cached_property
     def input_rates(self) -> dict[str, float]:
         return self.recipe.get_input_rates(self.modules)
 
-    @property
+    @cached_property
     def output_rates(self) -> dict[str, float]:
         return self.recipe.get_output_rates(self.modules)
 
@@ -272,17 +306,21 @@ class OilRefinery(MachineType):
     def get_cap_description(self) -> str:
         return f"{self.recipe.name} refinery cap"
 
+    @property
+    def module_slots(self) -> int:
+        return 3
+
 
 @dataclass(frozen=True)
 class Centrifuge(MachineType):
     recipe: CompleteRecipe
     modules: tuple[Module, ...] = tuple()
 
-    @property
+    @cached_property
     def input_rates(self) -> dict[str, float]:
         return self.recipe.get_input_rates(self.modules)
 
-    @property
+    @cached_property
     def output_rates(self) -> dict[str, float]:
         return self.recipe.get_output_rates(self.modules)
 
@@ -295,6 +333,10 @@ class Centrifuge(MachineType):
     def get_cap_description(self) -> str:
         return f"{self.recipe.name} centrifuge cap"
 
+    @property
+    def module_slots(self) -> int:
+        return 2
+
 
 @dataclass
 class UraniumDrill(MachineType):
@@ -320,6 +362,10 @@ class UraniumDrill(MachineType):
     def get_cap_description(self) -> str:
         return f"number of uranium drills cap"
 
+    @property
+    def module_slots(self) -> int:
+        return 3
+
 
 class NuclearReactor(MachineType):
     @property
@@ -340,6 +386,55 @@ class NuclearReactor(MachineType):
 with open(os.path.join(os.path.dirname(__file__), "factorio_data.json")) as file:
     FACTORIO_DATA = json.load(file)
 
+def module_slots(machine_type: MachineType) -> int:
+    """
+    Returns the number of module slots of a machine type, which is zero for machine types without modules.
+    """
+    return getattr(machine_type, "module_slots", 0)
+
+
+def supports_module(machine_type: MachineType, module: Module) -> bool:
+    if module_slots(machine_type) == 0:
+        return False
+    recipe = getattr(machine_type, "recipe", None)
+    return MODULE_PRODUCTION_BONUS[module] == 0. or recipe is None or recipe.supports_prod_modules
+
+
+# machine types are only kept while machine groups use them, which also keeps the recipes whose ids are in the keys
+_INTERNED_MACHINE_TYPES: weakref.WeakValueDictionary[tuple, MachineType] = weakref.WeakValueDictionary()
+
+
+def interned(machine_type: MachineType) -> MachineType:
+    """
+    Returns one shared instance per distinct frozen machine type, such that machine groups of, say, the same recipe,
+    level and modules share one object and its cached rates. Other machine types are returned as they are. Recipes are
+    compared by identity, as they hold dictionaries.
+    """
+    if not is_dataclass(machine_type) or not type(machine_type).__dataclass_params__.frozen:
+        return machine_type
+    key: list = [type(machine_type)]
+    for machine_field in fields(machine_type):
+        value = getattr(machine_type, machine_field.name)
+        try:
+            hash(value)
+        except TypeError:
+            value = ("id", id(value))
+        key.append(value)
+    return _INTERNED_MACHINE_TYPES.setdefault(tuple(key), machine_type)
+
+
+def with_modules(machine_type: MachineType, modules: tuple[Module, ...]) -> MachineType:
+    """
+    Returns a copy of a machine type with the given modules instead of its current ones.
+    """
+    if len(modules) > module_slots(machine_type):
+        raise ValueError(f"A machine type with {module_slots(machine_type)} module slots cannot hold {len(modules)} "
+                         f"modules.")
+    if isinstance(machine_type, Lab):
+        return Lab(machine_type.science_types, machine_type.time, machine_type.speed_bonus, modules)
+    return interned(replace(machine_type, modules=modules))
+
+
 CRAFTER_RECIPES: dict[str, CrafterRecipe] = {}
 for data in FACTORIO_DATA["crafter_recipes"]:
     CRAFTER_RECIPES[data["output"]] = CrafterRecipe(
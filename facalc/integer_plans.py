@@ -0,0 +1,205 @@
+from __future__ import annotations
+import numpy as np
+import scipy
+from dataclasses import dataclass, replace
+from math import floor
+from facalc.factories import (_Factory, SubFactory, OutputPoint, MachineGroup, MachineRateCap, FactoryRates,
+                              LinearProblem, LinearSolution, FactoryAnalysisException)
+
+
+@dataclass(frozen=True)
+class IntegerPlan:
+    """
+    A whole number of machines for every machine group, together with the maximal output rate and the rates of the
+    factory given those machines. Machine groups may run below their full rate, so every plan is feasible.
+    """
+    result_rate: float
+    machine_counts: dict[MachineGroup, int]
+    rates: FactoryRates
+    optimal: bool
+
+    @property
+    def total_machines(self) -> int:
+        return sum(self.machine_counts.values())
+
+    def display(self) -> str:
+        lines = [f"final rate: {self.result_rate:.2f}/s with {self.total_machines} machines"
+                 + ("" if self.optimal else " (not proven minimal)"), " -- machines -- "]
+        for machine_group, count in self.machine_counts.items():
+            machine_type = machine_group.machine_type
+            # ceil in display_info should give back the count, so stay just below it
+            lines.append(machine_type.display_info(max(0., count-1e-6)/machine_type.machines_per_rate))
+        return "\n".join(lines)
+
+
+class _CountedProblem:
+    """
+    A linear problem extended with one inequality k*x <= n per machine group, where x is the rate of the machine group,
+    k the machines per unit of rate and n the number of machines. Machine caps are rounded down to whole machines.
+    """
+    def __init__(self, problem: LinearProblem):
+        self.problem = problem
+        machine_groups = problem.machine_groups
+        self.factors = np.array([group.machine_type.machines_per_rate for group in machine_groups], float)
+        self.max_counts = np.full(len(machine_groups), np.inf)
+        bounds = problem.inequalities_bounds.copy()
+        group_indices = {group: i for i, group in enumerate(machine_groups)}
+        for j, cap in enumerate(problem.caps):
+            if isinstance(cap, MachineRateCap) and cap.machine_group in group_indices:
+                i = group_indices[cap.machine_group]
+                self.max_counts[i] = min(self.max_counts[i], floor(bounds[j]*self.factors[i]+1e-9))
+                bounds[j] = self.max_counts[i]/self.factors[i]
+        count_rows = np.zeros((len(machine_groups), problem.num_variables), float)
+        for i in range(len(machine_groups)):
+            count_rows[i, problem.machine_groups_start+i] = self.factors[i]
+        self.num_caps = len(bounds)
+        self.numeric = replace(
+            problem.numeric,
+            inequalities_matrix=np.concatenate((problem.inequalities_matrix, count_rows)),
+            inequalities_bounds=np.concatenate((bounds, np.full(len(machine_groups), np.inf)))
+        )
+
+    def solve(self, counts: np.ndarray | None = None) -> LinearSolution | None:
+        """
+        Solves the problem for the given machine counts, or without limits on the machine counts if None.
+        """
+        if counts is None:
+            return self.numeric.solve(np.arange(self.num_caps))
+        bounds = self.numeric.inequalities_bounds.copy()
+        bounds[self.num_caps:] = counts
+        return self.numeric.solve(None, bounds)
+
+
+def _round_and_repair(counted: _CountedProblem, solution: LinearSolution, target_rate: float) -> np.ndarray:
+    """
+    Rounds the machine rates of a solution to the nearest whole number of machines and then adds machines one at a time
+    to the group whose count limits the output rate the most, until the target rate is reached again. Counts are never
+    raised above the rates rounded up, which always reach the target, so this ends after at most one machine per group.
+    Finally machines are removed one at a time for as long as the target rate is still reached.
+    """
+    start = counted.problem.machine_groups_start
+    x = solution.x[start:start+len(counted.factors)]*counted.factors
+    # rounding every rate up always reaches the target
+    ceiled = np.minimum(np.ceil(x-1e-9), counted.max_counts)
+    counts = np.minimum(np.floor(x+.5), ceiled)
+
+    def reaches_target(counts: np.ndarray) -> tuple[bool, LinearSolution | None]:
+        current = counted.solve(counts)
+        return current is None or current.rate >= target_rate-1e-9*max(1., target_rate), current
+
+    while True:
+        reached, current = reaches_target(counts)
+        if reached:
+            break
+        # the marginals are the changes of minus the rate per extra machine
+        marginals = current.marginals[counted.num_caps:]
+        candidates = np.flatnonzero((counts < ceiled) & (marginals < -1e-12))
+        if len(candidates) > 0:
+            counts[candidates[np.argmin(marginals[candidates])]] += 1
+            continue
+        candidates = np.flatnonzero((counts < ceiled) & (current.max_slack[counted.num_caps:] < 1e-9))
+        if len(candidates) == 0:
+            candidates = np.flatnonzero(counts < ceiled)
+            if len(candidates) == 0:
+                break
+        counts[candidates] += 1
+
+    lowered = True
+    while lowered:
+        lowered = False
+        for i in np.flatnonzero(counts > 0):
+            counts[i] -= 1
+            if reaches_target(counts)[0]:
+                lowered = True
+            else:
+                counts[i] += 1
+    return counts
+
+
+def _minimal_counts(counted: _CountedProblem, target_rate: float, weights: np.ndarray, incumbent: np.ndarray,
+                    time_limit: float) -> tuple[np.ndarray, bool]:
+    """
+    Minimizes the weighted number of machines which reaches the target rate with a mixed integer linear program,
+    starting from an incumbent solution.
+    """
+    problem = counted.problem
+    num_variables = problem.num_variables
+    num_groups = len(counted.factors)
+    numeric = counted.numeric
+    # the variables are the variables of the problem followed by the machine counts
+    count_rows = numeric.inequalities_matrix[counted.num_caps:]
+    no_counts = np.zeros((len(problem.equalities_matrix), num_groups))
+    constraints = [
+        scipy.optimize.LinearConstraint(np.hstack((problem.equalities_matrix, no_counts)),
+                                        problem.equalities_values, problem.equalities_values),
+        scipy.optimize.LinearConstraint(np.hstack((numeric.inequalities_matrix[:counted.num_caps],
+                                                   np.zeros((counted.num_caps, num_groups)))),
+                                        -np.inf, numeric.inequalities_bounds[:counted.num_caps]),
+        scipy.optimize.LinearConstraint(np.hstack((count_rows, -np.eye(num_groups))), -np.inf, 0.),
+        scipy.optimize.LinearConstraint(np.concatenate((problem.objective, np.zeros(num_groups)))[np.newaxis],
+                                        target_rate-1e-9*max(1., target_rate), np.inf),
+        # scipy's milp cannot be given a starting solution, so bound the search by the incumbent instead
+        scipy.optimize.LinearConstraint(np.concatenate((np.zeros(num_variables), weights))[np.newaxis],
+                                        -np.inf, weights.dot(incumbent)+1e-9),
+    ]
+    result = scipy.optimize.milp(
+        np.concatenate((np.zeros(num_variables), weights)),
+        integrality=np.concatenate((np.zeros(num_variables), np.ones(num_groups))),
+        bounds=scipy.optimize.Bounds(np.zeros(num_variables+num_groups),
+                                     np.concatenate((np.full(num_variables, np.inf), counted.max_counts))),
+        constraints=constraints,
+        options={"time_limit": time_limit}
+    )
+    if result.x is None:
+        return incumbent, False
+    counts = np.round(result.x[num_variables:])
+    if weights.dot(counts) >= weights.dot(incumbent):
+        return incumbent, result.status == 0
+    return counts, result.status == 0
+
+
+def integer_plan_of(problem: LinearProblem, weights: dict[MachineGroup, float] | None = None,
+                    time_limit: float | None = 10.) -> IntegerPlan:
+    """
+    Computes a whole number of machines per machine group reaching the maximal output rate of a problem, see
+    integer_plan.
+    """
+    counted = _CountedProblem(problem)
+    solution = counted.solve()
+    if solution is None:
+        raise FactoryAnalysisException("Cannot make an integer plan for an infinite output rate.")
+    target_rate = solution.rate
+    counts = _round_and_repair(counted, solution, target_rate)
+    optimal = False
+    if time_limit is None or time_limit > 0.:
+        weight_vector = np.ones(len(problem.machine_groups), float)
+        if weights is not None:
+            weight_vector = np.array([weights.get(group, 1.) for group in problem.machine_groups], float)
+        counts, optimal = _minimal_counts(counted, target_rate, weight_vector, counts,
+                                          float("inf") if time_limit is None else time_limit)
+    final_solution = counted.solve(counts)
+    return IntegerPlan(
+        final_solution.rate,
+        {group: int(count) for group, count in zip(problem.machine_groups, counts)},
+        problem.get_rates(final_solution.x),
+        optimal
+    )
+
+
+def integer_plan(factory: _Factory | SubFactory, output_point: OutputPoint,
+                 weights: dict[MachineGroup, float] | None = None, time_limit: float | None = 10.) -> IntegerPlan:
+    """
+    Computes a whole number of machines per machine group with which the maximal rate of an output point is reached,
+    using as few machines as possible. Machine caps are rounded down to whole machines first. A plan is first made by
+    rounding the machine rates to the nearest whole number, repairing the rounding where it lowers the rate and removing
+    machines which are not needed, and then improved with a mixed integer linear program.
+
+    :param factory: the factory containing the output point
+    :param output_point: the output point to maximize
+    :param weights: weight per machine of each machine group when minimizing the number of machines, by default one
+    :param time_limit: the time limit of the mixed integer linear program in seconds. If it is zero only the rounded
+    plan is computed, if it is None there is no time limit
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    return integer_plan_of(factory.compile(output_point), weights, time_limit)
@@ -0,0 +1,348 @@
+from __future__ import annotations
+import json
+import os
+import re
+import numpy as np
+import scipy.sparse
+from dataclasses import dataclass
+from typing import Any, Iterable
+from facalc.factories import (_Factory, SubFactory, FactoryNode, OutputPoint, LinearProblem, LinearSolution,
+                              SingleAnalysisResults, FactoryAnalysisException, _describe_node)
+
+
+MPS_FORMAT = "mps"
+LP_FORMAT = "lp"
+
+MAX_RATE_VARIANT = "max"
+TRASH_VARIANT = "trash"
+STEP_VARIANT = "step"
+
+# the names of the objective and the rows which only exist in some variants
+OBJECTIVE_ROW = "obj"
+RATE_ROW = "rate"
+
+
+def _dense(matrix: np.ndarray) -> np.ndarray:
+    return matrix.toarray() if scipy.sparse.issparse(matrix) else np.asarray(matrix, dtype=float)
+
+
+def variable_names(problem: LinearProblem) -> tuple[str, ...]:
+    """
+    Returns the names of the variables of a problem in the exported files: the rates of the output points, machine
+    groups, buffer transfers and trash points, numbered in the order of the problem.
+    """
+    return (tuple(f"out{k}" for k in range(len(problem.output_points)))
+            + tuple(f"machine{i}" for i in range(len(problem.machine_groups)))
+            + tuple(f"transfer{i}" for i in range(len(problem.buffer_transfers)))
+            + tuple(f"trash{i}" for i in range(len(problem.trash_points))))
+
+
+@dataclass(frozen=True)
+class ExportedProblem:
+    """
+    A linear programming problem exactly as it is passed to linprog: minimize the costs subject to the equalities and
+    inequalities, with all variables non-negative. Maximizing a rate is minimizing minus the rate, so the optimal
+    objective value of a solver is minus the rate. The rows keep the names of the problem they come from, such that
+    the rows of every variant of a problem can be matched.
+    """
+    name: str
+    costs: np.ndarray
+    equalities_matrix: np.ndarray
+    equalities_values: np.ndarray
+    inequalities_matrix: np.ndarray
+    inequalities_bounds: np.ndarray
+    variable_names: tuple[str, ...]
+    equality_names: tuple[str, ...]
+    inequality_names: tuple[str, ...]
+
+    def _rows(self) -> list[tuple[str, str, np.ndarray, float]]:
+        return ([(name, "E", row, value) for name, row, value in
+                 zip(self.equality_names, self.equalities_matrix, self.equalities_values)]
+                + [(name, "L", row, bound) for name, row, bound in
+                   zip(self.inequality_names, self.inequalities_matrix, self.inequalities_bounds)])
+
+    def to_mps(self) -> str:
+        """ the problem in free MPS format """
+        rows = self._rows()
+        lines = [f"NAME {self.name}", "ROWS", f" N {OBJECTIVE_ROW}"]
+        lines.extend(f" {kind} {name}" for name, kind, _, _ in rows)
+        lines.append("COLUMNS")
+        matrix = np.array([row for _, _, row, _ in rows], dtype=float).reshape(-1, len(self.variable_names))
+        for j, variable in enumerate(self.variable_names):
+            entries = [(OBJECTIVE_ROW, self.costs[j])] if self.costs[j] != 0. else []
+            entries.extend((rows[i][0], matrix[i, j]) for i in np.flatnonzero(matrix[:, j]))
+            if not entries:
+                # a column without entries would not be declared at all
+                entries = [(OBJECTIVE_ROW, 0.)]
+            lines.extend(f" {variable} {row} {_number(value)}" for row, value in entries)
+        lines.append("RHS")
+        lines.extend(f" RHS {name} {_number(value)}" for name, _, _, value in rows if value != 0.)
+        lines.append("ENDATA")
+        return "\n".join(lines)+"\n"
+
+    def to_lp(self) -> str:
+        """ the problem in CPLEX LP format """
+        lines = [f"\\ {self.name}", "Minimize", _lp_expression(OBJECTIVE_ROW, self.costs, self.variable_names),
+                 "Subject To"]
+        for name, kind, row, value in self._rows():
+            relation = "=" if kind == "E" else "<="
+            lines.append(f"{_lp_expression(name, row, self.variable_names)} {relation} {_number(value)}")
+        # variables are non-negative by default, but are declared to keep unused variables in the problem
+        lines.append("Bounds")
+        lines.extend(f" {variable} >= 0" for variable in self.variable_names)
+        lines.append("End")
+        return "\n".join(lines)+"\n"
+
+    def write(self, path: str, fmt: str | None = None):
+        """
+        Writes the problem to a file.
+
+        :param fmt: MPS_FORMAT or LP_FORMAT, by default the extension of the path
+        """
+        fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt == MPS_FORMAT:
+            text = self.to_mps()
+        elif fmt == LP_FORMAT:
+            text = self.to_lp()
+        else:
+            raise ValueError(f"Unknown linear programming file format '{fmt}', expected mps or lp.")
+        with open(path, "w") as file:
+            file.write(text)
+
+
+def _number(value: float) -> str:
+    # repr is the shortest text which reads back as exactly the same float
+    return repr(float(value))
+
+
+def _lp_expression(name: str, row: np.ndarray, names: tuple[str, ...], terms_per_line: int = 8) -> str:
+    terms = [f"{'-' if row[j] < 0. else '+'} {_number(abs(row[j]))} {names[j]}" for j in np.flatnonzero(row)]
+    if not terms:
+        terms = [f"+ 0.0 {names[0]}"]
+    lines = [" ".join(terms[i:i+terms_per_line]) for i in range(0, len(terms), terms_per_line)]
+    return f" {name}: " + "\n   ".join(lines)
+
+
+def export_problem(problem: LinearProblem, name: str, removed: Iterable[int] = ()) -> ExportedProblem:
+    """
+    Returns the problem which maximizes the output rate, without the inequalities of the given caps, as solved for the
+    steps of a bottleneck chain.
+
+    :param removed: the indices of the caps to remove
+    """
+    removed = set(removed)
+    kept = [j for j in range(len(problem.caps)) if j not in removed]
+    return ExportedProblem(
+        name,
+        -problem.objective,
+        _dense(problem.equalities_matrix),
+        np.asarray(problem.equalities_values, dtype=float),
+        _dense(problem.inequalities_matrix)[kept],
+        np.asarray(problem.inequalities_bounds, dtype=float)[kept],
+        variable_names(problem),
+        tuple(f"balance{i}" for i in range(len(problem.equalities_values))),
+        tuple(f"cap{j}" for j in kept)
+    )
+
+
+def export_trash_problem(problem: LinearProblem, name: str, rate: float) -> ExportedProblem:
+    """
+    Returns the problem which minimizes the weighted trash rates while keeping the output rate at the given maximal
+    rate, as solved after the maximal rate if any trash point is used.
+    """
+    exported = export_problem(problem, name)
+    return ExportedProblem(
+        name,
+        problem.trash_weights_vector,
+        np.concatenate((exported.equalities_matrix, problem.objective[np.newaxis])),
+        np.append(exported.equalities_values, rate),
+        exported.inequalities_matrix,
+        exported.inequalities_bounds,
+        exported.variable_names,
+        exported.equality_names+(RATE_ROW,),
+        exported.inequality_names
+    )
+
+
+def problem_variants(problem: LinearProblem, name: str, solution: LinearSolution | None = None,
+                     max_depth: int | None = None) -> list[tuple[ExportedProblem, dict[str, Any]]]:
+    """
+    Returns every problem solved while analysing a problem, together with a description of it: the maximal rate, the
+    minimal trash rates if the solution uses any trash point, and the maximal rate after removing each prefix of the
+    bottleneck chain.
+
+    :param name: the name of the problem, to which the name of every variant is appended
+    :param solution: the solution of the problem, by default it is solved
+    :param max_depth: the maximal number of bottleneck steps, by default the full chain
+    """
+    if solution is None:
+        solution = problem.solve()
+    variants = [(export_problem(problem, f"{name}_{MAX_RATE_VARIANT}"),
+                 {"variant": MAX_RATE_VARIANT, "rate": _rate(solution)})]
+    if solution is None:
+        return variants
+    trash_rates = solution.x[problem.trash_points_start:problem.trash_points_start+len(problem.trash_points)]
+    if np.any(trash_rates > 1e-9):
+        variants.append((export_trash_problem(problem, f"{name}_{TRASH_VARIANT}", solution.rate),
+                         {"variant": TRASH_VARIANT, "rate": solution.rate,
+                          "trash": float(problem.trash_weights_vector.dot(solution.x))}))
+    chain = problem.bottleneck_chain(solution, max_depth)
+    steps = chain.get_steps(max_depth)
+    for k in range(1, len(steps)+1):
+        removed = [j for _, j in steps[:k]]
+        variants.append((export_problem(problem, f"{name}_{STEP_VARIANT}{k}", removed),
+                         {"variant": f"{STEP_VARIANT}{k}", "rate": _rate(chain.rate_after(k)),
+                          "removed": [f"cap{j}" for j in removed]}))
+    return variants
+
+
+def _rate(rate: float | LinearSolution | None) -> float | None:
+    """ a rate as JSON, None for unbounded rates """
+    if isinstance(rate, LinearSolution):
+        rate = rate.rate
+    return None if rate is None or rate == float("inf") else float(rate)
+
+
+def variable_map(factory: _Factory | SubFactory, problem: LinearProblem) -> dict[str, Any]:
+    """
+    Maps the names of the variables and inequalities of the exported problems back to the nodes of the factory, which
+    are referred to by their index in the factory as in the results store.
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    indices = {node: i for i, node in enumerate(factory.nodes)}
+
+    def node(node: FactoryNode) -> dict[str, Any]:
+        return {"node": indices.get(node), "description": _describe_node(node)}
+
+    variables: dict[str, dict[str, Any]] = {}
+    names = iter(variable_names(problem))
+    for output_point in problem.output_points:
+        variables[next(names)] = {"kind": "output", "material": output_point.material, **node(output_point.location)}
+    for machine_group in problem.machine_groups:
+        variables[next(names)] = {"kind": "machine", **node(machine_group)}
+    for frm, to, material in problem.buffer_transfers:
+        variables[next(names)] = {"kind": "transfer", "material": material, "from": node(frm), "to": node(to)}
+    for trash_point in problem.trash_points:
+        variables[next(names)] = {"kind": "trash", "material": trash_point.material, "weight": trash_point.weight,
+                                  **node(trash_point)}
+    caps = {f"cap{j}": cap.display() for j, cap in enumerate(problem.caps)}
+    return {"variables": variables, "caps": caps}
+
+
+def export_analysis(factory: _Factory | SubFactory, directory: str, output_points: Iterable[OutputPoint] | None = None,
+                    fmt: str = MPS_FORMAT, max_depth: int | None = None) -> list[str]:
+    """
+    Writes every problem analyse solves for the output points to a directory, one file per variant, see
+    problem_variants, named after the index and material of the output point. Next to them, a JSON file per output
+    point holds the variable map, see variable_map, and the variants with the rates found by linprog.
+
+    :param output_points: the output points, by default those of the given sub factory
+    :param fmt: MPS_FORMAT or LP_FORMAT
+    :param max_depth: the maximal number of bottleneck steps per output point, by default the full chain
+    :return: the paths of the written problems
+    """
+    if fmt not in (MPS_FORMAT, LP_FORMAT):
+        raise ValueError(f"Unknown linear programming file format '{fmt}', expected mps or lp.")
+    if output_points is None:
+        if not isinstance(factory, SubFactory):
+            raise ValueError("Output points need to be specified when not passing a sub factory.")
+        output_points = factory._output_points
+    output_points = list(output_points)
+    root = factory.factory if isinstance(factory, SubFactory) else factory
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for k, problem in enumerate(root.compile_many(output_points)):
+        name = f"{k:03d}_{re.sub(r'[^A-Za-z0-9_]', '_', output_points[k].material)}"
+        described = []
+        for exported, description in problem_variants(problem, name, max_depth=max_depth):
+            path = os.path.join(directory, f"{exported.name}.{fmt}")
+            exported.write(path, fmt)
+            paths.append(path)
+            described.append({"file": os.path.basename(path), **description})
+        with open(os.path.join(directory, f"{name}.json"), "w") as file:
+            json.dump({"output_point": output_points[k].material, "variants": described,
+                       **variable_map(root, problem)}, file, indent=2)
+    return paths
+
+
+def read_primal(path: str, names: Iterable[str]) -> dict[str, float]:
+    """
+    Reads the values of the variables from the solution file of a solver. In any line which contains the name of a
+    variable, the first number after it is its value, which covers the solution files of HiGHS, CBC, SCIP, Gurobi and
+    the printed solutions of GLPK. Only the first value of every variable is read, as the primal values come before
+    any dual values.
+    """
+    names = set(names)
+    values: dict[str, float] = {}
+    with open(path) as file:
+        for line in file:
+            tokens = line.split()
+            for i, token in enumerate(tokens):
+                if token not in names or token in values:
+                    continue
+                for value in tokens[i+1:]:
+                    try:
+                        values[token] = float(value)
+                        break
+                    except ValueError:
+                        continue
+                break
+    return values
+
+
+def _primal(problem: LinearProblem, values: dict[str, float] | np.ndarray, tolerance: float
+            ) -> tuple[np.ndarray, np.ndarray, float]:
+    """ the values of the variables of a primal solution and the slack of the caps, checked against the problem """
+    names = variable_names(problem)
+    if isinstance(values, dict):
+        unknown = [name for name in values if name not in names]
+        if unknown:
+            raise ValueError(f"Unknown variables {', '.join(unknown[:5])} in the solution.")
+        x = np.array([values.get(name, 0.) for name in names], dtype=float)
+    else:
+        x = np.array(values, dtype=float)
+        if x.shape != (len(names),):
+            raise ValueError(f"Expected {len(names)} values, got {x.shape}.")
+    scale = tolerance*max(1., float(np.max(np.abs(x), initial=0.)))
+    equalities = _dense(problem.equalities_matrix)
+    inequalities = _dense(problem.inequalities_matrix)
+    if np.any(x < -scale) or np.any(np.abs(equalities@x-problem.equalities_values) > scale):
+        raise FactoryAnalysisException("The solution does not satisfy the problem.")
+    slack = problem.inequalities_bounds-inequalities@x
+    if np.any(slack < -scale):
+        raise FactoryAnalysisException("The solution exceeds the caps "
+                                       + ", ".join(problem.caps[j].display() for j in np.flatnonzero(slack < -scale))
+                                       + ".")
+    # caps within the tolerance of their bound are binding
+    return np.maximum(x, 0.), np.where(slack <= scale, 0., slack), scale
+
+
+def import_solution(problem: LinearProblem, values: dict[str, float] | np.ndarray,
+                    trash_values: dict[str, float] | np.ndarray | None = None, max_depth: int | None = None,
+                    tolerance: float = 1e-6) -> SingleAnalysisResults:
+    """
+    Turns primal solutions found by another solver into the results of a problem, as if it was solved by linprog.
+    Like solve, the caps which bind at the solution of the maximal rate variant are the start of the bottleneck chain,
+    which is computed by this package, and if that solution uses any trash point the rates are those of the solution
+    of the trash variant. This gives the same results as analyse, as long as the solver finds the same vertices. An
+    external primal solution carries no marginals, so those of the solution are nan.
+
+    :param values: the solution of the maximal rate variant, the value of every variable by name, missing variables
+    are zero, or the vector of all values
+    :param trash_values: the solution of the trash variant in the same form, required if the solution of the maximal
+    rate variant uses any trash point
+    :param max_depth: the maximal number of bottlenecks to compute, by default the full chain
+    :param tolerance: the relative violation of the constraints which is accepted, as solvers round
+    """
+    x, max_slack, scale = _primal(problem, values, tolerance)
+    rate = float(problem.objective.dot(x))
+    slack = max_slack
+    if trash_values is not None:
+        x, slack, _ = _primal(problem, trash_values, tolerance)
+        if abs(problem.objective.dot(x)-rate) > scale:
+            raise FactoryAnalysisException("The solution of the trash variant does not keep the maximal rate.")
+    elif np.any(x[problem.trash_points_start:problem.trash_points_start+len(problem.trash_points)] > scale):
+        raise ValueError("The solution uses trash points, so the solution of the trash variant is needed as well.")
+    solution = LinearSolution(rate, x, slack, max_slack, np.full(len(max_slack), np.nan))
+    return problem.results_from(solution, max_depth)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import numpy as np
+import weakref
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Iterator
+from facalc.factories import (MachineType, FactoryNode, NodeGraph, MachineGroup, Source, Buffer, TrashPoint,
+                              OutputPoint, Bottleneck, SourceRateCap, OutputPointRateCap, SubFactory,
+                              FactoryAnalysisException)
+
+
+class MacroMachine(MachineType):
+    """
+    A machine type standing in for everything a sub factory does to produce one material at one of its interface
+    buffers. One machine produces the material at a rate of one per second.
+    """
+    def __init__(self, name: str, material: str, input_rates: dict[str, float]):
+        self.name = name
+        self.material = material
+        self._input_rates = input_rates
+
+    @property
+    def input_rates(self) -> dict[str, float]:
+        return self._input_rates
+
+    @property
+    def output_rates(self) -> dict[str, float]:
+        return {self.material: 1.}
+
+    def display_info(self, rate: float) -> str:
+        if rate == float("inf"):
+            return f"infinite {self.material} from {self.name}"
+        return f"{rate:.2f}/s {self.material} from {self.name}"
+
+    def get_cap_description(self) -> str:
+        return f"{self.material} cap of {self.name}"
+
+
+def _interface_lines(sub_factory: SubFactory, internal: set[FactoryNode]) -> list[tuple[FactoryNode, str]]:
+    lines: list[tuple[FactoryNode, str]] = []
+    for node in sub_factory._nodes:
+        for material in node.output_materials:
+            if all(other in internal for other in node.outputs(material)):
+                continue
+            if not isinstance(node, Buffer):
+                raise FactoryAnalysisException("Only buffers can supply nodes outside a sub factory that is collapsed.")
+            lines.append((node, material))
+    for output_point in sub_factory._output_points:
+        key = (output_point.location, output_point.material)
+        if output_point.location in internal and key not in lines:
+            lines.append(key)
+    return lines
+
+
+def _fingerprint(sub_factory: SubFactory) -> tuple:
+    parts: list[tuple] = []
+    for node in sub_factory._nodes:
+        if isinstance(node, Source):
+            parameters = (node.material, node.max_rate)
+        elif isinstance(node, Buffer):
+            parameters = tuple(sorted(node.rate_caps.items()))
+        elif isinstance(node, MachineGroup):
+            parameters = (node.machine_cap, tuple(sorted(node.machine_type.input_rates.items())),
+                          tuple(sorted(node.machine_type.output_rates.items())))
+        elif isinstance(node, TrashPoint):
+            parameters = (id(node.location), node.material, node.max_rate, node.weight)
+        else:
+            parameters = ()
+        edges = (
+            tuple((material, tuple(id(x) for x in node.inputs(material))) for material in node.input_materials),
+            tuple((material, tuple(id(x) for x in node.outputs(material))) for material in node.output_materials)
+        )
+        parts.append((id(node), type(node).__name__, parameters, edges))
+    parts.append(tuple((id(output_point.location), output_point.material, output_point.max_rate)
+                       for output_point in sub_factory._output_points))
+    return tuple(parts)
+
+
+class CollapsedFactory:
+    """
+    A linear stand in for a sub factory: one macro machine group per interface line (a buffer line read by nodes
+    outside the sub factory, or an output point inside it). Every macro machine consumes, per unit of output, what the
+    sub factory consumed from outside at its maximal standalone rate for that line, and its machine cap is that maximal
+    rate. Every internal cap used by a line (capped sources, buffer rate caps, machine caps, trash point caps) is
+    replaced by a shared source with the same cap, of which every macro machine consumes what its line used of the cap
+    per unit of output, so competition between the lines for internal caps is kept.
+
+    Each line is fixed to the mix of recipes of its standalone maximum, so every combination of rates the collapsed
+    factory allows is achievable by the sub factory itself, but it can understate what the sub factory achieves when
+    lines would do better by sharing intermediates or switching recipes.
+    """
+    def __init__(self, sub_factory: SubFactory, name: str):
+        self.sub_factory = sub_factory
+        self.name = name
+        self.macro_groups: dict[tuple[FactoryNode, str], MachineGroup] = {}
+        self.shared_caps: dict[Bottleneck, Source] = {}
+        self.suppliers: dict[MachineGroup, tuple[tuple[FactoryNode, str], ...]] = {}
+        self.output_points: dict[OutputPoint, OutputPoint] = {}
+        self.active = False
+
+        factory = sub_factory.factory
+        internal = set(sub_factory._nodes)
+        for location, material in _interface_lines(sub_factory, internal):
+            problem = factory.compile(OutputPoint(location, material), boundary=internal)
+            solution = problem.solve()
+            machine_cap = None
+            if solution is not None:
+                machine_cap = solution.rate
+            else:
+                # the line is unbounded, so determine the consumption at unit rate instead
+                unit_rate_vector = np.zeros(problem.num_variables, float)
+                unit_rate_vector[0] = 1.
+                solution = replace(
+                    problem,
+                    inequalities_matrix=np.concatenate((problem.inequalities_matrix, np.array([unit_rate_vector]))),
+                    inequalities_bounds=np.concatenate((problem.inequalities_bounds, np.array([1.]))),
+                    caps=problem.caps+(OutputPointRateCap(problem.output_point),)
+                ).solve()
+            input_rates: dict[str, float] = {}
+            suppliers: list[tuple[FactoryNode, str]] = []
+            if solution.rate > 1e-9:
+                for (node, input_material), vector in problem.boundary_rate_vectors.items():
+                    rate = vector.dot(solution.x)/solution.rate
+                    if rate <= 1e-12:
+                        continue
+                    if input_material in input_rates:
+                        raise FactoryAnalysisException(f"Cannot collapse a sub factory which is supplied "
+                                                       f"'{input_material}' from multiple nodes.")
+                    input_rates[input_material] = rate
+                    suppliers.append((node, input_material))
+                usage = problem.inequalities_matrix @ solution.x
+                for j, cap in enumerate(problem.caps):
+                    rate = usage[j]/solution.rate
+                    if rate <= 1e-12:
+                        continue
+                    if cap not in self.shared_caps:
+                        self.shared_caps[cap] = Source(self._shared_material(cap), float(problem.inequalities_bounds[j]))
+                    shared_source = self.shared_caps[cap]
+                    input_rates[shared_source.material] = rate
+                    suppliers.append((shared_source, shared_source.material))
+            macro_group = MachineGroup(MacroMachine(name, material, input_rates), machine_cap)
+            # the macro group is only connected to its suppliers while it stands in
+            self.suppliers[macro_group] = tuple(suppliers)
+            self.macro_groups[(location, material)] = macro_group
+        for output_point in sub_factory._output_points:
+            if isinstance(output_point.location, MachineGroup) and output_point.location in internal:
+                macro_group = self.macro_groups[(output_point.location, output_point.material)]
+                self.output_points[output_point] = replace(output_point, location=macro_group)
+
+    def _shared_material(self, cap: Bottleneck) -> str:
+        if isinstance(cap, SourceRateCap):
+            return f"{self.name} {cap.source.material}"
+        return f"{self.name} {cap.display()}"
+
+    @contextmanager
+    def stand_in(self) -> Iterator[CollapsedFactory]:
+        """
+        Temporarily replaces the sub factory by its macro machine groups within its factory. Output points inside the
+        sub factory at machine groups are replaced by output points at the corresponding macro machine groups in the
+        output point lists of the sub factory and its parents.
+        """
+        if self.active:
+            raise ValueError("This collapsed factory is already standing in.")
+        internal = set(self.sub_factory._nodes)
+        graph = self.sub_factory.factory.graph
+        snapshot = graph.snapshot()
+        # detach all internal nodes from the rest of the factory, keeping only what they supply to outside nodes
+        graph.retain(lambda frm, to, material: to not in internal)
+        # connect the macro machine groups instead
+        for (location, material), macro_group in self.macro_groups.items():
+            for node, input_material in self.suppliers[macro_group]:
+                NodeGraph.joining(node, macro_group).connect(node, macro_group, input_material)
+            if isinstance(location, Buffer):
+                NodeGraph.joining(macro_group, location).connect(macro_group, location, material)
+
+        # replace the output points in the sub factory and its parents
+        saved_output_points: list[tuple[SubFactory, list[OutputPoint]]] = []
+        sub_factory = self.sub_factory
+        while isinstance(sub_factory, SubFactory):
+            saved_output_points.append((sub_factory, sub_factory._output_points))
+            sub_factory._output_points = [self.output_points.get(x, x) for x in sub_factory._output_points]
+            sub_factory = sub_factory.parent
+
+        self.active = True
+        try:
+            yield self
+        finally:
+            graph.restore(snapshot)
+            for sub_factory, output_points in saved_output_points:
+                sub_factory._output_points = output_points
+            self.active = False
+
+
+_collapsed_factories: weakref.WeakKeyDictionary[SubFactory, tuple[tuple, CollapsedFactory]] = (
+    weakref.WeakKeyDictionary())
+
+
+def collapse(sub_factory: SubFactory, name: str | None = None) -> CollapsedFactory:
+    """
+    Collapses a sub factory into macro machine groups, see CollapsedFactory. The result is cached and recomputed only
+    when the nodes, caps, machine types or connections of the sub factory change.
+
+    :param sub_factory: the sub factory to collapse
+    :param name: the name used in descriptions of the macro machines, by default the class name of the sub factory
+    """
+    if name is None:
+        name = type(sub_factory).__name__
+    if sub_factory in _collapsed_factories:
+        fingerprint, collapsed = _collapsed_factories[sub_factory]
+        if collapsed.active:
+            raise ValueError("Cannot collapse a sub factory while it is replaced by its stand in.")
+        if collapsed.name == name and fingerprint == _fingerprint(sub_factory):
+            return collapsed
+    collapsed = CollapsedFactory(sub_factory, name)
+    _collapsed_factories[sub_factory] = (_fingerprint(sub_factory), collapsed)
+    return collapsed
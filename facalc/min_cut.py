@@ -0,0 +1,314 @@
+from __future__ import annotations
+import numpy as np
+from collections import deque
+from dataclasses import dataclass, replace
+from facalc.factories import (_Factory, SubFactory, OutputPoint, Source, Buffer, Bottleneck, SourceRateCap,
+                              BufferRateCap, OutputPointRateCap, FactoryRates, LinearProblem, _append_row)
+
+
+@dataclass(frozen=True)
+class CutResults:
+    """
+    The maximal rate of an output point together with a set of caps which together limit it: raising the rate requires
+    raising at least one of them. For transport only networks this is a minimum cut of the network, otherwise it is the
+    set of binding caps with a nonzero marginal in the linear programming problem, in which transport regions are
+    replaced by their minimum cuts, see minimum_cut.
+    """
+    output_point: OutputPoint
+    result_rate: float
+    cut: tuple[Bottleneck, ...]
+    rates: FactoryRates
+    transport_only: bool
+    # the number of transport regions within the linear programming problem which were solved by maximal flows
+    transport_regions: int = 0
+
+    def display(self) -> str:
+        rate = "infinite" if self.result_rate == float("inf") else f"{self.result_rate:.2f}/s"
+        method = "max flow" if self.transport_only else "linear programming"
+        if self.transport_regions:
+            method += f" with {self.transport_regions} transport regions by max flow"
+        lines = [f"final rate: {rate} ({method})"]
+        if self.cut:
+            lines.append(" -- minimum cut -- ")
+            for cap in self.cut:
+                lines.append(cap.display())
+        return "\n".join(lines)
+
+
+class _FlowNetwork:
+    """
+    A directed graph with capacities on which maximal flows are computed with the Edmonds-Karp algorithm.
+    """
+    def __init__(self):
+        self.heads: list[int] = []
+        self.capacities: list[float] = []
+        self.adjacency: list[list[int]] = []
+
+    def add_vertex(self) -> int:
+        self.adjacency.append([])
+        return len(self.adjacency)-1
+
+    def add_edge(self, frm: int, to: int, capacity: float) -> int:
+        """ adds an edge together with its reverse edge, returning the index of the edge """
+        for head, tail, value in ((to, frm, capacity), (frm, to, 0.)):
+            self.adjacency[tail].append(len(self.heads))
+            self.heads.append(head)
+            self.capacities.append(value)
+        return len(self.heads)-2
+
+    def _find_path(self, residual: np.ndarray, source: int, sink: int) -> list[int] | None:
+        parent_edges = [-1]*len(self.adjacency)
+        visited = [False]*len(self.adjacency)
+        visited[source] = True
+        queue = deque((source,))
+        while queue:
+            vertex = queue.popleft()
+            for edge in self.adjacency[vertex]:
+                head = self.heads[edge]
+                if visited[head] or residual[edge] <= 1e-12:
+                    continue
+                visited[head] = True
+                parent_edges[head] = edge
+                if head == sink:
+                    path = []
+                    while head != source:
+                        path.append(parent_edges[head])
+                        head = self.heads[parent_edges[head] ^ 1]
+                    return path
+                queue.append(head)
+        return None
+
+    def reachable(self, residual: np.ndarray, source: int) -> set[int]:
+        found = {source}
+        queue = deque((source,))
+        while queue:
+            vertex = queue.popleft()
+            for edge in self.adjacency[vertex]:
+                head = self.heads[edge]
+                if head not in found and residual[edge] > 1e-12:
+                    found.add(head)
+                    queue.append(head)
+        return found
+
+    def max_flow(self, source: int, sink: int) -> tuple[float, np.ndarray]:
+        """
+        Returns the value of a maximal flow from source to sink and the residual capacities of the edges, or an infinite
+        value if there is a path of edges with infinite capacity.
+        """
+        capacities = np.array(self.capacities, dtype=float)
+        infinite = np.isinf(capacities)
+        if sink in self.reachable(np.where(infinite, 1., 0.), source):
+            return float("inf"), capacities
+        # any finite cut is smaller than the sum of the finite capacities, so it is a large enough stand in for infinity
+        residual = np.where(infinite, capacities[~infinite].sum()+1., capacities)
+        value = 0.
+        while (path := self._find_path(residual, source, sink)) is not None:
+            amount = min(residual[edge] for edge in path)
+            for edge in path:
+                residual[edge] -= amount
+                residual[edge ^ 1] += amount
+            value += amount
+        return value, residual
+
+
+@dataclass
+class _TransportNetwork:
+    """
+    The flow network of sources and buffer lines joined by buffer transfers, in which every buffer line is split into
+    an entry and an exit joined by its rate cap.
+    """
+    network: _FlowNetwork
+    super_source: int
+    sink: int
+    exits: dict[tuple[Buffer | Source, str], int]
+    caps: dict[int, Bottleneck]
+    source_edges: dict[Source, int]
+    line_edges: dict[tuple[Buffer, str], int]
+    transfer_edges: dict[tuple[Buffer | Source, Buffer, str], int]
+
+    def cut(self, residual: np.ndarray) -> tuple[Bottleneck, ...]:
+        """ the caps of the minimum cut of a maximal flow with the given residual capacities """
+        reachable = self.network.reachable(residual, self.super_source)
+        return tuple(cap for edge, cap in self.caps.items()
+                     if self.network.heads[edge ^ 1] in reachable and self.network.heads[edge] not in reachable)
+
+
+def _transport_network(sources: list[Source], buffer_lines: list[tuple[Buffer, str]],
+                       buffer_transfers: list[tuple[Buffer | Source, Buffer, str]]) -> _TransportNetwork:
+    network = _FlowNetwork()
+    transport = _TransportNetwork(network, network.add_vertex(), network.add_vertex(), {}, {}, {}, {}, {})
+    entries: dict[tuple[Buffer, str], int] = {}
+    for buffer, material in buffer_lines:
+        entries[(buffer, material)] = network.add_vertex()
+        transport.exits[(buffer, material)] = network.add_vertex()
+        rate_cap = buffer.rate_caps.get(material)
+        edge = network.add_edge(entries[(buffer, material)], transport.exits[(buffer, material)],
+                                float("inf") if rate_cap is None else rate_cap)
+        transport.line_edges[(buffer, material)] = edge
+        if rate_cap is not None:
+            transport.caps[edge] = BufferRateCap(buffer, material)
+    for source in sources:
+        transport.exits[(source, source.material)] = network.add_vertex()
+        edge = network.add_edge(transport.super_source, transport.exits[(source, source.material)],
+                                float("inf") if source.max_rate is None else source.max_rate)
+        transport.source_edges[source] = edge
+        if source.max_rate is not None:
+            transport.caps[edge] = SourceRateCap(source)
+    for frm, to, material in buffer_transfers:
+        transport.transfer_edges[(frm, to, material)] = network.add_edge(
+            transport.exits[(frm, material)], entries[(to, material)], float("inf"))
+    return transport
+
+
+def _transport_cut(output_point: OutputPoint, sources: list[Source], buffer_lines: list[tuple[Buffer, str]],
+                   buffer_transfers: list[tuple[Buffer | Source, Buffer, str]]) -> CutResults:
+    transport = _transport_network(sources, buffer_lines, buffer_transfers)
+    output_edge = transport.network.add_edge(
+        transport.exits[(output_point.location, output_point.material)], transport.sink,
+        float("inf") if output_point.max_rate is None else output_point.max_rate)
+    if output_point.max_rate is not None:
+        transport.caps[output_edge] = OutputPointRateCap(output_point)
+
+    value, residual = transport.network.max_flow(transport.super_source, transport.sink)
+    if value == float("inf"):
+        rates = FactoryRates({source: float("inf") for source in sources},
+                             {line: float("inf") for line in buffer_lines}, {}, {})
+        return CutResults(output_point, value, (), rates, True)
+    # the flow through an edge is the residual capacity of its reverse edge
+    rates = FactoryRates(
+        {source: float(residual[edge ^ 1]) for source, edge in transport.source_edges.items()},
+        {line: float(residual[edge ^ 1]) for line, edge in transport.line_edges.items()},
+        {},
+        {}
+    )
+    return CutResults(output_point, value, transport.cut(residual), rates, True)
+
+
+class _TransportRegion:
+    """
+    Sources and buffer lines of one material which, through buffer transfers without any machine group, only supply
+    each other and finally one buffer line, the exit. Whatever the rest of the factory takes from the exit, the region
+    can deliver any rate up to its maximal flow into the exit, so its caps can be replaced by a single cap of that
+    flow on the throughput of the exit.
+    """
+    def __init__(self, exit_line: tuple[Buffer, str], sources: list[Source], buffer_lines: list[tuple[Buffer, str]],
+                 buffer_transfers: list[tuple[Buffer | Source, Buffer, str]]):
+        self.exit_line = exit_line
+        self.sources = sources
+        self.buffer_lines = buffer_lines
+        self.transport = _transport_network(sources, buffer_lines, buffer_transfers)
+        self.exit_edge = self.transport.network.add_edge(self.transport.exits[exit_line], self.transport.sink,
+                                                         float("inf"))
+        self.capacity, residual = self.transport.network.max_flow(self.transport.super_source, self.transport.sink)
+        self.cut = () if self.capacity == float("inf") else self.transport.cut(residual)
+
+    @property
+    def caps(self) -> set[Bottleneck]:
+        return set(self.transport.caps.values())
+
+    def flows(self, rate: float) -> dict[tuple[Buffer | Source, Buffer, str], float]:
+        """ rates of the buffer transfers of the region which deliver the given rate to the exit """
+        network = self.transport.network
+        network.capacities[self.exit_edge] = rate
+        try:
+            _, residual = network.max_flow(self.transport.super_source, self.transport.sink)
+        finally:
+            network.capacities[self.exit_edge] = float("inf")
+        return {transfer: float(residual[edge ^ 1]) for transfer, edge in self.transport.transfer_edges.items()}
+
+
+def _transport_region(exit_line: tuple[Buffer, str], output_point: OutputPoint) -> _TransportRegion | None:
+    """ the transport region of which a buffer line is the exit, or None if the buffer line is not the exit of one """
+    material = exit_line[1]
+    sources: list[Source] = []
+    buffer_lines = [exit_line]
+    buffer_transfers: list[tuple[Buffer | Source, Buffer, str]] = []
+    to_search = [exit_line[0]]
+    while to_search:
+        buffer = to_search.pop()
+        for node in buffer.inputs(material):
+            if isinstance(node, Source):
+                if node not in sources:
+                    sources.append(node)
+            elif isinstance(node, Buffer):
+                if (node, material) not in buffer_lines:
+                    buffer_lines.append((node, material))
+                    to_search.append(node)
+            else:
+                return None
+            buffer_transfers.append((node, buffer, material))
+    # everything but the exit may only supply the region, not machine groups, trash points or output points
+    lines = set(buffer_lines)
+    for node in sources+[buffer for buffer, _ in buffer_lines[1:]]:
+        if any((other, material) not in lines for other in node.outputs(material)):
+            return None
+    if (output_point.location, output_point.material) in lines-{exit_line}:
+        return None
+    return _TransportRegion(exit_line, sources, buffer_lines, buffer_transfers)
+
+
+def _transport_regions(problem: LinearProblem) -> list[_TransportRegion]:
+    """ the transport regions of a problem which are not inside another one """
+    regions = [region for line in problem.buffer_lines
+               if (region := _transport_region(line, problem.output_point)) is not None]
+    return [region for region in regions
+            if not any(region.exit_line in other.buffer_lines[1:] for other in regions)]
+
+
+def minimum_cut(factory: _Factory | SubFactory, output_point: OutputPoint) -> CutResults:
+    """
+    Computes the maximal rate of an output point together with a minimal set of caps limiting it. If only sources and
+    buffers supply the output point, the rate caps form a flow network and the cut is found with a maximal flow,
+    without setting up a linear programming problem.
+
+    Otherwise, the linear programming problem is needed where machine groups fix the ratios between materials, but
+    transport regions, see _TransportRegion, are still handled by maximal flows: their caps are replaced by a cap of
+    their maximal flow on their exit, and if that cap is part of the cut, so is the minimum cut of the region. The cut
+    consists of the binding caps with a nonzero marginal in the linear programming problem, with those of the regions
+    expanded.
+
+    :param factory: the factory containing the output point
+    :param output_point: the output point
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    if isinstance(output_point.location, Buffer):
+        sources, machine_groups, buffer_lines, buffer_transfers = factory.search_nodes(output_point.location,
+                                                                                        output_point.material)
+        if not machine_groups:
+            return _transport_cut(output_point, sources, buffer_lines, buffer_transfers)
+    problem = factory.compile(output_point)
+    regions = _transport_regions(problem)
+    region_caps = set().union(*(region.caps for region in regions))
+    active = np.array([cap not in region_caps for cap in problem.caps], dtype=bool)
+    contracted = problem
+    region_rows: dict[int, _TransportRegion] = {}
+    for region in regions:
+        if region.capacity == float("inf"):
+            continue
+        region_rows[len(active)] = region
+        active = np.append(active, True)
+        contracted = replace(
+            contracted,
+            inequalities_matrix=_append_row(contracted.inequalities_matrix,
+                                            problem.buffer_throughput_vectors[region.exit_line]),
+            inequalities_bounds=np.append(contracted.inequalities_bounds, region.capacity),
+            caps=contracted.caps+(BufferRateCap(*region.exit_line),)
+        )
+    solution = contracted.solve(active)
+    if solution is None:
+        return CutResults(output_point, float("inf"), (), problem.infinite_results().rates, False, len(regions))
+    cut: list[Bottleneck] = []
+    for j, slack, marginal in zip(np.flatnonzero(active), solution.max_slack, solution.marginals):
+        if slack < 1e-9 and abs(marginal) > 1e-12:
+            cut.extend(region_rows[j].cut if j in region_rows else (problem.caps[j],))
+    # without their caps, the transfers within the regions can exceed them, so route the flows through the regions
+    x = solution.x.copy()
+    transfer_indices = {transfer: problem.buffer_transfers_start+i
+                        for i, transfer in enumerate(problem.buffer_transfers)}
+    for region in regions:
+        if region.capacity == float("inf"):
+            continue
+        for transfer, rate in region.flows(problem.buffer_throughput_vectors[region.exit_line].dot(x)).items():
+            x[transfer_indices[transfer]] = rate
+    return CutResults(output_point, solution.rate, tuple(cut), problem.get_rates(x), False, len(regions))
@@ -0,0 +1,320 @@
+from __future__ import annotations
+import heapq
+import numpy as np
+import os
+import scipy
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from math import ceil
+from typing import Iterable
+from facalc.factories import (_Factory, SubFactory, OutputPoint, MachineGroup, MachineType, LinearProblem,
+                              FactoryAnalysisException)
+from facalc.factorio_machines import Module, module_slots, supports_module, with_modules
+
+
+@dataclass(frozen=True)
+class ModuleAllocation:
+    """
+    The number of modules per machine of each machine group which maximizes the rate of an output point within a module
+    budget.
+    """
+    output_point: OutputPoint
+    module: Module
+    result_rate: float
+    # the rate of the factory as built, with the modules the machine groups had before
+    base_rate: float
+    modules_per_machine: dict[MachineGroup, int]
+    machine_counts: dict[MachineGroup, int]
+    optimal: bool
+    num_solves: int
+
+    @property
+    def modules_used(self) -> int:
+        return sum(self.modules_per_machine[group]*count for group, count in self.machine_counts.items())
+
+    def apply(self):
+        """
+        Gives the machine types of the machine groups the allocated modules.
+        """
+        for machine_group, level in self.modules_per_machine.items():
+            machine_group.machine_type = with_modules(machine_group.machine_type, (self.module,)*level)
+
+    def display(self) -> str:
+        lines = [f"final rate: {self.result_rate:.2f}/s instead of {self.base_rate:.2f}/s using {self.modules_used} "
+                 f"{self.module.name.lower()}s" + ("" if self.optimal else " (not proven optimal)"),
+                 " -- modules -- "]
+        for machine_group, level in self.modules_per_machine.items():
+            if level == 0:
+                continue
+            machine_info = machine_group.machine_type.display_info(
+                self.machine_counts[machine_group]/machine_group.machine_type.machines_per_rate)
+            lines.append(f"{level} per machine for {machine_info}")
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class _ModuleRelaxation:
+    """
+    The problem of an output point in which the rate of every considered machine group is split over one variable per
+    number of modules per machine, with the total number of modules bounded by the budget. Fixing the number of
+    modules of a machine group keeps only one of its variables. With every machine group fixed this is the problem
+    with those modules; otherwise it is a relaxation of it, as a machine group may mix machines with different numbers
+    of modules.
+    """
+    objective: np.ndarray
+    equalities_matrix: np.ndarray
+    equalities_values: np.ndarray
+    inequalities_matrix: np.ndarray
+    inequalities_bounds: np.ndarray
+    # per considered machine group and number of modules per machine: its column in both matrices and its module cost
+    equalities_columns: tuple[np.ndarray, ...]
+    inequalities_columns: tuple[np.ndarray, ...]
+    costs: tuple[np.ndarray, ...]
+    budget: float
+
+    def solve(self, levels: tuple[int, ...], whole_machines: bool = False
+              ) -> tuple[float, list[np.ndarray], np.ndarray | None]:
+        """
+        :param levels: the number of modules per machine of each considered machine group, -1 if it is free
+        :param whole_machines: whether the budget counts whole machines, with a mixed integer linear program, instead
+        of fractional machines
+        :return: the maximal rate, the rate per number of modules of each considered machine group and the solution
+        """
+        selected = [np.arange(len(costs)) if level < 0 else np.array([level])
+                    for level, costs in zip(levels, self.costs)]
+        equalities_columns = np.concatenate(
+            [columns[:, s] for columns, s in zip(self.equalities_columns, selected)], axis=1)
+        inequalities_columns = np.concatenate(
+            [columns[:, s] for columns, s in zip(self.inequalities_columns, selected)], axis=1)
+        costs = np.concatenate([costs[s] for costs, s in zip(self.costs, selected)])
+        num_variables = len(self.objective)+len(costs)
+        objective = -np.concatenate((self.objective, np.zeros(len(costs))))
+        equalities_matrix = np.hstack((self.equalities_matrix, equalities_columns))
+        inequalities_matrix = np.hstack((self.inequalities_matrix, inequalities_columns))
+        if not whole_machines:
+            # noinspection PyDeprecation
+            result = scipy.optimize.linprog(
+                objective,
+                np.vstack((inequalities_matrix, np.concatenate((np.zeros(len(self.objective)), costs)))),
+                np.concatenate((self.inequalities_bounds, [self.budget])),
+                equalities_matrix,
+                self.equalities_values
+            )
+        else:
+            # the machine counts of the columns using modules are integer variables after the other variables, every
+            # count is at least the machines the column needs and the budget holds for the counts
+            used = np.flatnonzero(costs > 0.)
+            column_levels = np.concatenate(selected)[used]
+            no_counts = np.zeros((len(self.equalities_values)+len(self.inequalities_bounds), len(used)))
+            constraints = [
+                scipy.optimize.LinearConstraint(np.hstack((equalities_matrix, no_counts[:len(equalities_matrix)])),
+                                                self.equalities_values, self.equalities_values),
+                scipy.optimize.LinearConstraint(np.hstack((inequalities_matrix, no_counts[len(equalities_matrix):])),
+                                                -np.inf, self.inequalities_bounds)
+            ]
+            if len(used):
+                count_rows = np.zeros((len(used), num_variables+len(used)))
+                count_rows[np.arange(len(used)), len(self.objective)+used] = costs[used]/column_levels
+                count_rows[np.arange(len(used)), num_variables+np.arange(len(used))] = -1.
+                constraints.append(scipy.optimize.LinearConstraint(count_rows, -np.inf, 0.))
+                constraints.append(scipy.optimize.LinearConstraint(
+                    np.concatenate((np.zeros(num_variables), column_levels))[np.newaxis], -np.inf, self.budget))
+            result = scipy.optimize.milp(
+                np.concatenate((objective, np.zeros(len(used)))),
+                integrality=np.concatenate((np.zeros(num_variables), np.ones(len(used)))),
+                bounds=scipy.optimize.Bounds(0., np.inf),
+                constraints=constraints
+            )
+        if result.status == 3:
+            return float("inf"), [], None
+        elif result.status != 0:
+            raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
+        rates = []
+        offset = len(self.objective)
+        for level, costs, s in zip(levels, self.costs, selected):
+            group_rates = np.zeros(len(costs), float)
+            group_rates[s] = result.x[offset:offset+len(s)]
+            rates.append(group_rates)
+            offset += len(s)
+        return float(self.objective.dot(result.x[:len(self.objective)])), rates, result.x[:num_variables]
+
+    def evaluate(self, levels: tuple[int, ...]) -> tuple[float, int, tuple[int, ...], float, int]:
+        """
+        Solves the relaxation for the given levels, rounds it to an allocation and picks the machine group to branch on.
+
+        :return: an upper bound on the rate of every allocation with the given levels, the index of the free machine
+        group to branch on, or -1 if the rounded allocation reaches the bound, the rounded allocation with every free
+        machine group set to the number of modules it uses most, its rate counting whole machines and the number of
+        problems solved
+        """
+        if all(level >= 0 for level in levels):
+            rate = self.solve(levels, whole_machines=True)[0]
+            return rate, -1, levels, rate, 1
+        bound, rates, x = self.solve(levels)
+        if x is None:
+            return bound, -1, levels, bound, 1
+        # prefer machine groups which mix numbers of modules, then those spending the most of the budget
+        branch, branch_key = -1, (False, -1.)
+        rounded = list(levels)
+        for i, (level, group_rates) in enumerate(zip(levels, rates)):
+            if level >= 0:
+                continue
+            rounded[i] = int(np.argmax(group_rates)) if np.any(group_rates > 1e-9) else 0
+            key = (np.count_nonzero(group_rates > 1e-9) > 1, float(self.costs[i].dot(group_rates)))
+            if key > branch_key:
+                branch, branch_key = i, key
+        rounded_rate = self.solve(tuple(rounded), whole_machines=True)[0]
+        if not branch_key[0] and rounded_rate >= bound*(1.-1e-9)-1e-12:
+            branch = -1
+        return bound, branch, tuple(rounded), rounded_rate, 2
+
+
+_worker_relaxation: _ModuleRelaxation | None = None
+
+
+def _init_worker(relaxation: _ModuleRelaxation):
+    global _worker_relaxation
+    _worker_relaxation = relaxation
+
+
+def _evaluate_in_worker(levels: tuple[int, ...]) -> tuple[float, int, tuple[int, ...], float, int]:
+    return _worker_relaxation.evaluate(levels)
+
+
+def _build_relaxation(factory: _Factory, output_point: OutputPoint, machine_groups: list[MachineGroup], module: Module,
+                      budget: float) -> tuple[LinearProblem, _ModuleRelaxation, list[int]]:
+    problem = factory.compile(output_point)
+    indices = [problem.machine_groups.index(group) for group in machine_groups]
+    max_levels = [module_slots(group.machine_type) for group in machine_groups]
+    columns = [problem.machine_groups_start+i for i in indices]
+    # the problem has the same layout for any modules, so compile once per number of modules to get the columns
+    original_types: dict[MachineGroup, MachineType] = {group: group.machine_type for group in machine_groups}
+    equalities_columns = [np.zeros((problem.equalities_matrix.shape[0], m+1)) for m in max_levels]
+    inequalities_columns = [np.zeros((problem.inequalities_matrix.shape[0], m+1)) for m in max_levels]
+    costs = [np.zeros(m+1) for m in max_levels]
+    for level in range(max(max_levels, default=0)+1):
+        try:
+            for group, max_level in zip(machine_groups, max_levels):
+                group.machine_type = with_modules(original_types[group], (module,)*min(level, max_level))
+            leveled_problem = factory.compile(output_point)
+            if leveled_problem.machine_groups != problem.machine_groups:
+                raise FactoryAnalysisException("Changing modules changed the layout of the linear programming problem.")
+        finally:
+            for group, machine_type in original_types.items():
+                group.machine_type = machine_type
+        for k, (group, column, max_level) in enumerate(zip(machine_groups, columns, max_levels)):
+            if level > max_level:
+                continue
+            equalities_columns[k][:, level] = leveled_problem.equalities_matrix[:, column]
+            inequalities_columns[k][:, level] = leveled_problem.inequalities_matrix[:, column]
+            costs[k][level] = level*with_modules(original_types[group], (module,)*level).machines_per_rate
+    equalities_matrix = problem.equalities_matrix.copy()
+    inequalities_matrix = problem.inequalities_matrix.copy()
+    equalities_matrix[:, columns] = 0.
+    inequalities_matrix[:, columns] = 0.
+    # keep the now unused variables of the considered machine groups at zero
+    fixed_rows = np.zeros((len(columns), problem.num_variables), float)
+    fixed_rows[np.arange(len(columns)), columns] = 1.
+    relaxation = _ModuleRelaxation(
+        problem.objective,
+        np.concatenate((equalities_matrix, fixed_rows)),
+        np.concatenate((problem.equalities_values, np.zeros(len(columns)))),
+        inequalities_matrix,
+        problem.inequalities_bounds,
+        tuple(np.concatenate((c, np.zeros((len(columns), c.shape[1])))) for c in equalities_columns),
+        tuple(inequalities_columns),
+        tuple(costs),
+        float(budget)
+    )
+    return problem, relaxation, max_levels
+
+
+def optimize_modules(factory: _Factory | SubFactory, output_point: OutputPoint, module: Module, budget: int,
+                     machine_groups: Iterable[MachineGroup] | None = None, max_solves: int = 2000,
+                     jobs: int | None = None) -> ModuleAllocation:
+    """
+    Allocates a budget of modules of one kind over machine groups to maximize the rate of an output point. Every machine
+    of a machine group gets the same number of modules, replacing its current modules, and a machine group with n
+    machines and k modules per machine uses n*k modules of the budget, counting whole machines, so the machine counts
+    of the allocation never use more modules than the budget.
+
+    The allocation is found by branch and bound: relaxations in which machine groups may mix machines with different
+    numbers of modules and machines are counted fractionally bound the rate of all allocations below them, and all
+    children of a batch of nodes are solved in parallel. The rate of an allocation counting whole machines is found
+    with a mixed integer linear program.
+
+    :param factory: the factory containing the output point
+    :param output_point: the output point to maximize
+    :param module: the kind of module to allocate
+    :param budget: the number of modules available
+    :param machine_groups: the machine groups which can receive modules, by default all machine groups which supply
+    the output point and accept the module
+    :param max_solves: the maximal number of relaxations to solve, after which the best allocation found is returned
+    :param jobs: the number of worker processes, by default the number of cpus. With one job everything is solved in
+    this process
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    if machine_groups is None:
+        machine_groups = factory.compile(output_point).machine_groups
+    machine_groups = [group for group in machine_groups if supports_module(group.machine_type, module)]
+    if not machine_groups:
+        raise ValueError(f"None of the machine groups accepts {module.name.lower()}s.")
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    problem, relaxation, max_levels = _build_relaxation(factory, output_point, machine_groups, module, budget)
+
+    root_levels = (-1,)*len(machine_groups)
+    root_rate, root_branch, rounded, rounded_rate, num_solves = relaxation.evaluate(root_levels)
+    if root_rate == float("inf"):
+        raise FactoryAnalysisException("Cannot allocate modules for an infinite output rate.")
+    solution = problem.solve()
+    base_rate = float("inf") if solution is None else solution.rate
+    best_levels = (0,)*len(machine_groups)
+    best_rate = relaxation.solve(best_levels, whole_machines=True)[0]
+    num_solves += 1
+    if rounded_rate > best_rate:
+        best_rate, best_levels = rounded_rate, rounded
+    # nodes are (minus bound, counter, levels, group to branch on)
+    queue: list[tuple[float, int, tuple[int, ...], int]] = []
+    if root_branch >= 0:
+        queue.append((-root_rate, 0, root_levels, root_branch))
+    counter = 1
+    executor = ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(relaxation,)) if jobs > 1 else None
+    try:
+        while queue and num_solves < max_solves:
+            batch = []
+            while queue and len(batch) < 2*jobs:
+                node = heapq.heappop(queue)
+                if -node[0] > best_rate*(1.+1e-9)+1e-12:
+                    batch.append(node)
+            children = []
+            for _, _, levels, branch in batch:
+                for level in range(max_levels[branch]+1):
+                    children.append(levels[:branch]+(level,)+levels[branch+1:])
+            if executor is None:
+                outcomes = [relaxation.evaluate(levels) for levels in children]
+            else:
+                outcomes = list(executor.map(_evaluate_in_worker, children, chunksize=max(1, len(children)//jobs)))
+            for levels, (bound, branch, rounded, rounded_rate, solves) in zip(children, outcomes):
+                num_solves += solves
+                if rounded_rate > best_rate:
+                    best_rate, best_levels = rounded_rate, rounded
+                if branch >= 0 and bound > best_rate*(1.+1e-9)+1e-12:
+                    heapq.heappush(queue, (-bound, counter, levels, branch))
+                    counter += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    optimal = all(-bound <= best_rate*(1.+1e-9)+1e-12 for bound, _, _, _ in queue)
+
+    _, rates, _ = relaxation.solve(best_levels, whole_machines=True)
+    machine_counts = {}
+    for group, level, group_rates in zip(machine_groups, best_levels, rates):
+        machines_per_rate = with_modules(group.machine_type, (module,)*level).machines_per_rate
+        # the integer program rounds within its feasibility tolerance
+        machine_counts[group] = ceil(group_rates[level]*machines_per_rate-1e-6)
+    return ModuleAllocation(
+        output_point, module, best_rate, base_rate,
+        dict(zip(machine_groups, best_levels)), machine_counts, optimal, num_solves
+    )
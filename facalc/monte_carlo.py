@@ -0,0 +1,148 @@
+from __future__ import annotations
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Iterable
+from facalc.factories import _Factory, SubFactory, OutputPoint, Source, Bottleneck, NumericProblem, LinearProblem
+from facalc.shared_problems import SharedProblems, SharedProblemsHandle, attach
+
+
+# a distribution is either a frozen scipy.stats distribution or a function taking a numpy generator and a sample count
+Distribution = Any
+
+
+def sample_distribution(distribution: Distribution, rng: np.random.Generator, num_samples: int) -> np.ndarray:
+    if hasattr(distribution, "rvs"):
+        samples = distribution.rvs(size=num_samples, random_state=rng)
+    else:
+        samples = distribution(rng, num_samples)
+    samples = np.asarray(samples, dtype=float).reshape(num_samples)
+    return np.maximum(samples, 0.)
+
+
+@dataclass(frozen=True)
+class MonteCarloResults:
+    """
+    The maximal rate of an output point for every sample of the source rates, and for every sample which caps are
+    binding at that rate.
+    """
+    output_point: OutputPoint
+    caps: tuple[Bottleneck, ...]
+    result_rates: np.ndarray
+    binding: np.ndarray
+
+    def percentiles(self, q: float | Iterable[float]) -> np.ndarray:
+        return np.percentile(self.result_rates, q if isinstance(q, float | int) else list(q))
+
+    @property
+    def binding_frequencies(self) -> dict[Bottleneck, float]:
+        """ the fraction of the samples in which each cap binds, for the caps which bind at least once """
+        frequencies = self.binding.mean(axis=0)
+        return {cap: float(frequency) for cap, frequency in zip(self.caps, frequencies) if frequency > 0.}
+
+    def display(self, percentiles: Iterable[float] = (5., 50., 95.)) -> str:
+        percentiles = tuple(percentiles)
+        values = self.percentiles(percentiles)
+        lines = [", ".join(f"p{q:g}: {value:.2f}/s" for q, value in zip(percentiles, values)),
+                 " -- binding frequency -- "]
+        for cap, frequency in sorted(self.binding_frequencies.items(), key=lambda item: -item[1]):
+            lines.append(f"{100*frequency:.1f}% {cap.display()}")
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class MonteCarloAnalysisResults:
+    sources: tuple[Source, ...]
+    source_rates: np.ndarray
+    single_results: dict[OutputPoint, MonteCarloResults]
+
+    def display(self, percentiles: Iterable[float] = (5., 50., 95.)) -> str:
+        percentiles = tuple(percentiles)
+        lines = [" -- output rate percentiles -- "]
+        for output_point, results in self.single_results.items():
+            values = results.percentiles(percentiles)
+            lines.append(f"{output_point.material}: "
+                         + ", ".join(f"p{q:g} {value:.2f}/s" for q, value in zip(percentiles, values)))
+        return "\n".join(lines)
+
+
+_worker_problems: list[NumericProblem] = []
+
+
+def _init_worker(handle: SharedProblemsHandle):
+    global _worker_problems
+    # solving for many bounds at once works on dense matrices, so each worker expands the shared ones once
+    _worker_problems = [problem.dense() for problem in attach(handle)]
+
+
+def _solve_samples_in_worker(task: tuple[int, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    index, bounds = task
+    return _worker_problems[index].solve_rates(bounds)
+
+
+def monte_carlo(factory: _Factory | SubFactory, distributions: dict[Source, Distribution], num_samples: int,
+                output_points: Iterable[OutputPoint] | None = None, seed: int | None = None,
+                jobs: int | None = None, chunk_size: int = 2500) -> MonteCarloAnalysisResults:
+    """
+    Analyses output points for random maximal rates of sources. Every output point is compiled once, and the samples
+    only change the bounds of the source caps, so the problems are solved in chunks by worker processes which attach to
+    the compiled problems in shared memory and are only sent the bounds, reusing optimal bases within a chunk (see
+    NumericProblem.solve_rates). All output points see the same samples.
+
+    :param factory: the (sub)factory to analyse
+    :param distributions: the distribution of the maximal rate of each uncertain source, either a frozen scipy.stats
+    distribution or a function taking a numpy generator and a number of samples. Negative samples are set to zero
+    :param num_samples: the number of samples
+    :param output_points: the output points to analyse, by default those of the given sub factory
+    :param seed: the seed of the random number generator
+    :param jobs: the number of worker processes, by default the number of cpus. With one job everything is solved in
+    this process
+    :param chunk_size: the number of samples solved per task
+    """
+    if output_points is None:
+        if not isinstance(factory, SubFactory):
+            raise ValueError("Output points need to be specified when not passing a sub factory.")
+        output_points = factory._output_points
+    output_points = tuple(output_points)
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    rng = np.random.default_rng(seed)
+    sources = tuple(distributions.keys())
+    source_rates = np.stack([sample_distribution(distributions[source], rng, num_samples) for source in sources]
+                            ) if sources else np.zeros((0, num_samples))
+
+    problems: list[LinearProblem] = []
+    bounds: list[np.ndarray] = []
+    for output_point in output_points:
+        problem, rows = factory.compile(output_point).with_source_caps(sources)
+        problem_bounds = np.tile(problem.inequalities_bounds, (num_samples, 1))
+        for k, source in enumerate(sources):
+            if source in rows:
+                problem_bounds[:, rows[source]] = source_rates[k]
+        problems.append(problem)
+        bounds.append(problem_bounds)
+
+    tasks = [(index, problem_bounds[start:start+chunk_size])
+             for index, problem_bounds in enumerate(bounds) for start in range(0, num_samples, chunk_size)]
+    numeric_problems = [problem.numeric for problem in problems]
+    if jobs > 1:
+        with SharedProblems(numeric_problems) as shared, ProcessPoolExecutor(
+                jobs, initializer=_init_worker, initargs=(shared.handle,)) as executor:
+            outcomes = list(executor.map(_solve_samples_in_worker, tasks))
+    else:
+        outcomes = [numeric_problems[index].solve_rates(task_bounds) for index, task_bounds in tasks]
+
+    single_results: dict[OutputPoint, MonteCarloResults] = {}
+    for index, (output_point, problem) in enumerate(zip(output_points, problems)):
+        chunks = [outcome for (task_index, _), outcome in zip(tasks, outcomes) if task_index == index]
+        single_results[output_point] = MonteCarloResults(
+            output_point,
+            problem.caps,
+            np.concatenate([rates for rates, binding in chunks]),
+            np.concatenate([binding for rates, binding in chunks])
+        )
+    return MonteCarloAnalysisResults(sources, source_rates, single_results)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import itertools
+import numpy as np
+import scipy.spatial
+from dataclasses import dataclass, replace
+from typing import Sequence
+from facalc.factories import (_Factory, SubFactory, OutputPoint, NumericProblem, FactoryAnalysisException,
+                              _append_row)
+from facalc.simplex import WarmSimplex
+
+
+@dataclass(frozen=True)
+class ParetoFrontier:
+    """
+    The Pareto frontier of output points which compete for the same inputs: the combinations of rates for which no
+    rate can be raised without lowering another. The frontier is piecewise linear, the breakpoints are its vertices and
+    every facet is the convex hull of some of them. For two output points the facets are the segments between
+    consecutive breakpoints.
+    """
+    output_points: tuple[OutputPoint, ...]
+    # the breakpoints with shape (breakpoint, output point), sorted by decreasing rate of the first output point
+    rates: np.ndarray
+    # the indices of the breakpoints of every facet with shape (facet, output point), padded with -1 for facets with
+    # fewer breakpoints, and the weights of the output points for which the facet is optimal
+    facets: np.ndarray
+    weights: np.ndarray
+    num_solves: int
+
+    @property
+    def max_rates(self) -> np.ndarray:
+        """ the maximal rate of every output point on its own """
+        return self.rates.max(axis=0)
+
+    def trade_off(self, rates: float | np.ndarray) -> np.ndarray:
+        """
+        For two output points, returns the maximal rate of the second output point for given rates of the first one,
+        interpolating between the breakpoints, and nan for rates above the maximal rate of the first one.
+        """
+        if len(self.output_points) != 2:
+            raise ValueError("Trade offs are only defined between two output points.")
+        first, second = self.rates[::-1, 0], self.rates[::-1, 1]
+        rates = np.asarray(rates, dtype=float)
+        # below the breakpoint with the highest second rate, lowering the first rate does not help the second one
+        result = np.interp(rates, first, second, left=second[0], right=np.nan)
+        return np.where(rates > first[-1]+1e-9, np.nan, result)
+
+    def display(self) -> str:
+        lines = [" -- pareto frontier -- ", ", ".join(output_point.material for output_point in self.output_points)]
+        for rates in self.rates:
+            lines.append(", ".join(f"{rate:.2f}/s" for rate in rates))
+        return "\n".join(lines)
+
+
+class _ParametricProblem:
+    """
+    The joint problem of some output points with a changing objective on their rates. Every solve starts a simplex
+    method from the optimal basis of the previous one, as only the objective changes, falling back to solving from
+    scratch on numerical trouble.
+    """
+    def __init__(self, problem: NumericProblem, num_outputs: int):
+        self.problem = problem.dense()
+        self.num_outputs = num_outputs
+        self.num_solves = 0
+        solution = self.problem.solve()
+        self.num_solves += 1
+        if solution is None:
+            raise FactoryAnalysisException("The rate of an output point is unbounded, so there is no Pareto frontier.")
+        self.simplex: WarmSimplex | None
+        try:
+            self.simplex = self.problem.warm_simplex(solution)
+        except np.linalg.LinAlgError:
+            self.simplex = None
+
+    def objective(self, weights: np.ndarray) -> np.ndarray:
+        objective = np.zeros(len(self.problem.objective), float)
+        objective[:self.num_outputs] = weights
+        return objective
+
+    def maximize(self, weights: np.ndarray, then: np.ndarray) -> np.ndarray:
+        """
+        Maximizes the weighted sum of the rates of the output points, and among the optimal solutions the weighted sum
+        with the second weights, returning the rates of the output points.
+        """
+        self.num_solves += 1
+        first, second = self.objective(weights), self.objective(then)
+        if self.simplex is not None:
+            try:
+                if not self.simplex.maximize(first):
+                    raise FactoryAnalysisException("The rate of an output point is unbounded, so there is no Pareto "
+                                                   "frontier.")
+                full = np.concatenate((first, np.zeros(len(self.simplex.objective)-len(first))))
+                tolerance = 1e-9*max(1., np.max(np.abs(first)))
+                self.simplex.maximize(second, np.abs(self.simplex.reduced_costs(full)) <= tolerance)
+                return self.simplex.solution()[:self.num_outputs].copy()
+            except np.linalg.LinAlgError:
+                self.simplex = None
+        # trash rates do not matter for the rates of the output points
+        problem = replace(self.problem, num_trash_points=0)
+        solution = replace(problem, objective=first).solve()
+        if solution is None:
+            raise FactoryAnalysisException("The rate of an output point is unbounded, so there is no Pareto frontier.")
+        # keep the first objective at its optimum, up to rounding, while maximizing the second
+        solution = replace(
+            problem, objective=second,
+            inequalities_matrix=_append_row(self.problem.inequalities_matrix, -first),
+            inequalities_bounds=np.append(self.problem.inequalities_bounds,
+                                          -(solution.rate-1e-9*max(1., abs(solution.rate))))
+        ).solve()
+        if solution is None:
+            raise FactoryAnalysisException("Failed to solve the linear programming problem somehow.")
+        return solution.x[:self.num_outputs].copy()
+
+
+def _upper_facets(points: np.ndarray) -> list[tuple[tuple[int, ...], np.ndarray]]:
+    """
+    Returns the facets of the convex hull of the points and of everything below them, as far as they are orthogonal to
+    non-negative weights, given by the indices of the points on them and the weights normalized to sum to one.
+    """
+    num_points, num_outputs = points.shape
+    # lowering rates to zero adds the points below the given ones, so the hull has full dimension
+    masks = np.array(list(itertools.product((0., 1.), repeat=num_outputs))[:-1])
+    lowered = (masks[:, None, :]*points[None, :, :]).reshape(-1, num_outputs)
+    tolerance = 1e-9*max(1., float(np.max(points)))
+    distinct = np.min(np.max(np.abs(lowered[:, None, :]-points[None, :, :]), axis=2), axis=1) > tolerance
+    hull = scipy.spatial.ConvexHull(np.concatenate((points, lowered[distinct])))
+    facets = []
+    for simplex, equation in zip(hull.simplices, hull.equations):
+        normal = equation[:-1]
+        if np.any(normal < -1e-9) or np.sum(normal) <= 1e-9:
+            continue
+        indices = tuple(sorted(int(i) for i in simplex if i < num_points))
+        weights = np.maximum(normal, 0.)
+        facets.append((indices, weights/weights.sum()))
+    return facets
+
+
+def pareto_frontier(factory: _Factory | SubFactory, output_points: Sequence[OutputPoint],
+                    max_solves: int = 500) -> ParetoFrontier:
+    """
+    Computes the Pareto frontier between the rates of output points which take output at the same time. The joint
+    problem of the output points is compiled once, after which only the weights of the output rates in its objective
+    change, see _Factory.compile_joint.
+
+    The breakpoints are found adaptively: starting with the maximal rate of every output point on its own, the facets
+    of the convex hull of the breakpoints found so far are computed, and the rates are maximized with the weights
+    orthogonal to every facet which was not checked yet. A point beyond the facet is a new breakpoint, otherwise the
+    facet is part of the frontier. This repeats until no new breakpoints are found, which for two output points takes
+    about two solves per breakpoint. The convex hull also contains the points with some rates lowered to zero, whose
+    number grows as two to the power of the number of output points, so this is meant for a few output points.
+
+    :param factory: the (sub)factory
+    :param output_points: the two or more output points
+    :param max_solves: the maximal number of linear programming problems to solve, after which the facets which are
+    left are taken as part of the frontier
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    output_points = tuple(output_points)
+    num_outputs = len(output_points)
+    if num_outputs < 2:
+        raise ValueError("A Pareto frontier needs at least two output points.")
+    if len(set(output_points)) != num_outputs:
+        raise ValueError("The output points should be distinct.")
+    parametric = _ParametricProblem(factory.compile_joint(output_points).numeric, num_outputs)
+
+    # the maximal rate of every output point, with the other rates as high as possible
+    extremes: list[np.ndarray] = []
+    checked: list[np.ndarray] = []
+    for k in range(num_outputs):
+        weights = np.zeros(num_outputs, float)
+        weights[k] = 1.
+        checked.append(weights)
+        extremes.append(np.maximum(parametric.maximize(weights, 1.-weights), 0.))
+    # rates within the tolerance are the same, which absorbs the rounding errors of the solves
+    tolerance = 1e-7*max(1., float(np.max(extremes)))
+    points: list[np.ndarray] = []
+
+    def add(point: np.ndarray) -> bool:
+        if any(np.all(np.abs(point-other) <= tolerance) for other in points):
+            return False
+        points.append(point)
+        return True
+
+    for point in extremes:
+        add(point)
+    # output points which can never take output do not span a dimension of the frontier
+    active = np.max(points, axis=0) > tolerance
+
+    facets: list[tuple[tuple[int, ...], np.ndarray]] = []
+    while np.sum(active) > 1:
+        facets = []
+        new_points = []
+        for facet, active_weights in _upper_facets(np.array(points)[:, active]):
+            weights = np.zeros(num_outputs, float)
+            weights[active] = active_weights
+            facets.append((facet, weights))
+            if any(np.allclose(weights, other, rtol=0., atol=1e-9) for other in checked) \
+                    or parametric.num_solves >= max_solves:
+                continue
+            checked.append(weights)
+            point = parametric.maximize(weights, np.ones(num_outputs))
+            if weights.dot(point) > max(weights.dot(other) for other in points)+tolerance:
+                new_points.append(np.maximum(point, 0.))
+        if not [point for point in new_points if add(point)]:
+            break
+    if np.sum(active) <= 1:
+        facets = [((int(np.argmax(np.sum(points, axis=1))),), active/max(1., np.sum(active)))]
+
+    # keep only the breakpoints which are not dominated by another one, ordered by decreasing first rate
+    rates = np.array(points)
+    dominated = np.array([np.any(np.all(rates >= rate-tolerance, axis=1) & np.any(rates > rate+tolerance, axis=1))
+                          for rate in rates])
+    vertices = {i for facet, _ in facets for i in facet}
+    order = [int(i) for i in np.lexsort(-np.round(rates/tolerance).T[::-1]) if i in vertices and not dominated[i]]
+    new_indices = {old: new for new, old in enumerate(order)}
+    # facets of rates which do not all matter, such as those of zero weight, shrink to the breakpoints on them
+    kept: dict[tuple[int, ...], np.ndarray] = {}
+    for facet, weights in facets:
+        kept.setdefault(tuple(sorted(new_indices[i] for i in facet if i in new_indices)), weights)
+    kept = {facet: weights for facet, weights in sorted(kept.items(), key=lambda item: item[0])
+            if facet and not any(set(facet) < set(other) for other in kept)}
+    return ParetoFrontier(
+        output_points,
+        rates[order],
+        np.array([list(facet)+[-1]*(num_outputs-len(facet)) for facet in kept], dtype=int).reshape(-1, num_outputs),
+        np.array(list(kept.values()), dtype=float).reshape(-1, num_outputs),
+        parametric.num_solves
+    )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import math
+from dataclasses import dataclass
+from typing import Iterable
+from facalc.factories import (_Factory, SubFactory, FactoryNode, OutputPoint, Source, Buffer, MachineGroup, MachineType,
+                              Bottleneck, SourceRateCap, BufferRateCap, MachineRateCap, OutputPointRateCap)
+
+
+@dataclass(frozen=True)
+class RateBounds:
+    """
+    Upper bounds on the rates of the nodes of a factory which hold in every solution of every linear programming
+    problem of the factory: the rate of each source, the throughput of each buffer line and the rate of each machine
+    group. They are found by propagating the caps of sources, buffers and machine groups along the connections through
+    the recipe ratios, see rate_bounds, so no linear programming problem is solved.
+    """
+    source_rates: dict[Source, float]
+    buffer_throughput: dict[tuple[Buffer, str], float]
+    machine_rates: dict[MachineGroup, float]
+    machine_types: dict[MachineGroup, MachineType]
+    output_caps: dict[OutputPoint, float | None]
+
+    def outflow(self, node: FactoryNode, material: str) -> float:
+        """ an upper bound on the rate at which a node supplies a material to all nodes it is connected to """
+        if isinstance(node, Source):
+            return self.source_rates[node] if node.material == material else 0.
+        if isinstance(node, Buffer):
+            return self.buffer_throughput.get((node, material), 0.)
+        if isinstance(node, MachineGroup):
+            output_rate = self.machine_types[node].output_rates.get(material, 0.)
+            return 0. if output_rate == 0. else self.machine_rates[node]*output_rate
+        return 0.
+
+    def output_point(self, output_point: OutputPoint) -> float:
+        """ an upper bound on the maximal rate of an output point """
+        bound = self.outflow(output_point.location, output_point.material)
+        cap = self.output_caps.get(output_point, output_point.max_rate)
+        return bound if cap is None else min(bound, cap)
+
+    def can_reach(self, output_point: OutputPoint, rate: float) -> bool:
+        """ False if the output point can certainly not reach the rate, such that a search can skip it """
+        return self.output_point(output_point) >= rate
+
+
+def rate_bounds(factory: _Factory | SubFactory, caps: dict[Bottleneck, float | None] | None = None,
+                machine_types: dict[MachineGroup, MachineType] | None = None, max_sweeps: int = 100) -> RateBounds:
+    """
+    Computes upper bounds on the rates of all nodes of a factory without solving any linear programming problem. A
+    machine group runs at most as fast as its cap and as the supply of each of its inputs allows, a buffer line passes
+    at most its cap and what its suppliers can deliver, and a source supplies at most its maximal rate.
+
+    Starting from infinite bounds, these rules are applied to all nodes until the bounds no longer change. Every sweep
+    keeps the bounds valid, so cycles through which they keep shrinking, which can happen for productivity loops, are
+    cut off after max_sweeps sweeps. The bounds ignore that byproducts have to go somewhere, so they can be far above
+    the true rates, but they are never below them.
+
+    :param factory: the (sub)factory
+    :param caps: bounds replacing those of the factory, None to remove a cap, as in the patches of scenarios
+    :param machine_types: machine types replacing those of machine groups, such as the same type with other modules
+    :param max_sweeps: the maximal number of sweeps over all nodes
+    """
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    factory.build()
+    caps = caps or {}
+    machine_types = machine_types or {}
+
+    def cap_of(cap: Bottleneck, default: float | None) -> float:
+        bound = caps.get(cap, default)
+        return math.inf if bound is None else float(bound)
+
+    bounds = RateBounds({}, {}, {}, {}, {cap.output_point: bound for cap, bound in caps.items()
+                                         if isinstance(cap, OutputPointRateCap)})
+    buffer_lines: list[tuple[Buffer, str, float]] = []
+    machine_groups: list[tuple[MachineGroup, float]] = []
+    for node in factory.nodes:
+        if isinstance(node, Source):
+            bounds.source_rates[node] = cap_of(SourceRateCap(node), node.max_rate)
+        elif isinstance(node, Buffer):
+            for material in node.input_materials:
+                cap = cap_of(BufferRateCap(node, material), node.rate_caps.get(material))
+                buffer_lines.append((node, material, cap))
+                bounds.buffer_throughput[(node, material)] = cap
+        elif isinstance(node, MachineGroup):
+            bounds.machine_types[node] = machine_types.get(node, node.machine_type)
+            cap = cap_of(MachineRateCap(node), node.machine_cap)
+            machine_groups.append((node, cap))
+            bounds.machine_rates[node] = cap
+
+    def supply(node: FactoryNode, material: str) -> float:
+        return sum((bounds.outflow(supplier, material) for supplier in node.inputs(material)), start=0.)
+
+    for _ in range(max_sweeps):
+        changed = False
+        for buffer, material, cap in buffer_lines:
+            bound = min(cap, supply(buffer, material))
+            if bound < bounds.buffer_throughput[(buffer, material)]*(1.-1e-12):
+                changed = True
+            bounds.buffer_throughput[(buffer, material)] = min(bound, bounds.buffer_throughput[(buffer, material)])
+        for machine_group, cap in machine_groups:
+            bound = cap
+            for material, input_rate in bounds.machine_types[machine_group].input_rates.items():
+                if input_rate > 0.:
+                    bound = min(bound, supply(machine_group, material)/input_rate)
+            if bound < bounds.machine_rates[machine_group]*(1.-1e-12):
+                changed = True
+            bounds.machine_rates[machine_group] = min(bound, bounds.machine_rates[machine_group])
+        if not changed:
+            break
+    return bounds
+
+
+def output_rate_bounds(factory: _Factory | SubFactory, output_points: Iterable[OutputPoint] | None = None,
+                       caps: dict[Bottleneck, float | None] | None = None,
+                       machine_types: dict[MachineGroup, MachineType] | None = None) -> dict[OutputPoint, float]:
+    """
+    Returns an upper bound on the maximal rate of every output point, see rate_bounds.
+
+    :param output_points: the output points, by default those of the given sub factory
+    """
+    if output_points is None:
+        if not isinstance(factory, SubFactory):
+            raise ValueError("Output points need to be specified when not passing a sub factory.")
+        output_points = factory._output_points
+    bounds = rate_bounds(factory, caps, machine_types)
+    return {output_point: bounds.output_point(output_point) for output_point in output_points}
@@ -0,0 +1,351 @@
+from __future__ import annotations
+import os
+import numpy as np
+from typing import Iterable, Sequence
+from facalc.factories import (_Factory, SubFactory, FactoryNode, Source, Buffer, MachineGroup, TrashPoint, OutputPoint,
+                              FactoryRates, FullAnalysisResults, LinearProblem, LinearSolution)
+
+
+SOURCE_KIND = "source"
+BUFFER_KIND = "buffer"
+MACHINE_KIND = "machine"
+TRASH_KIND = "trash"
+
+# a node key identifies one column of the node axis: (kind, index of the node in the factory, material)
+NodeKey = tuple[str, int, str]
+
+
+def _factory_of(factory: _Factory | SubFactory) -> _Factory:
+    return factory.factory if isinstance(factory, SubFactory) else factory
+
+
+def factory_node_keys(factory: _Factory | SubFactory) -> list[NodeKey]:
+    """
+    Returns the node axis of a factory: one key per source, buffer line, machine group and trash point, in the order
+    in which the nodes were added to the factory.
+    """
+    keys: list[NodeKey] = []
+    for i, node in enumerate(_factory_of(factory).nodes):
+        if isinstance(node, Source):
+            keys.append((SOURCE_KIND, i, node.material))
+        elif isinstance(node, Buffer):
+            keys.extend((BUFFER_KIND, i, material) for material in node.input_materials)
+        elif isinstance(node, MachineGroup):
+            keys.append((MACHINE_KIND, i, ""))
+        elif isinstance(node, TrashPoint):
+            keys.append((TRASH_KIND, i, node.material))
+    return keys
+
+
+class ResultsStore:
+    """
+    Columnar storage of analysis results for many scenarios of the same factory structure.
+
+    Rates are kept in one array of shape (scenario, output point, node key) and the optimal rates in one array of shape
+    (scenario, output point). Nodes are referred to by their index in the factory, so a store can be written to disk and
+    read back without the factory, and bound to a (rebuilt) factory afterwards with bind.
+    """
+    def __init__(
+            self,
+            node_keys: Sequence[NodeKey],
+            output_keys: Sequence[tuple[int, str]],
+            scenario_names: Sequence[str] = (),
+            result_rates: np.ndarray | None = None,
+            rates: np.ndarray | None = None,
+            dtype: type | np.dtype = np.float64,
+            capacity: int = 16
+    ):
+        self.node_keys: tuple[NodeKey, ...] = tuple((str(k), int(i), str(m)) for k, i, m in node_keys)
+        self.output_keys: tuple[tuple[int, str], ...] = tuple((int(i), str(m)) for i, m in output_keys)
+        self._node_columns = {key: j for j, key in enumerate(self.node_keys)}
+        self._output_rows = {key: j for j, key in enumerate(self.output_keys)}
+        self._scenario_names: list[str] = [str(name) for name in scenario_names]
+        self._scenario_rows = {name: j for j, name in enumerate(self._scenario_names)}
+        if result_rates is None or rates is None:
+            capacity = max(capacity, len(self._scenario_names))
+            result_rates = np.zeros((capacity, len(self.output_keys)), dtype)
+            rates = np.zeros((capacity, len(self.output_keys), len(self.node_keys)), dtype)
+        self._result_rates = result_rates
+        self._rates = rates
+        self._factory: _Factory | None = None
+        self._node_indices: dict[FactoryNode, int] = {}
+
+    @classmethod
+    def for_factory(cls, factory: _Factory | SubFactory, output_points: Iterable[OutputPoint] | None = None,
+                    dtype: type | np.dtype = np.float64, capacity: int = 16) -> ResultsStore:
+        """
+        Creates an empty store with the node axis of the given factory.
+
+        :param factory: the factory whose results will be stored
+        :param output_points: the output points to store, by default all output points of the given (sub)factory
+        :param dtype: the floating point type of the stored rates, float32 halves the memory usage
+        :param capacity: the number of scenarios to allocate space for initially
+        """
+        if output_points is None:
+            if not isinstance(factory, SubFactory):
+                raise ValueError("Output points need to be specified when not passing a sub factory.")
+            output_points = factory._output_points
+        node_indices = {node: i for i, node in enumerate(_factory_of(factory).nodes)}
+        output_keys = []
+        for output_point in output_points:
+            if output_point.location not in node_indices:
+                raise ValueError(f"Location of {output_point} is not part of the factory.")
+            output_keys.append((node_indices[output_point.location], output_point.material))
+        store = ResultsStore(factory_node_keys(factory), output_keys, dtype=dtype, capacity=capacity)
+        store.bind(factory)
+        return store
+
+    @classmethod
+    def from_full_results(cls, factory: _Factory | SubFactory, results: dict[str, FullAnalysisResults],
+                          dtype: type | np.dtype = np.float64) -> ResultsStore:
+        store = cls.for_factory(factory, dtype=dtype, capacity=len(results))
+        for name, full_results in results.items():
+            store.add_scenario(name, full_results)
+        return store
+
+    def bind(self, factory: _Factory | SubFactory):
+        """
+        Binds the store to a factory such that nodes and output points can be used to index the store.
+        """
+        self._factory = _factory_of(factory)
+        self._node_indices = {node: i for i, node in enumerate(self._factory.nodes)}
+
+    @property
+    def num_scenarios(self) -> int:
+        return len(self._scenario_names)
+
+    @property
+    def scenario_names(self) -> tuple[str, ...]:
+        return tuple(self._scenario_names)
+
+    @property
+    def result_rates(self) -> np.ndarray:
+        """ the optimal rates with shape (scenario, output point) """
+        return self._result_rates[:self.num_scenarios]
+
+    @property
+    def rates(self) -> np.ndarray:
+        """ the rates of all nodes with shape (scenario, output point, node key) """
+        return self._rates[:self.num_scenarios]
+
+    def _grow(self, capacity: int):
+        if not self._rates.flags.writeable:
+            raise ValueError("Cannot add scenarios to a store that was loaded read-only.")
+        result_rates = np.zeros((capacity,)+self._result_rates.shape[1:], self._result_rates.dtype)
+        rates = np.zeros((capacity,)+self._rates.shape[1:], self._rates.dtype)
+        result_rates[:self.num_scenarios] = self.result_rates
+        rates[:self.num_scenarios] = self.rates
+        self._result_rates = result_rates
+        self._rates = rates
+
+    def _node_key(self, item: Source | tuple[Buffer, str] | MachineGroup | TrashPoint) -> NodeKey:
+        if self._factory is None:
+            raise ValueError("The store needs to be bound to a factory to index it with nodes.")
+        if isinstance(item, tuple):
+            buffer, material = item
+            return BUFFER_KIND, self._node_indices[buffer], material
+        if isinstance(item, Source):
+            return SOURCE_KIND, self._node_indices[item], item.material
+        if isinstance(item, MachineGroup):
+            return MACHINE_KIND, self._node_indices[item], ""
+        if isinstance(item, TrashPoint):
+            return TRASH_KIND, self._node_indices[item], item.material
+        raise TypeError(f"Cannot index a results store with {item}.")
+
+    def node_column(self, item: Source | tuple[Buffer, str] | MachineGroup | TrashPoint) -> int:
+        return self._node_columns[self._node_key(item)]
+
+    def output_row(self, output_point: OutputPoint) -> int:
+        if self._factory is None:
+            raise ValueError("The store needs to be bound to a factory to index it with output points.")
+        return self._output_rows[(self._node_indices[output_point.location], output_point.material)]
+
+    def scenario_row(self, scenario: str | int) -> int:
+        if isinstance(scenario, str):
+            return self._scenario_rows[scenario]
+        if not -self.num_scenarios <= scenario < self.num_scenarios:
+            raise IndexError(f"Scenario index {scenario} out of range.")
+        return scenario % self.num_scenarios
+
+    def add_scenario(self, name: str, results: FullAnalysisResults):
+        """
+        Appends the results of one full analysis as a new scenario. Output points which were not analysed are stored
+        with zero rates.
+        """
+        if name in self._scenario_rows:
+            raise ValueError(f"Scenario '{name}' is already in the store.")
+        if self.num_scenarios == self._rates.shape[0]:
+            self._grow(max(1, 2*self._rates.shape[0]))
+        row = self.num_scenarios
+        self._result_rates[row] = 0.
+        self._rates[row] = 0.
+        for output_point, single_results in results.single_results.items():
+            output_row = self.output_row(output_point)
+            self._result_rates[row, output_row] = single_results.result_rate
+            rates = single_results.rates
+            for key, rate in (*rates.source_rates.items(), *rates.buffer_throughput.items(),
+                              *rates.machine_rates.items(), *rates.trash_rates.items()):
+                column = self._node_columns.get(self._node_key(key))
+                if column is not None:
+                    self._rates[row, output_row, column] = rate
+        self._scenario_names.append(name)
+        self._scenario_rows[name] = row
+
+    def _rate_matrix(self, problem: LinearProblem) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the columns of the node axis which a problem has rates for, and the matrix which maps the variables of
+        the problem to those rates.
+        """
+        columns, rows = [], []
+
+        def add(item: Source | tuple[Buffer, str] | MachineGroup | TrashPoint, row: np.ndarray):
+            column = self._node_columns.get(self._node_key(item))
+            if column is not None:
+                columns.append(column)
+                rows.append(row)
+
+        for source, vector in problem.source_rate_vectors.items():
+            add(source, vector)
+        for key, vector in problem.buffer_throughput_vectors.items():
+            add(key, vector)
+        identity = np.eye(problem.num_variables)
+        for i, machine_group in enumerate(problem.machine_groups):
+            add(machine_group, identity[problem.machine_groups_start+i])
+        for i, trash_point in enumerate(problem.trash_points):
+            add(trash_point, identity[problem.trash_points_start+i])
+        return np.array(columns, dtype=np.int64), np.array(rows, dtype=float).reshape(-1, problem.num_variables)
+
+    def add_solutions(self, name: str, problems: Sequence[LinearProblem],
+                      solutions: Sequence[LinearSolution | np.ndarray | None]):
+        """
+        Appends a scenario from the solutions of the problems of its output points, without building the rates of
+        every node as dictionaries first. The rates are the same as those add_scenario stores for the results of the
+        solutions, except that trash rates are stored even if they are tiny.
+
+        :param problems: the problem of every analysed output point, other output points are stored with zero rates
+        :param solutions: the solution, or its x vector, of every problem, None if it is unbounded
+        """
+        if len(problems) != len(solutions):
+            raise ValueError("Expected one solution per problem.")
+        if name in self._scenario_rows:
+            raise ValueError(f"Scenario '{name}' is already in the store.")
+        if self.num_scenarios == self._rates.shape[0]:
+            self._grow(max(1, 2*self._rates.shape[0]))
+        row = self.num_scenarios
+        self._result_rates[row] = 0.
+        self._rates[row] = 0.
+        # problems of output points which share a structure, such as those of a scenario, share their matrices
+        matrices: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        for problem, solution in zip(problems, solutions):
+            output_row = self.output_row(problem.output_point)
+            if id(problem) not in matrices:
+                matrices[id(problem)] = self._rate_matrix(problem)
+            columns, matrix = matrices[id(problem)]
+            if solution is None:
+                # as in LinearProblem.infinite_results
+                self._result_rates[row, output_row] = float("inf")
+                for item in (*problem.sources, *problem.buffer_lines, *problem.machine_groups):
+                    column = self._node_columns.get(self._node_key(item))
+                    if column is not None:
+                        self._rates[row, output_row, column] = float("inf")
+                continue
+            if isinstance(solution, LinearSolution):
+                self._result_rates[row, output_row] = solution.rate
+                x = solution.x
+            else:
+                x = np.asarray(solution, dtype=float)
+                self._result_rates[row, output_row] = problem.objective.dot(x)
+            self._rates[row, output_row, columns] = matrix@x
+        self._scenario_names.append(name)
+        self._scenario_rows[name] = row
+
+    def get_rate(self, scenario: str | int, output_point: OutputPoint,
+                 item: Source | tuple[Buffer, str] | MachineGroup | TrashPoint) -> float:
+        return float(self._rates[self.scenario_row(scenario), self.output_row(output_point), self.node_column(item)])
+
+    def get_result_rate(self, scenario: str | int, output_point: OutputPoint) -> float:
+        return float(self._result_rates[self.scenario_row(scenario), self.output_row(output_point)])
+
+    def _to_factory_rates(self, values: np.ndarray) -> FactoryRates:
+        if self._factory is None:
+            raise ValueError("The store needs to be bound to a factory to convert rows to factory rates.")
+        nodes = self._factory.nodes
+        rates = FactoryRates({}, {}, {}, {})
+        for (kind, index, material), value in zip(self.node_keys, values):
+            value = float(value)
+            if kind == SOURCE_KIND:
+                rates.source_rates[nodes[index]] = value
+            elif kind == BUFFER_KIND:
+                rates.buffer_throughput[(nodes[index], material)] = value
+            elif kind == MACHINE_KIND:
+                rates.machine_rates[nodes[index]] = value
+            elif value > 1e-9:
+                rates.trash_rates[nodes[index]] = value
+        return rates
+
+    def get_rates(self, scenario: str | int, output_point: OutputPoint) -> FactoryRates:
+        return self._to_factory_rates(self._rates[self.scenario_row(scenario), self.output_row(output_point)])
+
+    def get_max_rates(self, scenario: str | int) -> FactoryRates:
+        """ the analogue of FullAnalysisResults.max_rates for one scenario """
+        return self._to_factory_rates(self._rates[self.scenario_row(scenario)].max(axis=0, initial=0.))
+
+    def _arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "node_kinds": np.array([k for k, i, m in self.node_keys], dtype=str),
+            "node_indices": np.array([i for k, i, m in self.node_keys], dtype=np.int64),
+            "node_materials": np.array([m for k, i, m in self.node_keys], dtype=str),
+            "output_indices": np.array([i for i, m in self.output_keys], dtype=np.int64),
+            "output_materials": np.array([m for i, m in self.output_keys], dtype=str),
+            "scenario_names": np.array(self._scenario_names, dtype=str),
+            "result_rates": self.result_rates,
+            "rates": self.rates,
+        }
+
+    def save(self, path: str | os.PathLike):
+        """
+        Writes the store to disk. A path ending in '.npz' is written as a single (uncompressed) npz archive, any other
+        path is written as a directory of '.npy' files which can be memory-mapped when loading.
+        """
+        path = os.fspath(path)
+        arrays = self._arrays()
+        if path.endswith(".npz"):
+            np.savez(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike, mmap: bool = True, factory: _Factory | SubFactory | None = None
+             ) -> ResultsStore:
+        """
+        Reads a store written by save. For a directory the rate arrays are memory-mapped read-only unless mmap is
+        False, so only the scenarios which are accessed are actually read from disk. An npz archive is always read
+        completely.
+
+        :param path: the path passed to save
+        :param mmap: whether to memory-map the rate arrays of a directory store
+        :param factory: if given, the store is bound to this factory
+        """
+        path = os.fspath(path)
+        if path.endswith(".npz"):
+            # an npz archive cannot be memory-mapped, so it is read completely and closed
+            with np.load(path, allow_pickle=False) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+            get = arrays.__getitem__
+        else:
+            def get(name: str) -> np.ndarray:
+                large = name in ("rates", "result_rates")
+                return np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap and large else None,
+                               allow_pickle=False)
+        store = ResultsStore(
+            node_keys=zip(get("node_kinds"), get("node_indices"), get("node_materials")),
+            output_keys=zip(get("output_indices"), get("output_materials")),
+            scenario_names=get("scenario_names"),
+            result_rates=get("result_rates"),
+            rates=get("rates")
+        )
+        if factory is not None:
+            store.bind(factory)
+        return store
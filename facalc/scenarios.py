@@ -0,0 +1,229 @@
+from __future__ import annotations
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable
+from facalc.factories import (_Factory, SubFactory, OutputPoint, Source, MachineGroup, MachineType, Bottleneck,
+                              SourceRateCap, LinearProblem, LinearSolution, NumericProblem, SingleAnalysisResults,
+                              FullAnalysisResults)
+from facalc.factorio_machines import Module, module_slots, supports_module, with_modules
+from facalc.rate_bounds import output_rate_bounds
+from facalc.results_store import ResultsStore
+from facalc.shared_problems import SharedProblems, attach_worker, solve_shared
+
+
+BASE_SCENARIO = "base"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    A named variant of a factory, given by patches to the base factory: new bounds of caps, where None removes a cap,
+    new modules of machine groups, replacing their current modules, and new maximal rates of sources.
+    """
+    name: str
+    caps: dict[Bottleneck, float | None] = field(default_factory=dict)
+    modules: dict[MachineGroup, tuple[Module, ...]] = field(default_factory=dict)
+    source_rates: dict[Source, float | None] = field(default_factory=dict)
+
+    @property
+    def cap_patches(self) -> dict[Bottleneck, float | None]:
+        """ the patched caps, with the maximal rates of sources as the bounds of their caps """
+        patches = dict(self.caps)
+        patches.update((SourceRateCap(source), rate) for source, rate in self.source_rates.items())
+        return patches
+
+
+@dataclass(frozen=True)
+class ScenarioComparison:
+    """
+    The results of the same output points for several scenarios of a factory, the base factory first.
+    """
+    output_points: tuple[OutputPoint, ...]
+    scenarios: tuple[Scenario, ...]
+    full_results: dict[str, FullAnalysisResults]
+
+    @property
+    def scenario_names(self) -> tuple[str, ...]:
+        return tuple(scenario.name for scenario in self.scenarios)
+
+    @property
+    def result_rates(self) -> np.ndarray:
+        """ the optimal rates with shape (scenario, output point) """
+        return np.array([[self.full_results[name].single_results[output_point].result_rate
+                          for output_point in self.output_points] for name in self.scenario_names], dtype=float)
+
+    def get(self, scenario: str, output_point: OutputPoint) -> SingleAnalysisResults:
+        return self.full_results[scenario].single_results[output_point]
+
+    def to_store(self, factory: _Factory | SubFactory) -> ResultsStore:
+        """ stores the rates of every scenario, see ResultsStore """
+        store = ResultsStore.for_factory(factory, self.output_points, capacity=len(self.scenarios))
+        for name in self.scenario_names:
+            store.add_scenario(name, self.full_results[name])
+        return store
+
+    def display(self, depth: int = 1) -> str:
+        """
+        Returns a table of the output rates with one column per scenario, followed by tables of the first depth
+        bottlenecks of every output point in every scenario.
+        """
+        def table(cells: list[list[str]]) -> list[str]:
+            rows = [["output", *self.scenario_names]]+[
+                [output_point.material, *row] for output_point, row in zip(self.output_points, cells)]
+            widths = [max(len(row[j]) for row in rows) for j in range(len(rows[0]))]
+            return ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+
+        def rate(value: float) -> str:
+            return "infinite" if value == float("inf") else f"{value:.2f}/s"
+
+        lines = [" -- output rates -- ", *table([[rate(value) for value in column] for column in self.result_rates.T])]
+        for k in range(depth):
+            cells = []
+            for output_point in self.output_points:
+                row = []
+                for name in self.scenario_names:
+                    bottlenecks = self.get(name, output_point).get_bottlenecks(k+1)
+                    row.append(bottlenecks[k][1].display() if len(bottlenecks) > k else "-")
+                cells.append(row)
+            lines.append(f" -- bottleneck {k+1} -- ")
+            lines.extend(table(cells))
+        return "\n".join(lines)
+
+
+def _solve_task(task: NumericProblem | int | tuple[int, np.ndarray]) -> LinearSolution | None:
+    """ solves a problem sent to a worker, or a shared problem with patched bounds, see solve_shared """
+    if isinstance(task, NumericProblem):
+        return task.solve()
+    return solve_shared(task)
+
+
+class ScenarioManager:
+    """
+    Compares scenarios of a factory which share its structure. Every output point of the base factory is compiled
+    once. Patches to caps and source rates only change the bounds of the compiled problems, or add a row for a cap
+    which did not exist yet. Patches to modules change the coefficients of the machine groups, so the output points
+    depending on those machine groups are compiled again, once per distinct combination of modules.
+    """
+    def __init__(self, factory: _Factory | SubFactory, output_points: Iterable[OutputPoint] | None = None):
+        if output_points is None:
+            if not isinstance(factory, SubFactory):
+                raise ValueError("Output points need to be specified when not passing a sub factory.")
+            output_points = factory._output_points
+        self.output_points = tuple(output_points)
+        self.factory = factory.factory if isinstance(factory, SubFactory) else factory
+        self.scenarios: dict[str, Scenario] = {BASE_SCENARIO: Scenario(BASE_SCENARIO)}
+        self._compiled: dict[tuple[int, frozenset], LinearProblem] = {}
+
+    def add(self, name: str, caps: dict[Bottleneck, float | None] | None = None,
+            modules: dict[MachineGroup, tuple[Module, ...]] | None = None,
+            source_rates: dict[Source, float | None] | None = None) -> Scenario:
+        """
+        Adds a scenario.
+
+        :param name: the name of the scenario, which should be unique
+        :param caps: the new bound of every patched cap, None to remove a cap
+        :param modules: the new modules of the machines of every patched machine group
+        :param source_rates: the new maximal rate of every patched source, None for an unlimited source
+        """
+        if name in self.scenarios:
+            raise ValueError(f"There already is a scenario named '{name}'.")
+        scenario = Scenario(name, dict(caps or {}), dict(modules or {}), dict(source_rates or {}))
+        for cap, bound in scenario.cap_patches.items():
+            if bound is not None and bound < 0.:
+                raise ValueError(f"The bound of {cap.display()} in scenario '{name}' should be non-negative.")
+        for machine_group, group_modules in scenario.modules.items():
+            machine_type = machine_group.machine_type
+            if len(group_modules) > module_slots(machine_type):
+                raise ValueError(f"{machine_type.get_cap_description()} in scenario '{name}' has too many modules.")
+            for module in group_modules:
+                if not supports_module(machine_type, module):
+                    raise ValueError(f"{machine_type.get_cap_description()} in scenario '{name}' does not support "
+                                     f"{module.name.lower()}s.")
+        self.scenarios[name] = scenario
+        return scenario
+
+    def base(self, k: int) -> LinearProblem:
+        return self.compiled(k, {})
+
+    def compiled(self, k: int, modules: dict[MachineGroup, tuple[Module, ...]]) -> LinearProblem:
+        """
+        Returns the compiled problem of the k-th output point with the given modules, compiling it only if one of the
+        machine groups is part of the problem and the combination was not compiled before.
+        """
+        if modules:
+            base = self.base(k)
+            modules = {group: group_modules for group, group_modules in modules.items()
+                       if group in base.machine_groups}
+        key = (k, frozenset(modules.items()))
+        if key not in self._compiled:
+            original_types: dict[MachineGroup, MachineType] = {group: group.machine_type for group in modules}
+            try:
+                for group, group_modules in modules.items():
+                    group.machine_type = with_modules(original_types[group], group_modules)
+                self._compiled[key] = self.factory.compile(self.output_points[k])
+            finally:
+                for group, machine_type in original_types.items():
+                    group.machine_type = machine_type
+        return self._compiled[key]
+
+    def patched(self, scenario: Scenario, k: int) -> LinearProblem:
+        """ the problem of the k-th output point in a scenario """
+        problem = self.compiled(k, scenario.modules)
+        patches = scenario.cap_patches
+        return problem.with_caps(patches) if patches else problem
+
+    def upper_bounds(self, name: str) -> dict[OutputPoint, float]:
+        """
+        Returns upper bounds on the rates of the output points in a scenario without solving anything, see
+        output_rate_bounds, such that scenarios which cannot beat the best one found so far can be skipped.
+        """
+        if name not in self.scenarios:
+            raise ValueError(f"There is no scenario named '{name}'.")
+        scenario = self.scenarios[name]
+        machine_types = {machine_group: with_modules(machine_group.machine_type, modules)
+                         for machine_group, modules in scenario.modules.items()}
+        return output_rate_bounds(self.factory, self.output_points, scenario.cap_patches, machine_types)
+
+    def run(self, scenarios: Iterable[str] | None = None, jobs: int | None = 1, max_depth: int | None = None
+            ) -> ScenarioComparison:
+        """
+        Analyses every output point in every scenario.
+
+        :param scenarios: the names of the scenarios to run, by default all of them with the base factory first
+        :param jobs: the number of worker processes, None for the number of cpus. The workers attach to the compiled
+        problems of the base factory in shared memory and are only sent patched bounds, except for problems with patched
+        modules or new caps, which are sent whole. With one job everything is solved in this process
+        :param max_depth: the maximal number of bottlenecks to compute per result, by default the full chain
+        """
+        names = tuple(self.scenarios) if scenarios is None else tuple(scenarios)
+        for name in names:
+            if name not in self.scenarios:
+                raise ValueError(f"There is no scenario named '{name}'.")
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        pairs = [(self.scenarios[name], k) for name in names for k in range(len(self.output_points))]
+        problems = [self.patched(scenario, k) for scenario, k in pairs]
+        if jobs > 1 and len(pairs) > 1:
+            tasks = []
+            for (scenario, k), problem in zip(pairs, problems):
+                base = self.base(k)
+                bounds, new_rows, _, _ = base.patch_bounds(scenario.cap_patches)
+                if self.compiled(k, scenario.modules) is base and not new_rows:
+                    # only bounds are patched, so the worker solves the shared base problem with the patched bounds
+                    tasks.append((k, bounds))
+                else:
+                    tasks.append(problem.numeric)
+            with SharedProblems([self.base(k).numeric for k in range(len(self.output_points))]) as shared, \
+                    ProcessPoolExecutor(min(jobs, len(tasks)), initializer=attach_worker,
+                                        initargs=(shared.handle,)) as executor:
+                solutions = list(executor.map(_solve_task, tasks))
+            results = [problem.results_from(solution, max_depth) for problem, solution in zip(problems, solutions)]
+        else:
+            results = [problem.analyse(max_depth) for problem in problems]
+        full_results = {}
+        for i, name in enumerate(names):
+            single_results = results[i*len(self.output_points):(i+1)*len(self.output_points)]
+            full_results[name] = FullAnalysisResults.from_single_analyses(zip(self.output_points, single_results))
+        return ScenarioComparison(self.output_points, tuple(self.scenarios[name] for name in names), full_results)
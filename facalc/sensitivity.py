@@ -0,0 +1,104 @@
+from __future__ import annotations
+import numpy as np
+import scipy
+from dataclasses import dataclass
+from typing import Iterable
+from facalc.factories import (_Factory, SubFactory, Bottleneck, SourceRateCap, MachineRateCap, BufferRateCap,
+                              OutputPoint, Source, Buffer, MachineGroup, solve_problems)
+
+
+def factory_caps(factory: _Factory) -> list[Bottleneck]:
+    """
+    Returns all source, buffer and machine group caps of a factory in the order in which the nodes were added.
+    """
+    caps: list[Bottleneck] = []
+    for node in factory.nodes:
+        if isinstance(node, Source) and node.max_rate is not None:
+            caps.append(SourceRateCap(node))
+        elif isinstance(node, Buffer):
+            caps.extend(BufferRateCap(node, material) for material in node.rate_caps.keys())
+        elif isinstance(node, MachineGroup) and node.machine_cap is not None:
+            caps.append(MachineRateCap(node))
+    return caps
+
+
+@dataclass(frozen=True)
+class SensitivityResults:
+    """
+    The derivatives of the maximal rate of each output point with respect to each cap, obtained from the dual values of
+    the linear programming problems. The entry (i, j) of the matrix is the increase in rate of output point i per unit
+    increase of cap j. These are local derivatives: they are valid until another cap becomes binding.
+    """
+    output_points: tuple[OutputPoint, ...]
+    caps: tuple[Bottleneck, ...]
+    result_rates: np.ndarray
+    matrix: scipy.sparse.csr_array
+
+    def __getitem__(self, item: tuple[OutputPoint, Bottleneck]) -> float:
+        output_point, cap = item
+        return float(self.matrix[self.output_points.index(output_point), self.caps.index(cap)])
+
+    def output_sensitivities(self, output_point: OutputPoint) -> dict[Bottleneck, float]:
+        row = self.matrix[[self.output_points.index(output_point)], :].tocoo()
+        return {self.caps[j]: float(value) for j, value in zip(row.coords[1], row.data)}
+
+    def ranked(self, weights: dict[OutputPoint, float] | None = None) -> list[tuple[Bottleneck, float]]:
+        """
+        Ranks the caps by the (weighted) total increase in output rate per unit increase of the cap.
+
+        :param weights: weight per output point, by default every output point has weight one
+        :return: the caps with a nonzero total increase, sorted from largest to smallest increase
+        """
+        weight_vector = np.ones(len(self.output_points), float)
+        if weights is not None:
+            weight_vector = np.array([weights.get(output_point, 0.) for output_point in self.output_points], float)
+        totals = self.matrix.T @ weight_vector
+        order = np.argsort(-totals, kind="stable")
+        return [(self.caps[j], float(totals[j])) for j in order if abs(totals[j]) > 1e-12]
+
+    def display(self, weights: dict[OutputPoint, float] | None = None, limit: int | None = None) -> str:
+        lines = [" -- rate increase per unit cap -- "]
+        for cap, total in self.ranked(weights)[:limit]:
+            lines.append(f"{total:.3f} for {cap.display()}")
+        return "\n".join(lines)
+
+
+def analyse_sensitivity(factory: SubFactory, output_points: Iterable[OutputPoint] | None = None,
+                        caps: Iterable[Bottleneck] | None = None, jobs: int | None = 1,
+                        cache_dir: str | None = None) -> SensitivityResults:
+    """
+    Computes the sensitivity of the maximal rate of each output point with respect to each cap in one pass over the
+    problems of all output points, which are compiled and solved as analyse_many does: problems with the same
+    canonical key are solved once, optionally in worker processes and with cached solutions.
+
+    The derivatives are minus the marginals of the caps. At a degenerate vertex, where more caps bind than needed to
+    fix the solution, the rate has a kink and the marginal is only a one-sided derivative: raising and lowering the
+    cap can change the rate at different speeds, and the marginal may match either of them or lie in between.
+
+    :param factory: the (sub)factory whose output points are analysed
+    :param output_points: the output points to analyse, by default those of the given (sub)factory
+    :param caps: the caps to compute derivatives for, by default all source, buffer and machine group caps
+    :param jobs: the number of worker processes solving the problems, None for the number of cpus
+    :param cache_dir: if given, solutions are stored in this directory by canonical key and reused by later runs
+    """
+    if output_points is None:
+        output_points = factory._output_points
+    output_points = tuple(output_points)
+    caps = tuple(factory_caps(factory.factory) if caps is None else caps)
+    cap_columns = {cap: j for j, cap in enumerate(caps)}
+    result_rates = np.zeros(len(output_points), float)
+    rows, columns, values = [], [], []
+    problems = factory.factory.compile_many(output_points)
+    for i, (problem, solution) in enumerate(zip(problems, solve_problems(problems, jobs, cache_dir))):
+        if solution is None:
+            result_rates[i] = float("inf")
+            continue
+        result_rates[i] = solution.rate
+        # the objective minimizes minus the rate, so the derivative of the rate is minus the marginal
+        for cap, marginal in zip(problem.caps, solution.marginals):
+            if cap in cap_columns and abs(marginal) > 1e-12:
+                rows.append(i)
+                columns.append(cap_columns[cap])
+                values.append(-marginal)
+    matrix = scipy.sparse.csr_array((values, (rows, columns)), shape=(len(output_points), len(caps)), dtype=float)
+    return SensitivityResults(output_points, caps, result_rates, matrix)
@@ -0,0 +1,288 @@
+from __future__ import annotations
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Any, Iterable
+from facalc.factories import (_Factory, SubFactory, Source, Buffer, MachineGroup, TrashPoint, OutputPoint,
+                              Bottleneck, SourceRateCap, BufferRateCap, MachineRateCap, TrashPointRateCap,
+                              OutputPointRateCap, LinearProblem, SingleAnalysisResults, FactoryAnalysisException,
+                              _describe_node)
+from facalc.shared_problems import SharedProblems, attach_worker, solve_shared
+
+
+def _number(value: float) -> float | None:
+    """ JSON has no infinity, so infinite rates are sent as null """
+    return None if value == float("inf") else float(value)
+
+
+class AnalysisSession:
+    """
+    Keeps the compiled problems and solved results of the output points of a factory in memory, and answers queries
+    with the caps of the factory patched. Patches only change the bounds of the compiled problems, or add a row for a
+    cap which did not exist yet, so a factory is only compiled once and a query after a patch costs one solve.
+    """
+    def __init__(self, factory: _Factory | SubFactory, output_points: Iterable[OutputPoint] | None = None):
+        if output_points is None:
+            if not isinstance(factory, SubFactory):
+                raise ValueError("Output points need to be specified when not passing a sub factory.")
+            output_points = factory._output_points
+        self.output_points = tuple(output_points)
+        self.factory = factory.factory if isinstance(factory, SubFactory) else factory
+        self.node_indices = {node: i for i, node in enumerate(self.factory.nodes)}
+        self.patches: dict[Bottleneck, float | None] = {}
+        self._compiled: dict[int, LinearProblem] = {}
+        self._results: dict[int, SingleAnalysisResults] = {}
+        self._shared: SharedProblems | None = None
+
+    def __enter__(self) -> AnalysisSession:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ frees the shared memory of the session, see shared """
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def shared(self) -> SharedProblems:
+        """
+        The compiled problems of all output points in shared memory, which worker processes attach to without copying.
+        They are placed there once and kept until the session is closed, as patches are sent to the workers as bounds.
+        """
+        if self._shared is None:
+            self._shared = SharedProblems([self.compiled(k).numeric for k in range(len(self.output_points))])
+        return self._shared
+
+    def warm(self, jobs: int | None = 1):
+        """
+        Compiles and solves every output point, such that later queries are fast.
+
+        :param jobs: the number of worker processes, None for the number of cpus. The workers attach to the shared
+        problems of the session and are only sent the index and patched bounds of each problem. Problems for which a
+        patch adds a cap are solved in this process
+        """
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        missing = [k for k in range(len(self.output_points)) if k not in self._results]
+        tasks = []
+        if jobs > 1 and len(missing) > 1:
+            for k in missing:
+                bounds, new_rows, _, _ = self.compiled(k).patch_bounds(self.patches)
+                if not new_rows:
+                    tasks.append((k, bounds))
+        if tasks:
+            with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=attach_worker,
+                                     initargs=(self.shared().handle,)) as executor:
+                for (k, _), solution in zip(tasks, executor.map(solve_shared, tasks)):
+                    self._results[k] = self.patched(k).results_from(solution)
+        for k in missing:
+            self.results(k)
+
+    def _output_index(self, output: int | str) -> int:
+        if isinstance(output, int):
+            if not 0 <= output < len(self.output_points):
+                raise ValueError(f"There is no output point with index {output}.")
+            return output
+        matches = [k for k, output_point in enumerate(self.output_points) if output_point.material == output]
+        if len(matches) != 1:
+            raise ValueError(f"Expected exactly one output point of {output}, found {len(matches)}.")
+        return matches[0]
+
+    def cap_of(self, reference: dict[str, Any]) -> Bottleneck:
+        """
+        Returns the cap referred to by a JSON object: {"output": index or material} for the cap of an output point, or
+        {"node": index} with a "material" for buffers, where the index is that of the node in the factory.
+        """
+        if "output" in reference:
+            return OutputPointRateCap(self.output_points[self._output_index(reference["output"])])
+        index = int(reference["node"])
+        if not 0 <= index < len(self.factory.nodes):
+            raise ValueError(f"There is no node with index {index}.")
+        node = self.factory.nodes[index]
+        if isinstance(node, Source):
+            return SourceRateCap(node)
+        if isinstance(node, MachineGroup):
+            return MachineRateCap(node)
+        if isinstance(node, TrashPoint):
+            return TrashPointRateCap(node)
+        if isinstance(node, Buffer):
+            if "material" not in reference:
+                raise ValueError("Caps of buffers need a material.")
+            return BufferRateCap(node, reference["material"])
+        raise ValueError(f"Node {index} cannot have a cap.")
+
+    def patch(self, patches: Iterable[tuple[Bottleneck, float | None]]):
+        """
+        Sets the bounds of caps, where None removes a cap. Patches stay until they are patched again or reset. All
+        patches are checked before any is applied, so an invalid patch leaves the session as it was.
+        """
+        patches = [(cap, None if bound is None else float(bound)) for cap, bound in patches]
+        if any(bound is not None and bound < 0. for _, bound in patches):
+            raise ValueError("Caps should be non-negative.")
+        self.patches.update(patches)
+        self._results.clear()
+
+    def reset(self):
+        self.patches.clear()
+        self._results.clear()
+
+    def compiled(self, output: int | str) -> LinearProblem:
+        k = self._output_index(output)
+        if k not in self._compiled:
+            self._compiled[k] = self.factory.compile(self.output_points[k])
+        return self._compiled[k]
+
+    def patched(self, output: int | str) -> LinearProblem:
+        """ the compiled problem of an output point with the current patches applied """
+        problem = self.compiled(output)
+        if not self.patches:
+            return problem
+        return problem.with_caps(self.patches)
+
+    def results(self, output: int | str) -> SingleAnalysisResults:
+        k = self._output_index(output)
+        if k not in self._results:
+            self._results[k] = self.patched(k).analyse()
+        return self._results[k]
+
+    def describe_nodes(self) -> list[dict[str, Any]]:
+        described = []
+        for i, node in enumerate(self.factory.nodes):
+            if isinstance(node, Source):
+                described.append({"node": i, "kind": "source", "material": node.material,
+                                  "cap": self._current_bound(SourceRateCap(node), node.max_rate)})
+            elif isinstance(node, Buffer):
+                for material in node.input_materials:
+                    described.append({"node": i, "kind": "buffer", "name": node.name, "material": material,
+                                      "cap": self._current_bound(BufferRateCap(node, material),
+                                                                 node.rate_caps.get(material))})
+            elif isinstance(node, MachineGroup):
+                described.append({"node": i, "kind": "machine", "machine": node.machine_type.display_info(1.),
+                                  "cap": self._current_bound(MachineRateCap(node), node.machine_cap)})
+            elif isinstance(node, TrashPoint):
+                described.append({"node": i, "kind": "trash", "material": node.material,
+                                  "cap": self._current_bound(TrashPointRateCap(node), node.max_rate)})
+        return described
+
+    def _current_bound(self, cap: Bottleneck, default: float | None) -> float | None:
+        return self.patches[cap] if cap in self.patches else default
+
+    def query(self, output: int | str, depth: int | None = 2) -> dict[str, Any]:
+        """ answers a query for one output point as a JSON compatible dictionary """
+        start = time.perf_counter()
+        k = self._output_index(output)
+        results = self.results(k)
+        bottlenecks = results.get_bottlenecks(depth)
+        return {
+            "output": k,
+            "material": self.output_points[k].material,
+            "rate": _number(results.result_rate),
+            "bottlenecks": [{"rate": _number(rate), "cap": cap.display()} for rate, cap in bottlenecks],
+            "machines": {str(self.node_indices[group]): _number(rate)
+                         for group, rate in results.rates.machine_rates.items() if rate > 1e-9},
+            "seconds": time.perf_counter()-start
+        }
+
+    def handle(self, path: str, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Handles a request of the server:
+
+        - /outputs lists the output points,
+        - /nodes lists the caps of the nodes,
+        - /query takes {"output": index or material, "depth": number of bottlenecks},
+        - /patch takes {"patches": [{"node": index, "material": material, "cap": bound or null}, ...]},
+        - /reset removes all patches.
+        """
+        if path == "/outputs":
+            return {"outputs": [{"output": k, "material": output_point.material,
+                                 "node": self.node_indices.get(output_point.location),
+                                 "location": _describe_node(output_point.location)}
+                                for k, output_point in enumerate(self.output_points)]}
+        if path == "/nodes":
+            return {"nodes": self.describe_nodes()}
+        if path == "/query":
+            if "output" not in request:
+                raise ValueError("Queries need an output.")
+            return self.query(request["output"], request.get("depth", 2))
+        if path == "/patch":
+            self.patch((self.cap_of(patch), patch.get("cap")) for patch in request.get("patches", ()))
+            return {"patches": len(self.patches)}
+        if path == "/reset":
+            self.reset()
+            return {"patches": 0}
+        raise KeyError(path)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    session: AnalysisSession
+
+    def _respond(self, status: int, body: dict[str, Any]):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, request: dict[str, Any]):
+        try:
+            self._respond(200, self.session.handle(self.path, request))
+        except KeyError as e:
+            self._respond(404, {"error": f"unknown request {e}"})
+        except (ValueError, TypeError, FactoryAnalysisException) as e:
+            self._respond(400, {"error": str(e)})
+        except Exception as e:
+            # answer instead of dropping the connection, the server keeps running
+            self._respond(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._handle({})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._respond(400, {"error": f"invalid JSON: {e}"})
+            return
+        self._handle(request)
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+def make_server(session: AnalysisSession, host: str = "127.0.0.1", port: int = 8765) -> HTTPServer:
+    """
+    Creates a JSON over HTTP server for a session, see AnalysisSession.handle for the requests. Requests are handled
+    one at a time, so the session needs no locking.
+    """
+    handler = type("RequestHandler", (_RequestHandler,), {"session": session})
+    return HTTPServer((host, port), handler)
+
+
+def serve(factory: _Factory | SubFactory, output_points: Iterable[OutputPoint] | None = None,
+          host: str = "127.0.0.1", port: int = 8765, warm: bool = True, jobs: int | None = 1):
+    """
+    Serves analysis queries for a factory on localhost until interrupted.
+
+    :param factory: the factory
+    :param output_points: the output points to answer queries for, by default those of the given sub factory
+    :param host: the address to listen on, by default only local connections are accepted
+    :param port: the port to listen on
+    :param warm: whether to compile and solve every output point before accepting requests
+    :param jobs: the number of worker processes warming the session, see AnalysisSession.warm
+    """
+    with AnalysisSession(factory, output_points) as session:
+        if warm:
+            session.warm(jobs)
+        server = make_server(session, host, port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+import numpy as np
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Sequence
+from facalc.factories import NumericProblem, LinearSolution
+
+
+_ALIGNMENT = 64
+_VECTORS = ("objective", "trash_weights_vector", "equalities_values", "inequalities_bounds")
+_MATRICES = ("equalities_matrix", "inequalities_matrix")
+
+
+@dataclass(frozen=True)
+class _ArrayLayout:
+    offset: int
+    shape: tuple[int, ...]
+    dtype: str
+
+
+@dataclass(frozen=True)
+class _ProblemLayout:
+    """ where the arrays of one numeric problem are in a segment, with its matrices stored as CSR arrays """
+    vectors: dict[str, _ArrayLayout]
+    matrices: dict[str, tuple[tuple[int, int], _ArrayLayout, _ArrayLayout, _ArrayLayout]]
+    trash_points_start: int
+    num_trash_points: int
+
+
+@dataclass(frozen=True)
+class SharedProblemsHandle:
+    """
+    What a process needs to attach to shared problems: the name of their shared memory segment and the layout of the
+    arrays in it. It is small, so it can be sent to worker processes instead of the problems themselves.
+    """
+    name: str
+    layouts: tuple[_ProblemLayout, ...]
+
+    def __len__(self):
+        return len(self.layouts)
+
+
+class SharedProblems:
+    """
+    Numeric problems placed in one shared memory segment, with their matrices in CSR format, such that worker processes
+    attach to them without copying or unpickling any arrays. The segment lives until close is called, or until the
+    with block the shared problems are used in ends, so it should outlive all workers using it.
+    """
+    def __init__(self, problems: Sequence[NumericProblem]):
+        arrays: list[np.ndarray] = []
+        offset = 0
+
+        def place(array: np.ndarray) -> _ArrayLayout:
+            nonlocal offset
+            array = np.ascontiguousarray(array)
+            arrays.append(array)
+            layout = _ArrayLayout(offset, array.shape, array.dtype.str)
+            offset += -(-array.nbytes//_ALIGNMENT)*_ALIGNMENT
+            return layout
+
+        layouts = []
+        for problem in problems:
+            vectors = {name: place(np.asarray(getattr(problem, name), dtype=float)) for name in _VECTORS}
+            matrices = {}
+            for name in _MATRICES:
+                matrix = scipy.sparse.csr_array(getattr(problem, name), dtype=float)
+                matrices[name] = (matrix.shape, place(matrix.data), place(matrix.indices), place(matrix.indptr))
+            layouts.append(_ProblemLayout(vectors, matrices, problem.trash_points_start, problem.num_trash_points))
+        self._segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.handle = SharedProblemsHandle(self._segment.name, tuple(layouts))
+        start = 0
+        for array in arrays:
+            np.ndarray(array.shape, array.dtype, buffer=self._segment.buf, offset=start)[...] = array
+            start += -(-array.nbytes//_ALIGNMENT)*_ALIGNMENT
+
+    def __len__(self):
+        return len(self.handle)
+
+    def __enter__(self) -> SharedProblems:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._segment is None
+
+    def close(self):
+        """ frees the segment; processes which are still attached keep their mapping until they detach """
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._segment.unlink()
+        self._segment = None
+
+
+# the segments this process is attached to, which have to stay open as long as the problems viewing them are used
+_attached: dict[str, tuple[shared_memory.SharedMemory, list[NumericProblem]]] = {}
+
+
+def attach(handle: SharedProblemsHandle) -> list[NumericProblem]:
+    """
+    Returns the shared problems of a handle as numeric problems whose arrays are views of the shared segment. Attaching
+    twice to the same segment returns the same problems.
+    """
+    if handle.name in _attached:
+        return _attached[handle.name][1]
+    # worker processes share the resource tracker of the process which created the segment, for which registering the
+    # segment again changes nothing, so the segment is unlinked once, by SharedProblems.close
+    segment = shared_memory.SharedMemory(handle.name)
+
+    def view(layout: _ArrayLayout) -> np.ndarray:
+        array = np.ndarray(layout.shape, np.dtype(layout.dtype), buffer=segment.buf, offset=layout.offset)
+        array.flags.writeable = False
+        return array
+
+    problems = []
+    for layout in handle.layouts:
+        matrices = {
+            name: scipy.sparse.csr_array((view(data), view(indices), view(indptr)), shape=shape, copy=False)
+            for name, (shape, data, indices, indptr) in layout.matrices.items()
+        }
+        problems.append(NumericProblem(
+            trash_points_start=layout.trash_points_start,
+            num_trash_points=layout.num_trash_points,
+            **{name: view(vector) for name, vector in layout.vectors.items()},
+            **matrices
+        ))
+    _attached[handle.name] = (segment, problems)
+    return problems
+
+
+def detach(handle: SharedProblemsHandle):
+    """ drops the problems of a handle attached to by this process, which should no longer be used """
+    if handle.name not in _attached:
+        return
+    segment, problems = _attached.pop(handle.name)
+    problems.clear()
+    try:
+        segment.close()
+    except BufferError:
+        # views are still referenced somewhere, the mapping is released once they are garbage collected
+        pass
+
+
+_worker_problems: list[NumericProblem] = []
+
+
+def attach_worker(handle: SharedProblemsHandle):
+    """ initializer of worker processes, which attaches them to the shared problems of a handle """
+    global _worker_problems
+    _worker_problems = attach(handle)
+
+
+def solve_shared(task: int | tuple[int, np.ndarray]) -> LinearSolution | None:
+    """
+    Solves a shared problem in a worker process initialized by attach_worker. The task is the index of the problem, or
+    its index and bounds replacing those of its inequalities, where inequalities with infinite bounds are left out.
+    """
+    if isinstance(task, tuple):
+        index, bounds = task
+        return _worker_problems[index].solve(np.isfinite(bounds), bounds)
+    return _worker_problems[task].solve()
+
+
+def solve_in_workers(problems: Sequence[NumericProblem], jobs: int) -> list[LinearSolution | None]:
+    """
+    Solves problems in worker processes, which attach to the problems in shared memory and are only sent their indices.
+    """
+    with SharedProblems(problems) as shared, ProcessPoolExecutor(
+            min(jobs, len(problems)), initializer=attach_worker, initargs=(shared.handle,)) as executor:
+        return list(executor.map(solve_shared, range(len(problems)), chunksize=max(1, len(problems)//(4*jobs))))
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import numpy as np
+import scipy.linalg
+
+
+class WarmSimplex:
+    """
+    A primal simplex method for maximizing c.x subject to A_eq x = b_eq, A_ub x <= b_ub and x >= 0, which keeps its
+    basis between solves. It is started from a known optimal solution, after which inequalities can be relaxed one by
+    one: their slack variables become free, and the previous optimal basis stays feasible, so every solve after a
+    relaxation only takes the few pivots needed to get back to an optimal basis.
+
+    Numerical trouble, such as a singular basis, raises np.linalg.LinAlgError, after which the problem should be
+    solved some other way.
+    """
+    def __init__(self, objective: np.ndarray, equalities_matrix: np.ndarray, equalities_values: np.ndarray,
+                 inequalities_matrix: np.ndarray, inequalities_bounds: np.ndarray, x: np.ndarray):
+        """
+        :param x: an optimal solution of the problem at a vertex, such as those of scipy.optimize.linprog
+        """
+        self.num_variables = len(objective)
+        self.num_equalities = len(equalities_matrix)
+        num_inequalities = len(inequalities_matrix)
+        # the standard form has one slack variable per inequality, after the variables of the problem
+        self.matrix = np.block([
+            [equalities_matrix, np.zeros((self.num_equalities, num_inequalities))],
+            [inequalities_matrix, np.eye(num_inequalities)]
+        ])
+        self.values = np.concatenate((equalities_values, inequalities_bounds))
+        self.objective = np.concatenate((objective, np.zeros(num_inequalities)))
+        self.free = np.zeros(self.matrix.shape[1], bool)
+        self.basis = self._initial_basis(np.concatenate((x, inequalities_bounds-inequalities_matrix @ x)))
+        self._factorize()
+        if np.any(self.x < -1e-7*max(1., np.max(np.abs(self.x)))):
+            raise np.linalg.LinAlgError("The solution to start from is infeasible.")
+        self.x = np.maximum(self.x, 0.)
+
+    @property
+    def relaxed(self) -> np.ndarray:
+        """ boolean mask of the relaxed inequalities """
+        return self.free[self.num_variables:]
+
+    def _initial_basis(self, x: np.ndarray) -> np.ndarray:
+        """ a basis containing all positive variables of x, completed greedily by the most independent columns """
+        num_rows = len(self.matrix)
+        positive = np.flatnonzero(x > 1e-9*max(1., np.max(np.abs(x))))
+        if len(positive) > num_rows:
+            raise np.linalg.LinAlgError("The solution to start from is not a vertex.")
+        residual = self.matrix
+        if len(positive):
+            q, r = np.linalg.qr(self.matrix[:, positive])
+            if np.min(np.abs(np.diag(r))) < 1e-9:
+                raise np.linalg.LinAlgError("The solution to start from is not a vertex.")
+            residual = self.matrix-q @ (q.T @ self.matrix)
+        others = np.setdiff1d(np.arange(self.matrix.shape[1]), positive)
+        missing = num_rows-len(positive)
+        if missing == 0:
+            return positive
+        _, r, permutation = scipy.linalg.qr(residual[:, others], mode="economic", pivoting=True)
+        if len(r) < missing or abs(r[missing-1, missing-1]) < 1e-9:
+            raise np.linalg.LinAlgError("The constraints of the problem are linearly dependent.")
+        return np.concatenate((positive, others[permutation[:missing]]))
+
+    def _factorize(self):
+        """ factorizes the basis matrix and computes the basic solution """
+        basis_matrix = self.matrix[:, self.basis]
+        self._factors = scipy.linalg.lu_factor(basis_matrix, check_finite=False)
+        if np.any(np.abs(np.diag(self._factors[0])) < 1e-12*max(1., np.max(np.abs(basis_matrix)))):
+            raise np.linalg.LinAlgError("The basis is singular.")
+        basic = self._solve(self.values)
+        # one step of iterative refinement with the residual in extended precision, such that rates which are round
+        # numbers come out as such
+        residual = self.values.astype(np.longdouble)-basis_matrix.astype(np.longdouble) @ basic.astype(np.longdouble)
+        basic += self._solve(residual.astype(float))
+        self.x = np.zeros(self.matrix.shape[1], float)
+        self.x[self.basis] = basic
+
+    def _solve(self, vector: np.ndarray, transposed: bool = False) -> np.ndarray:
+        return scipy.linalg.lu_solve(self._factors, vector, trans=int(transposed), check_finite=False)
+
+    def reduced_costs(self, objective: np.ndarray) -> np.ndarray:
+        """ the reduced costs of all variables for the current basis, zero for basic variables """
+        duals = self._solve(objective[self.basis], transposed=True)
+        reduced_costs = objective-duals @ self.matrix
+        reduced_costs[self.basis] = 0.
+        return reduced_costs
+
+    def duals(self) -> np.ndarray:
+        """ the shadow prices of all constraints, the equalities first, for the objective of the problem """
+        return self._solve(self.objective[self.basis], transposed=True)
+
+    def relax(self, inequality: int):
+        """ drops the bound of an inequality, by letting its slack variable take any value """
+        self.free[self.num_variables+inequality] = True
+
+    def maximize(self, objective: np.ndarray | None = None, allowed: np.ndarray | None = None,
+                 max_iterations: int = 10000) -> bool:
+        """
+        Pivots until the basis is optimal. Raises np.linalg.LinAlgError if that takes more than max_iterations pivots,
+        leaving a feasible basis which need not be optimal.
+
+        :param objective: the objective on the variables of the problem to maximize, by default that of the problem
+        :param allowed: boolean mask of the variables and slack variables which may enter the basis, by default all
+        :param max_iterations: the maximal number of pivots
+        :return: False if the objective is unbounded, True otherwise
+        """
+        if objective is None:
+            objective = self.objective
+        else:
+            objective = np.concatenate((objective, np.zeros(len(self.objective)-len(objective))))
+        degenerate_pivots = 0
+        for iteration in range(max_iterations+1):
+            reduced_costs = self.reduced_costs(objective)
+            tolerance = 1e-9*max(1., np.max(np.abs(objective)))
+            improving = (reduced_costs > tolerance) | (self.free & (reduced_costs < -tolerance))
+            if allowed is not None:
+                improving &= allowed
+            candidates = np.flatnonzero(improving)
+            if len(candidates) == 0:
+                return True
+            if iteration == max_iterations:
+                break
+            # the steepest reduced cost, or the first improving variable to prevent cycling on degenerate vertices
+            if degenerate_pivots < len(self.matrix):
+                entering = int(candidates[np.argmax(np.abs(reduced_costs[candidates]))])
+            else:
+                entering = int(candidates[0])
+            direction = 1. if reduced_costs[entering] > 0. else -1.
+            change = direction*self._solve(self.matrix[:, entering])
+            # free variables never leave the basis, as they can take any value
+            blocking = np.flatnonzero((change > 1e-9) & ~self.free[self.basis])
+            if len(blocking) == 0:
+                return False
+            ratios = self.x[self.basis[blocking]]/change[blocking]
+            step = np.min(ratios)
+            ties = blocking[ratios <= step+1e-12]
+            leaving = ties[np.argmin(self.basis[ties])]
+            degenerate_pivots = degenerate_pivots+1 if step <= 1e-12 else 0
+            self.basis[leaving] = entering
+            self._factorize()
+            bounded = ~self.free
+            self.x[bounded] = np.maximum(self.x[bounded], 0.)
+        raise np.linalg.LinAlgError("The simplex method did not converge.")
+
+    def slack(self) -> np.ndarray:
+        """ the slack of every inequality """
+        return self.x[self.num_variables:]
+
+    def solution(self) -> np.ndarray:
+        """ the values of the variables of the problem """
+        return self.x[:self.num_variables]
@@ -0,0 +1,304 @@
+from __future__ import annotations
+import numpy as np
+from dataclasses import dataclass
+from typing import Iterable
+from facalc.factories import (_Factory, SubFactory, FactoryNode, Source, Buffer, MachineGroup, TrashPoint, OutputPoint,
+                              FactoryRates, update_sup_dict)
+
+
+# a line holds one material at one node: a buffer line, the supply of a source or the output of a machine group which
+# directly feeds another node
+Line = tuple[FactoryNode, str]
+
+
+@dataclass(frozen=True)
+class SimulationResults:
+    """
+    The contents of every line and the activity of every machine group over time. The activity of a machine group is
+    its rate as a fraction of its number of machines.
+    """
+    times: np.ndarray
+    lines: tuple[Line, ...]
+    # contents with shape (time, line)
+    contents: np.ndarray
+    machine_groups: tuple[MachineGroup, ...]
+    # activity with shape (time, machine group)
+    activity: np.ndarray
+    output_points: tuple[OutputPoint, ...]
+    # total amount taken by each output point up to each time, with shape (time, output point)
+    output_totals: np.ndarray
+
+    def get_contents(self, node: Buffer | Source | MachineGroup, material: str) -> np.ndarray:
+        return self.contents[:, self.lines.index((node, material))]
+
+    def get_activity(self, machine_group: MachineGroup) -> np.ndarray:
+        return self.activity[:, self.machine_groups.index(machine_group)]
+
+    def get_output_rates(self, output_point: OutputPoint) -> np.ndarray:
+        """ the average rate of an output point between consecutive recorded times """
+        totals = self.output_totals[:, self.output_points.index(output_point)]
+        return np.diff(totals, prepend=0.)/np.diff(self.times, prepend=0.).clip(1e-12)
+
+    def settling_time(self, machine_group: MachineGroup, tolerance: float = 1e-3) -> float | None:
+        """
+        Returns the time from which on the activity of a machine group stays within the tolerance of its final activity,
+        or None if it only does so at the final recorded time.
+        """
+        activity = self.get_activity(machine_group)
+        outside = np.flatnonzero(np.abs(activity-activity[-1]) > tolerance)
+        if len(outside) == 0:
+            return float(self.times[0])
+        if outside[-1]+1 >= len(self.times)-1:
+            return None
+        return float(self.times[outside[-1]+1])
+
+
+class _SimulationGraph:
+    """
+    The factory flattened into index arrays: machine group inputs and outputs, transfers between lines, output points
+    and trash points.
+    """
+    def __init__(self, nodes: list[FactoryNode], output_points: tuple[OutputPoint, ...],
+                 machine_counts: dict[MachineGroup, float], capacities: dict[Line, float]):
+        self.lines: list[Line] = []
+        line_indices: dict[Line, int] = {}
+
+        def line(node: FactoryNode, material: str) -> int:
+            if (node, material) not in line_indices:
+                line_indices[(node, material)] = len(self.lines)
+                self.lines.append((node, material))
+            return line_indices[(node, material)]
+
+        self.machine_groups = [node for node in nodes if isinstance(node, MachineGroup)]
+        sinks = {(output_point.location, output_point.material) for output_point in output_points}
+        for node in nodes:
+            if isinstance(node, TrashPoint):
+                sinks.add((node.location, node.material))
+        input_lines, input_machines, input_rates = [], [], []
+        output_lines, output_machines, output_rates = [], [], []
+        limits = np.zeros(len(self.machine_groups), float)
+        for j, machine_group in enumerate(self.machine_groups):
+            machine_type = machine_group.machine_type
+            limits[j] = machine_counts.get(machine_group, 0.)
+            for material, rate in machine_type.input_rates.items():
+                suppliers = tuple(machine_group.inputs(material))
+                if not suppliers:
+                    limits[j] = 0.
+                    continue
+                supplier = suppliers[0]
+                input_lines.append(line(supplier, supplier.material if isinstance(supplier, Source) else material))
+                input_machines.append(j)
+                input_rates.append(rate)
+            for material, rate in machine_type.output_rates.items():
+                receivers = tuple(machine_group.outputs(material))
+                if receivers and isinstance(receivers[0], Buffer):
+                    output_lines.append(line(receivers[0], material))
+                elif receivers or (machine_group, material) in sinks:
+                    output_lines.append(line(machine_group, material))
+                else:
+                    # like in the linear programming problems, machine groups without somewhere to put output stop
+                    limits[j] = 0.
+                    continue
+                output_machines.append(j)
+                output_rates.append(rate)
+        self.input_lines = np.array(input_lines, dtype=int)
+        self.input_machines = np.array(input_machines, dtype=int)
+        self.input_rates = np.array(input_rates, dtype=float)
+        self.output_lines = np.array(output_lines, dtype=int)
+        self.output_machines = np.array(output_machines, dtype=int)
+        self.output_rates = np.array(output_rates, dtype=float)
+        self.limits = limits
+
+        transfers = []
+        for node in nodes:
+            if not isinstance(node, Buffer):
+                continue
+            for material in node.input_materials:
+                for supplier in node.inputs(material):
+                    if isinstance(supplier, Source):
+                        transfers.append((line(supplier, supplier.material), line(node, material)))
+                    elif isinstance(supplier, Buffer):
+                        transfers.append((line(supplier, material), line(node, material)))
+        self.transfer_sources = np.array([frm for frm, to in transfers], dtype=int)
+        self.transfer_targets = np.array([to for frm, to in transfers], dtype=int)
+        self.output_point_lines = np.array([line(output_point.location, output_point.material)
+                                            for output_point in output_points], dtype=int)
+        self.output_point_caps = np.array([np.inf if output_point.max_rate is None else output_point.max_rate
+                                           for output_point in output_points], dtype=float)
+        trash_points = [node for node in nodes if isinstance(node, TrashPoint)]
+        self.trash_lines = np.array([line(trash_point.location, trash_point.material) for trash_point in trash_points],
+                                    dtype=int)
+        self.trash_caps = np.array([np.inf if trash_point.max_rate is None else trash_point.max_rate
+                                    for trash_point in trash_points], dtype=float)
+
+        num_lines = len(self.lines)
+        self.rate_caps = np.full(num_lines, np.inf)
+        self.supply = np.zeros(num_lines, float)
+        self.is_source = np.zeros(num_lines, bool)
+        self.capacities = np.full(num_lines, np.inf)
+        for i, (node, material) in enumerate(self.lines):
+            if isinstance(node, Buffer) and material in node.rate_caps:
+                self.rate_caps[i] = node.rate_caps[material]
+            if isinstance(node, Source):
+                self.is_source[i] = True
+                self.supply[i] = np.inf if node.max_rate is None else node.max_rate
+            if (node, material) in capacities:
+                self.capacities[i] = capacities[(node, material)]
+        self.line_indices = line_indices
+        # the length of the longest chain of transfers, bounded by the number of lines in case transfers form a cycle
+        depth = np.zeros(num_lines, int)
+        self.transfer_depth = 0
+        while self.transfer_depth < num_lines and len(self.transfer_sources) > 0:
+            new_depth = np.zeros(num_lines, int)
+            np.maximum.at(new_depth, self.transfer_sources, depth[self.transfer_targets]+1)
+            if np.array_equal(new_depth, depth):
+                break
+            depth = new_depth
+            self.transfer_depth += 1
+
+
+def simulate(factory: _Factory | SubFactory, duration: float, dt: float = 1.,
+             machine_counts: dict[MachineGroup, float] | FactoryRates | None = None,
+             output_points: Iterable[OutputPoint] = (), initial_contents: dict[Line, float] | None = None,
+             capacities: dict[Line, float] | None = None, record_every: int = 1) -> SimulationResults:
+    """
+    Simulates the factory in discrete time steps, starting from the given contents of its lines. Every step:
+
+    - every machine group runs at the largest fraction of its machines for which its inputs are available and its
+      outputs fit, where machine groups reading the same line share its contents in proportion to their demand,
+    - the output points take what they can from their lines,
+    - buffers and sources pass on what is left to the buffers they supply, in proportion to what those buffers still
+      need to supply the demand downstream of them in the next step,
+    - trash points take what is still left on their lines beyond what is wanted there in the next step.
+
+    Rate caps of buffers limit the total amount entering a buffer line per step, and sources supply at most their
+    maximal rate per step. All nodes are updated at once using index arrays, so a step costs a few numpy operations
+    regardless of the size of the factory.
+
+    :param factory: the factory to simulate
+    :param duration: the simulated time in seconds
+    :param dt: the length of a time step in seconds
+    :param machine_counts: the number of machines of each machine group, in the units of the rates of machine groups,
+    or the rates of an analysis to use as numbers of machines. Machine groups missing from it get their machine cap, or
+    if they have none their largest rate over the analyses of the output points (see FullAnalysisResults.max_rates)
+    :param output_points: the output points which take output, by default none
+    :param initial_contents: the initial contents of lines, by default all lines are empty
+    :param capacities: the maximal contents of lines, by default unbounded
+    :param record_every: the number of steps between recorded states
+    """
+    nodes = factory.factory.nodes if isinstance(factory, SubFactory) else factory.nodes
+    output_points = tuple(output_points)
+    if isinstance(machine_counts, FactoryRates):
+        machine_counts = machine_counts.machine_rates
+    counts: dict[MachineGroup, float] = {node: node.machine_cap for node in nodes
+                                         if isinstance(node, MachineGroup) and node.machine_cap is not None}
+    if machine_counts is not None:
+        counts.update(machine_counts)
+    uncounted = [node for node in nodes if isinstance(node, MachineGroup) and node not in counts]
+    if uncounted:
+        if not output_points:
+            raise ValueError("Machine groups without a machine cap need a number of machines when no output points "
+                             "are given.")
+        base_factory = factory.factory if isinstance(factory, SubFactory) else factory
+        max_rates: dict[MachineGroup, float] = {}
+        for results in base_factory.analyse_many(output_points):
+            update_sup_dict(max_rates, results.rates.machine_rates)
+        for machine_group in uncounted:
+            rate = max_rates.get(machine_group, 0.)
+            if rate == float("inf"):
+                raise ValueError("Cannot simulate a machine group which runs at an infinite rate, give it a number of "
+                                 "machines.")
+            counts[machine_group] = rate
+    graph = _SimulationGraph(nodes, output_points, counts, {} if capacities is None else capacities)
+    num_lines = len(graph.lines)
+    num_machines = len(graph.machine_groups)
+    contents = np.zeros(num_lines, float)
+    for key, amount in ({} if initial_contents is None else initial_contents).items():
+        contents[graph.line_indices[key]] = amount
+
+    num_steps = int(round(duration/dt))
+    num_records = num_steps//record_every+1
+    recorded_contents = np.zeros((num_records, num_lines), float)
+    recorded_activity = np.zeros((num_records, num_machines), float)
+    recorded_outputs = np.zeros((num_records, len(output_points)), float)
+    output_totals = np.zeros(len(output_points), float)
+    activity = np.zeros(num_machines, float)
+    demand = graph.limits*dt
+    output_point_pull = np.bincount(graph.output_point_lines, np.where(np.isinf(graph.output_point_caps), 0.,
+                                                                       graph.output_point_caps*dt), num_lines)
+    recorded_contents[0] = contents
+
+    for step in range(1, num_steps+1):
+        contents[graph.is_source] = graph.supply[graph.is_source]*dt
+        # the fraction of the demand of the machine groups reading each line which the line can supply
+        line_demand = np.bincount(graph.input_lines, demand[graph.input_machines]*graph.input_rates, num_lines)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            supply_fraction = np.where(line_demand > 0., np.minimum(1., contents/line_demand), 1.)
+        fraction = np.ones(num_machines, float)
+        np.minimum.at(fraction, graph.input_machines, supply_fraction[graph.input_lines])
+        # the fraction of the production which fits in each line
+        line_production = np.bincount(graph.output_lines,
+                                      (demand*fraction)[graph.output_machines]*graph.output_rates, num_lines)
+        space = graph.capacities-np.where(np.isinf(graph.capacities), 0., contents)
+        room = np.minimum(graph.rate_caps*dt, space)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            room_fraction = np.where(line_production > 0., np.clip(room/line_production, 0., 1.), 1.)
+        np.minimum.at(fraction, graph.output_machines, room_fraction[graph.output_lines])
+        amounts = demand*fraction
+        consumed = np.bincount(graph.input_lines, amounts[graph.input_machines]*graph.input_rates, num_lines)
+        produced = np.bincount(graph.output_lines, amounts[graph.output_machines]*graph.output_rates, num_lines)
+        contents = np.maximum(contents-consumed, 0.)+produced
+        inflow = produced
+        activity = np.where(graph.limits > 0., fraction, 0.)
+
+        # output points take what they can
+        taken = np.minimum(contents[graph.output_point_lines], graph.output_point_caps*dt)
+        np.subtract.at(contents, graph.output_point_lines, taken)
+        output_totals += taken
+
+        # what each line should hold after this step to supply its own demand and the lines downstream of it in the
+        # next step, and how much it should receive for that after passing on what it has, propagated upstream
+        stock = np.where(graph.is_source, 0., contents)
+        own_demand = line_demand+output_point_pull
+        pull = np.maximum(own_demand-stock, 0.)
+        for _ in range(graph.transfer_depth+1):
+            downstream = np.bincount(graph.transfer_sources, pull[graph.transfer_targets], num_lines)
+            pull = np.maximum(own_demand+downstream-np.maximum(stock-downstream, 0.), 0.)
+        wanted = own_demand+downstream
+        # pass on what is left to the buffers supplied by each line, in proportion to what is demanded downstream of
+        # them, and never more than that
+        target_pull = pull[graph.transfer_targets]
+        total_pull = np.bincount(graph.transfer_sources, target_pull, num_lines)[graph.transfer_sources]
+        available = contents[graph.transfer_sources]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(total_pull > 0., target_pull/total_pull, 0.)
+            offered = np.where(np.isinf(available), target_pull, np.minimum(target_pull, available*share))
+        requested = np.bincount(graph.transfer_targets, offered, num_lines)
+        space = graph.capacities-np.where(np.isinf(graph.capacities), 0., contents)
+        room = np.minimum(graph.rate_caps*dt-inflow, space).clip(0.)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            accepted_fraction = np.where(requested > 0., np.minimum(1., room/requested), 1.)
+        moved = offered*accepted_fraction[graph.transfer_targets]
+        np.subtract.at(contents, graph.transfer_sources, moved)
+        np.add.at(contents, graph.transfer_targets, moved)
+        contents = np.maximum(contents, 0.)
+
+        # trash points take what is still left beyond what is wanted in the next step
+        trashed = np.minimum((contents-wanted).clip(0.)[graph.trash_lines], graph.trash_caps*dt)
+        np.subtract.at(contents, graph.trash_lines, trashed)
+
+        if step % record_every == 0:
+            record = step//record_every
+            recorded_contents[record] = np.where(graph.is_source, 0., contents)
+            recorded_activity[record] = activity
+            recorded_outputs[record] = output_totals
+
+    return SimulationResults(
+        np.arange(num_records)*record_every*dt,
+        tuple(graph.lines),
+        recorded_contents,
+        tuple(graph.machine_groups),
+        recorded_activity,
+        output_points,
+        recorded_outputs
+    )
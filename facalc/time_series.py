@@ -0,0 +1,118 @@
+from __future__ import annotations
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Iterable
+from facalc.factories import _Factory, SubFactory, OutputPoint, Source, Bottleneck
+
+
+# a yield curve is a function mapping an array of timestamps to an array of maximal source rates, or a pair of arrays
+# (timestamps, rates) which is interpolated linearly and held constant outside of its timestamps
+YieldCurve = Any
+
+
+def evaluate_yield_curve(curve: YieldCurve, times: np.ndarray) -> np.ndarray:
+    if isinstance(curve, tuple):
+        curve_times, curve_rates = curve
+        return np.interp(times, np.asarray(curve_times, dtype=float), np.asarray(curve_rates, dtype=float))
+    return np.broadcast_to(np.asarray(curve(times), dtype=float), times.shape).copy()
+
+
+def exponential_yield(initial_rate: float, half_life: float, minimum_rate: float = 0.) -> YieldCurve:
+    """
+    A yield which halves every half life, but does not drop below a minimum, like a pumpjack on a depleting oil field.
+    """
+    def curve(times: np.ndarray) -> np.ndarray:
+        return minimum_rate+(initial_rate-minimum_rate)*np.exp2(-times/half_life)
+    return curve
+
+
+def depleting_yield(rate: float, amount: float) -> YieldCurve:
+    """
+    A constant yield which stops when a resource patch of the given amount is mined out at that rate.
+    """
+    def curve(times: np.ndarray) -> np.ndarray:
+        return np.where(times*rate < amount, rate, 0.)
+    return curve
+
+
+@dataclass(frozen=True)
+class TimeSeriesResults:
+    """
+    The maximal rate of every output point over time, given the maximal rates of sources at every timestamp.
+    """
+    times: np.ndarray
+    sources: tuple[Source, ...]
+    # maximal source rates with shape (source, time)
+    source_rates: np.ndarray
+    output_points: tuple[OutputPoint, ...]
+    # maximal output rates with shape (output point, time)
+    result_rates: np.ndarray
+    caps: dict[OutputPoint, tuple[Bottleneck, ...]]
+    # binding caps of each output point with shape (time, cap)
+    binding: dict[OutputPoint, np.ndarray]
+
+    def get_rates(self, output_point: OutputPoint) -> np.ndarray:
+        return self.result_rates[self.output_points.index(output_point)]
+
+    def bottleneck_changes(self, output_point: OutputPoint) -> list[tuple[float, tuple[Bottleneck, ...]]]:
+        """
+        Returns the timestamps at which the binding caps of an output point change, with the binding caps from then on.
+        """
+        caps = self.caps[output_point]
+        binding = self.binding[output_point]
+        changes = []
+        for i in range(len(self.times)):
+            if i == 0 or np.any(binding[i] != binding[i-1]):
+                changes.append((float(self.times[i]), tuple(cap for cap, b in zip(caps, binding[i]) if b)))
+        return changes
+
+    def display(self, output_point: OutputPoint) -> str:
+        rates = self.get_rates(output_point)
+        lines = [f" -- {output_point.material} over time -- "]
+        for time, caps in self.bottleneck_changes(output_point):
+            rate = rates[np.searchsorted(self.times, time)]
+            bottlenecks = ", ".join(cap.display() for cap in caps) if caps else "nothing"
+            lines.append(f"from {time:g}: {rate:.2f}/s bottlenecked by {bottlenecks}")
+        return "\n".join(lines)
+
+
+def analyse_over_time(factory: _Factory | SubFactory, yield_curves: dict[Source, YieldCurve],
+                      times: Iterable[float], output_points: Iterable[OutputPoint] | None = None
+                      ) -> TimeSeriesResults:
+    """
+    Analyses output points at many timestamps, with the maximal rates of sources following yield curves. Every output
+    point is compiled once and its optimal basis is reused as long as it stays optimal, so a linear programming problem
+    is only solved again when the bottlenecks change.
+
+    :param factory: the (sub)factory to analyse
+    :param yield_curves: the maximal rate over time of each source whose rate changes over time
+    :param times: the timestamps, in increasing order, in the unit of time used by the yield curves
+    :param output_points: the output points to analyse, by default those of the given sub factory
+    """
+    if output_points is None:
+        if not isinstance(factory, SubFactory):
+            raise ValueError("Output points need to be specified when not passing a sub factory.")
+        output_points = factory._output_points
+    output_points = tuple(output_points)
+    if isinstance(factory, SubFactory):
+        factory = factory.factory
+    times = np.asarray(tuple(times), dtype=float)
+    if np.any(np.diff(times) < 0.):
+        raise ValueError("Timestamps should be in increasing order.")
+    sources = tuple(yield_curves.keys())
+    source_rates = np.zeros((len(sources), len(times)), float)
+    for k, source in enumerate(sources):
+        source_rates[k] = np.maximum(evaluate_yield_curve(yield_curves[source], times), 0.)
+
+    result_rates = np.zeros((len(output_points), len(times)), float)
+    caps: dict[OutputPoint, tuple[Bottleneck, ...]] = {}
+    binding: dict[OutputPoint, np.ndarray] = {}
+    for j, output_point in enumerate(output_points):
+        problem, rows = factory.compile(output_point).with_source_caps(sources)
+        bounds = np.tile(problem.inequalities_bounds, (len(times), 1))
+        for k, source in enumerate(sources):
+            if source in rows:
+                bounds[:, rows[source]] = source_rates[k]
+        result_rates[j], binding[output_point] = problem.numeric.solve_rates(bounds)
+        caps[output_point] = problem.caps
+    return TimeSeriesResults(times, sources, source_rates, output_points, result_rates, caps, binding)
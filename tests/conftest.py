@@ -0,0 +1,229 @@
+from __future__ import annotations
+import gc
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+import pytest
+import scipy.optimize
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Iterator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from facalc.simplex import WarmSimplex  # noqa: E402, after the repository is on the import path
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_baseline.json")
+
+# world1 uses quotes inside f-string replacement fields, which python only parses from 3.12 on
+requires_world1 = pytest.mark.skipif(sys.version_info < (3, 12), reason="world1 needs python 3.12 or newer")
+
+
+def pytest_addoption(parser: pytest.Parser):
+    group = parser.getgroup("perf", "performance regression gate")
+    group.addoption("--perf-baseline", default=BASELINE_PATH,
+                    help="json file with the baseline measurements of every phase")
+    group.addoption("--perf-update-baseline", action="store_true",
+                    help="write the measurements to the baseline file instead of comparing against it")
+    group.addoption("--perf-rounds", type=int, default=3,
+                    help="number of timed runs per phase, of which the fastest counts (default 3)")
+    group.addoption("--perf-time-tolerance", type=float, default=0.5,
+                    help="allowed relative increase of the wall time of a phase, inf to not check times (default 0.5)")
+    group.addoption("--perf-memory-tolerance", type=float, default=0.25,
+                    help="allowed relative increase of the peak memory of a phase (default 0.25)")
+    group.addoption("--perf-solve-tolerance", type=float, default=0.,
+                    help="allowed relative increase of the number of solves and pivots of a phase (default 0)")
+
+
+def pytest_configure(config: pytest.Config):
+    config.addinivalue_line("markers", "perf: performance regression test, compared against the perf baseline")
+
+
+@dataclass(frozen=True)
+class PhaseMeasurement:
+    seconds: float
+    solves: int
+    peak_mb: float
+    pivots: int = 0
+
+
+@dataclass
+class SolveCounts:
+    """ the linear programming problems solved with linprog and with warm started simplex methods, and their pivots """
+    linprog: int = 0
+    warm: int = 0
+    pivots: int = 0
+
+    @property
+    def solves(self) -> int:
+        return self.linprog+self.warm
+
+
+@contextmanager
+def counting_solves() -> Iterator[SolveCounts]:
+    """
+    Counts the calls of linprog and of WarmSimplex.maximize inside the with block, and the pivots those maximize calls
+    make, each of which factorizes the new basis.
+    """
+    original_linprog = scipy.optimize.linprog
+    original_maximize = WarmSimplex.maximize
+    original_factorize = WarmSimplex._factorize
+    counts = SolveCounts()
+    maximizing = [0]
+
+    def linprog(*args, **kwargs):
+        counts.linprog += 1
+        return original_linprog(*args, **kwargs)
+
+    def maximize(self, *args, **kwargs):
+        counts.warm += 1
+        maximizing[0] += 1
+        try:
+            return original_maximize(self, *args, **kwargs)
+        finally:
+            maximizing[0] -= 1
+
+    def factorize(self):
+        if maximizing[0]:
+            counts.pivots += 1
+        return original_factorize(self)
+
+    scipy.optimize.linprog = linprog
+    WarmSimplex.maximize = maximize
+    WarmSimplex._factorize = factorize
+    try:
+        yield counts
+    finally:
+        scipy.optimize.linprog = original_linprog
+        WarmSimplex.maximize = original_maximize
+        WarmSimplex._factorize = original_factorize
+
+
+class PerfRecorder:
+    """
+    Measures phases of an analysis and compares them against the baseline. Times are the fastest of a number of runs,
+    as the slower runs mostly measure noise. Peak memory is measured in a separate run with tracemalloc, which would
+    slow down the timed runs. Small absolute margins keep very short phases from failing on noise.
+    """
+    TIME_MARGIN = 0.02
+    MEMORY_MARGIN_MB = 1.
+
+    def __init__(self, config: pytest.Config):
+        self.config = config
+        self.path: str = config.getoption("--perf-baseline")
+        self.update: bool = config.getoption("--perf-update-baseline")
+        self.rounds: int = max(1, config.getoption("--perf-rounds"))
+        self.baseline: dict[str, dict[str, Any]] = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                self.baseline = json.load(file)
+        self.measurements: dict[str, PhaseMeasurement] = {}
+
+    def measure(self, phase: str, run: Callable[[], Any]) -> Any:
+        """
+        Runs a phase, records its wall time, number of solves and pivots and peak memory, and fails if it regressed
+        compared to the baseline. The phase should give the same result every time it runs.
+
+        :return: the result of the last run of the phase
+        """
+        seconds = math.inf
+        for _ in range(self.rounds):
+            gc.collect()
+            with counting_solves() as counts:
+                start = time.perf_counter()
+                result = run()
+                seconds = min(seconds, time.perf_counter()-start)
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        measurement = PhaseMeasurement(seconds, counts.solves, peak/2**20, counts.pivots)
+        self.measurements[phase] = measurement
+        if not self.update:
+            self.check(phase, measurement)
+        return result
+
+    def check(self, phase: str, measurement: PhaseMeasurement):
+        if phase not in self.baseline:
+            pytest.skip(f"no baseline for phase {phase}, run with --perf-update-baseline to record one")
+        baseline = PhaseMeasurement(**self.baseline[phase])
+        time_tolerance = self.config.getoption("--perf-time-tolerance")
+        memory_tolerance = self.config.getoption("--perf-memory-tolerance")
+        solve_tolerance = self.config.getoption("--perf-solve-tolerance")
+        failures = []
+        time_limit = baseline.seconds*(1.+time_tolerance)+self.TIME_MARGIN
+        if measurement.seconds > time_limit:
+            failures.append(f"wall time {measurement.seconds:.3f}s exceeds {time_limit:.3f}s "
+                            f"(baseline {baseline.seconds:.3f}s)")
+        solve_limit = baseline.solves*(1.+solve_tolerance)
+        if measurement.solves > solve_limit:
+            failures.append(f"{measurement.solves} solves exceed {solve_limit:g} (baseline {baseline.solves})")
+        pivot_limit = baseline.pivots*(1.+solve_tolerance)
+        if measurement.pivots > pivot_limit:
+            failures.append(f"{measurement.pivots} pivots exceed {pivot_limit:g} (baseline {baseline.pivots})")
+        memory_limit = baseline.peak_mb*(1.+memory_tolerance)+self.MEMORY_MARGIN_MB
+        if measurement.peak_mb > memory_limit:
+            failures.append(f"peak memory {measurement.peak_mb:.1f}MB exceeds {memory_limit:.1f}MB "
+                            f"(baseline {baseline.peak_mb:.1f}MB)")
+        if failures:
+            pytest.fail(f"phase {phase} regressed: " + ", ".join(failures), pytrace=False)
+
+    def save(self):
+        baseline = dict(self.baseline)
+        for phase, measurement in self.measurements.items():
+            baseline[phase] = {key: round(value, 4) if isinstance(value, float) else value
+                               for key, value in asdict(measurement).items()}
+        with open(self.path, "w") as file:
+            json.dump(dict(sorted(baseline.items())), file, indent=2)
+            file.write("\n")
+
+    def summary(self) -> list[str]:
+        lines = [f"{'phase':<28}{'seconds':>18}{'solves':>16}{'pivots':>16}{'peak MB':>18}"]
+        for phase, measurement in self.measurements.items():
+            baseline = self.baseline.get(phase)
+
+            def cell(value: float, key: str, fmt: str) -> str:
+                if baseline is None:
+                    return format(value, fmt)
+                return f"{format(value, fmt)} ({format(baseline.get(key, 0), fmt)})"
+
+            lines.append(f"{phase:<28}{cell(measurement.seconds, 'seconds', '.3f'):>18}"
+                         f"{cell(measurement.solves, 'solves', 'd'):>16}"
+                         f"{cell(measurement.pivots, 'pivots', 'd'):>16}"
+                         f"{cell(measurement.peak_mb, 'peak_mb', '.1f'):>18}")
+        return lines
+
+
+_recorder_key = pytest.StashKey[PerfRecorder]()
+
+
+@pytest.fixture(scope="session")
+def perf(pytestconfig: pytest.Config) -> PerfRecorder:
+    if _recorder_key not in pytestconfig.stash:
+        pytestconfig.stash[_recorder_key] = PerfRecorder(pytestconfig)
+    return pytestconfig.stash[_recorder_key]
+
+
+def pytest_sessionfinish(session: pytest.Session):
+    recorder = session.config.stash.get(_recorder_key, None)
+    if recorder is not None and recorder.update and recorder.measurements:
+        recorder.save()
+
+
+def pytest_terminal_summary(terminalreporter, config: pytest.Config):
+    recorder = config.stash.get(_recorder_key, None)
+    if recorder is None or not recorder.measurements:
+        return
+    title = "perf measurements" + (" (written to baseline)" if recorder.update else " (baseline)")
+    terminalreporter.section(title)
+    for line in recorder.summary():
+        terminalreporter.write_line(line)
@@ -1,7 +1,7 @@
-from facalc.factories import new_factory, OutputPoint
+from facalc.factories import new_factory, OutputPoint, SubFactory
 from facalc.factorio_machines import Crafter, ElectronicFurnace, FURNACE_RECIPES, CRAFTER_RECIPES
 
-def main():
+def build_factory() -> SubFactory:
     factory = new_factory()
 
     # temporary hardcoded recipes
@@ -27,6 +27,11 @@ def main():
     factory.connect(iron_factory_buffer, belt_crafters, "gear")
     factory.add_output_point(OutputPoint(belt_crafters, "belt"))
 
+    return factory
+
+
+def main():
+    factory = build_factory()
     factory.default_print_info(factory.analyse())
 
 
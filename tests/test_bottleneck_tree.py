@@ -0,0 +1,76 @@
+from __future__ import annotations
+import os
+import pytest
+from facalc.cli import load_world
+from facalc.bottleneck_tree import explore_bottlenecks
+from facalc.factories import new_factory, OutputPoint
+from conftest import ROOT, counting_solves, requires_world1
+
+
+def tied_factory():
+    """ a source, a buffer line and an output point which all cap the rate at 10, so every order of removal ties """
+    factory = new_factory()
+    source = factory.add_source("ore", 10.)
+    line = factory.add_buffer("line", {"ore": 10.})
+    factory.connect(source, line, "ore")
+    output_point = OutputPoint(line, "ore", 10.)
+    factory.add_output_point(output_point)
+    return factory, output_point
+
+
+def first_branch(tree) -> tuple:
+    chain = []
+    node = tree.root
+    while node.children:
+        cap, child = next(iter(node.children.items()))
+        chain.append((node.rate, cap))
+        node = child
+    return tuple(chain)
+
+
+@pytest.mark.parametrize("path", ["test.py", "trashing_test.py"])
+def test_first_branch_is_the_bottleneck_chain(path: str):
+    factory = load_world(os.path.join(ROOT, "tests", path))
+    for output_point in factory._output_points:
+        tree = explore_bottlenecks(factory, output_point, max_depth=3)
+        problem = factory.factory.compile(output_point)
+        assert first_branch(tree) == problem.bottleneck_chain(problem.solve(), 3).get()
+        assert first_branch(tree) in tree.chains()
+
+
+def test_removed_caps_are_solved_once():
+    factory, output_point = tied_factory()
+    with counting_solves() as counts:
+        tree = explore_bottlenecks(factory, output_point, max_depth=3)
+    # every subset of the three caps is one node, although the six orders of removal reach them by different paths
+    assert len(tree.chains()) == 6
+    assert len(tree.nodes) == 8
+    # the first branch is solved by the warm started bottleneck chain, the other nodes by linprog
+    assert tree.num_solves == counts.solves == 8
+    assert tree.root.rate == 10. and tree.nodes[frozenset(tree.root.binding)].is_unbounded
+    # a node reached by two paths is the same object
+    first, second, _ = tree.root.binding
+    assert tree.root.children[first].children[second] is tree.root.children[second].children[first]
+
+
+@pytest.mark.parametrize("path", ["test.py", "trashing_test.py"])
+def test_jobs_give_identical_trees(path: str):
+    factory = load_world(os.path.join(ROOT, "tests", path))
+    for output_point in factory._output_points:
+        serial = explore_bottlenecks(factory, output_point, max_depth=3, jobs=1)
+        parallel = explore_bottlenecks(factory, output_point, max_depth=3, jobs=2)
+        assert serial.display() == parallel.display()
+        assert serial.chains() == parallel.chains()
+        assert serial.num_solves == parallel.num_solves
+        assert {removed: (node.rate, node.binding) for removed, node in serial.nodes.items()} == {
+            removed: (node.rate, node.binding) for removed, node in parallel.nodes.items()}
+
+
+@requires_world1
+def test_first_branch_is_the_bottleneck_chain_where_caps_tie():
+    # world1 has many degenerate problems, in which the caps binding at the optimum depend on the vertex found
+    factory = load_world(os.path.join(ROOT, "world1", "main.py"))
+    for output_point in factory._output_points:
+        tree = explore_bottlenecks(factory, output_point, max_depth=3)
+        problem = factory.factory.compile(output_point)
+        assert first_branch(tree) == problem.bottleneck_chain(problem.solve(), 3).get()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import json
+import os
+import pytest
+from facalc.cli import main, load_world
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+FAILING_WORLD = """
+from facalc.factories import new_factory, OutputPoint
+
+
+def build_factory():
+    factory = new_factory()
+    source = factory.add_source("ore", 10)
+    factory.add_output_point(OutputPoint(source, "ore"))
+    return factory
+"""
+
+MACHINE_OUTPUT_WORLD = """
+from facalc.factories import new_factory, OutputPoint
+from facalc.factorio_machines import Crafter, CrafterRecipe
+
+
+def build_factory():
+    factory = new_factory()
+    source = factory.add_source("ore", 10)
+    crafters = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="plate", outp_count=1, inp={"ore": 1}, supports_prod_modules=False), 1))
+    factory.connect(source, crafters)
+    factory.add_output_point(OutputPoint(crafters, "plate"))
+    return factory
+"""
+
+
+def test_main_prints_json_results_on_stdout(capsys: pytest.CaptureFixture):
+    assert main([TEST_FACTORY, "--format", "json", "--progress"]) == 0
+    captured = capsys.readouterr()
+    outputs = json.loads(captured.out)["outputs"]
+    factory = load_world(TEST_FACTORY)
+    assert [output["rate"] for output in outputs] == pytest.approx(
+        [factory.factory.compile(output_point).solve().rate for output_point in factory._output_points])
+    # progress goes to stderr, keeping stdout parsable
+    assert "done!" in captured.err
+
+
+def test_main_reports_errors(capsys: pytest.CaptureFixture, tmp_path):
+    assert main([os.path.join(str(tmp_path), "missing.py")]) == 2
+    assert "does not exist" in capsys.readouterr().err
+    world = tmp_path/"failing_world.py"
+    world.write_text(FAILING_WORLD)
+    assert main([str(world)]) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "source is not supported" in captured.err
+
+
+def test_json_output_refers_to_machine_groups_by_index(capsys: pytest.CaptureFixture, tmp_path):
+    world = tmp_path/"machine_output_world.py"
+    world.write_text(MACHINE_OUTPUT_WORLD)
+    runs = []
+    for _ in range(2):
+        assert main([str(world), "--format", "json"]) == 0
+        runs.append(capsys.readouterr().out)
+    # nothing in the output depends on where the nodes are in memory, so identical runs give identical files
+    assert runs[0] == runs[1]
+    [output] = json.loads(runs[0])["outputs"]
+    assert output["node"] == 1
+    assert output["location"].startswith("a machine group of ")
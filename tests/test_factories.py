@@ -0,0 +1,213 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+import scipy.optimize
+from facalc.cli import load_world
+from facalc.factories import new_factory, OutputPoint, BufferRateCap, SourceRateCap
+from facalc.factorio_machines import OilRefinery, CompleteRecipe, Crafter, CrafterRecipe
+from conftest import ROOT, counting_solves
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+
+def add_trashing_line(factory, name: str, max_rate: float) -> OutputPoint:
+    source = factory.add_source("A", max_rate)
+    refineries = factory.add_machine_group(OilRefinery(CompleteRecipe(
+        time=1., name=f"{name} A to B+C", inp={"A": 1.}, outp={"B": 1., "C": 2.}, supports_prod_modules=False)))
+    factory.connect(source, refineries)
+    line = factory.add_buffer(name)
+    factory.connect(refineries, line, "B", "C")
+    factory.add_trash_point(line, "C")
+    crafters = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="D", outp_count=1, inp={"B": 1, "C": 1}, supports_prod_modules=False), 1))
+    factory.connect(line, crafters, "B", "C")
+    factory.connect(crafters, line, "D")
+    output_point = OutputPoint(line, "D")
+    factory.add_output_point(output_point)
+    return output_point
+
+
+def test_compile_many_matches_compile():
+    # two disconnected lines with a trash point each, so every problem has trash points outside its component
+    factory = new_factory()
+    output_points = [add_trashing_line(factory, "first", 10.), add_trashing_line(factory, "second", 4.)]
+    problems = factory.factory.compile_many(output_points)
+    for output_point, problem in zip(output_points, problems):
+        expected = factory.factory.compile(output_point)
+        assert problem.trash_points == expected.trash_points
+        assert problem.canonical_key() == expected.canonical_key()
+    assert [result.result_rate for result in factory.factory.analyse_many(output_points)] == [
+        problem.solve().rate for problem in problems]
+
+
+def test_bottleneck_index_reports_unbounded_output_points_separately():
+    factory = new_factory()
+    source = factory.add_source("ore", 60.)
+    line = factory.add_buffer("line", {"ore": 30.})
+    factory.connect(source, line, "ore")
+    output_point = OutputPoint(line, "ore")
+    factory.add_output_point(output_point)
+    index = factory.analyse().bottleneck_index()
+    buffer_cap, source_cap = BufferRateCap(line, "ore"), SourceRateCap(source)
+    assert index.blocked_rate(buffer_cap) == 30.
+    assert index.blocked_rate(source_cap) == 0.
+    assert index.unbounded_output_points(source_cap) == [output_point]
+    assert index.unbounded_output_points(buffer_cap) == []
+    assert index.sorted_by_blocked_rate() == [(buffer_cap, 30.)]
+    assert index.unbounded_bottlenecks() == [(source_cap, [output_point])]
+    assert "inf" not in index.display(None)
+
+
+def build_chain(factory, num_lines: int) -> list[OutputPoint]:
+    output_points = [add_trashing_line(factory, f"line {i}", 2.+i) for i in range(num_lines)]
+    # a second stage joining every line, with materials auto-detected where possible
+    collector = factory.add_buffer("collector", {"D": 5.})
+    for output_point in output_points:
+        factory.connect(output_point.location, collector, "D")
+    packers = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="E", outp_count=1, inp={"D": 2}, supports_prod_modules=False), 1))
+    factory.connect(collector, packers)
+    output_points.append(OutputPoint(packers, "E"))
+    return output_points
+
+
+def test_bulk_builds_the_same_problems():
+    expected_factory = new_factory()
+    expected_points = build_chain(expected_factory, 4)
+    factory = new_factory()
+    with factory.bulk() as builder:
+        output_points = build_chain(factory, 4)
+        assert len(builder) > 0
+    for output_point, expected_point in zip(output_points, expected_points):
+        problem = factory.factory.compile(output_point)
+        expected = expected_factory.factory.compile(expected_point)
+        assert problem.canonical_key() == expected.canonical_key()
+        assert problem.solve().rate == expected.solve().rate
+
+
+def test_bulk_reports_all_invalid_connections_and_makes_none():
+    factory = new_factory()
+    source = factory.add_source("ore", 1.)
+    buffer = factory.add_buffer("line")
+    crafters = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="E", outp_count=1, inp={"D": 2}, supports_prod_modules=False), 1))
+    with pytest.raises(ValueError, match="2 of 3 connections are invalid"):
+        with factory.bulk():
+            factory.connect(source, buffer)
+            factory.connect(buffer, source, "ore")
+            factory.connect(buffer, crafters, "ore")
+    assert not buffer.input_materials
+
+
+@pytest.mark.parametrize("ratios", [(1., 2., 0.), (3., 1., 1.), (0., 1., 4.)])
+def test_joint_ratios_move_in_lockstep(ratios: tuple[float, ...]):
+    factory = load_world(TEST_FACTORY)
+    output_points = factory._output_points
+    results = factory.analyse_joint(ratios=dict(zip(output_points, ratios)))
+    # the result rate is the multiple of the ratios, which every output point takes
+    for output_point, ratio in zip(output_points, ratios):
+        assert results.output_rates[output_point] == pytest.approx(ratio*results.result_rate, abs=1e-9)
+    assert results.result_rate > 0.
+    for output_point in output_points:
+        standalone = factory.factory.compile(output_point).solve().rate
+        assert results.output_rates[output_point] <= standalone*(1.+1e-9)
+
+
+@pytest.mark.parametrize("weights", [(1., 1., 1.), (1., 0., 0.), (0.5, 2., 1.)])
+def test_joint_weights_match_linprog(weights: tuple[float, ...]):
+    factory = load_world(TEST_FACTORY)
+    output_points = factory._output_points
+    results = factory.analyse_joint(weights=dict(zip(output_points, weights)))
+    problem = factory.factory.compile_joint(output_points)
+    objective = np.zeros(problem.num_variables)
+    objective[:len(output_points)] = weights
+    expected = scipy.optimize.linprog(-objective, problem.inequalities_matrix, problem.inequalities_bounds,
+                                      problem.equalities_matrix, problem.equalities_values)
+    assert expected.status == 0
+    assert results.result_rate == pytest.approx(-expected.fun)
+    assert results.result_rate == pytest.approx(
+        sum(weight*results.output_rates[output_point] for output_point, weight in zip(output_points, weights)))
+    # sharing the factory, no output point does better than on its own
+    for output_point in output_points:
+        standalone = factory.factory.compile(output_point).solve().rate
+        assert results.output_rates[output_point] <= standalone*(1.+1e-9)
+
+
+def test_joint_analysis_defaults_to_the_sum_of_rates():
+    factory = load_world(TEST_FACTORY)
+    results = factory.analyse_joint()
+    assert results.result_rate == pytest.approx(factory.analyse_joint(
+        weights={output_point: 1. for output_point in factory._output_points}).result_rate)
+    assert results.result_rate == pytest.approx(sum(results.output_rates.values()))
+
+
+def test_joint_analysis_rejects_invalid_arguments():
+    factory = load_world(TEST_FACTORY)
+    output_points = factory._output_points
+    with pytest.raises(ValueError):
+        factory.analyse_joint(ratios={output_points[0]: 1.}, weights={output_points[0]: 1.})
+    with pytest.raises(ValueError):
+        factory.analyse_joint(ratios={output_points[0]: -1., output_points[1]: 1.})
+    with pytest.raises(ValueError):
+        factory.analyse_joint(ratios={output_point: 0. for output_point in output_points})
+    problem = factory.factory.compile_joint(output_points)
+    with pytest.raises(ValueError):
+        problem.with_ratios([1., 1.])
+    with pytest.raises(ValueError):
+        problem.with_weights([1., 1., 1., 1.])
+
+
+def add_tied_line(factory) -> OutputPoint:
+    """ a source, a buffer line and an output point which all cap the rate at 10, so the chain has three steps """
+    source = factory.add_source("ore", 10.)
+    line = factory.add_buffer("line", {"ore": 10.})
+    factory.connect(source, line, "ore")
+    output_point = OutputPoint(line, "ore", 10.)
+    factory.add_output_point(output_point)
+    return output_point
+
+
+def test_bottleneck_chain_is_computed_on_demand():
+    factory = new_factory()
+    problem = factory.factory.compile(add_tied_line(factory))
+    with counting_solves() as counts:
+        results = problem.analyse()
+        assert counts.solves == 1
+        assert len(results.get_bottlenecks(1)) == 1
+        assert counts.solves == 2
+        # earlier steps are kept, so asking again or for one more step solves at most once more
+        assert results.get_bottlenecks(1) == results.get_bottlenecks(1)
+        assert len(results.get_bottlenecks(2)) == 2
+        assert counts.solves == 3
+        assert len(results.bottlenecks) == 3
+        assert counts.solves == 4
+        assert results.bottlenecks == results.get_bottlenecks()
+        assert counts.solves == 4
+
+
+def test_bottleneck_chain_stops_at_max_depth():
+    factory = new_factory()
+    problem = factory.factory.compile(add_tied_line(factory))
+    with counting_solves() as counts:
+        results = problem.analyse(max_depth=1)
+        assert len(results.bottlenecks) == 1
+        assert len(results.get_bottlenecks(3)) == 1
+        assert counts.solves == 2
+
+
+def test_translated_bottleneck_chains_share_the_computation():
+    factory = new_factory()
+    first, second = add_tied_line(factory), add_tied_line(factory)
+    first_problem, second_problem = factory.factory.compile(first), factory.factory.compile(second)
+    assert first_problem.canonical_key() == second_problem.canonical_key()
+    chain = first_problem.bottleneck_chain(first_problem.solve())
+    translated = chain.translated(second_problem.caps)
+    with counting_solves() as counts:
+        steps = translated.get()
+        solves = counts.solves
+        assert solves == 3
+        assert [cap for _, cap in steps] == [second_problem.caps[j] for _, j in chain.get_steps()]
+        assert counts.solves == solves
+    assert [rate for rate, _ in steps] == [rate for rate, _ in chain.get()]
+    assert {cap for _, cap in steps} == set(second_problem.caps)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+import gc
+from facalc.factorio_machines import (Crafter, CrafterRecipe, Module, interned, with_modules,
+                                      _INTERNED_MACHINE_TYPES)
+
+
+def test_interned_machine_types_are_shared_and_released():
+    recipe = CrafterRecipe(time=1., outp="widget", outp_count=1, inp={"part": 2}, supports_prod_modules=True)
+    crafter = interned(Crafter(recipe, 3))
+    assert interned(Crafter(recipe, 3)) is crafter
+    moduled = with_modules(crafter, (Module.SPEED_MODULE_1,)*2)
+    assert with_modules(crafter, (Module.SPEED_MODULE_1,)*2) is moduled
+    assert moduled is not crafter
+    # release the machine types of factories other tests left in reference cycles first
+    gc.collect()
+    size = len(_INTERNED_MACHINE_TYPES)
+    del crafter, moduled
+    gc.collect()
+    assert len(_INTERNED_MACHINE_TYPES) == size-2
@@ -0,0 +1,40 @@
+from __future__ import annotations
+import os
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory
+from facalc.factorio_machines import Lab, Module, SCIENCE_PACKS
+from facalc.integer_plans import integer_plan, _CountedProblem
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+def test_lab_machines_per_rate_includes_modules():
+    lab = Lab("al", 30., speed_bonus=.6, modules=(Module.SPEED_MODULE_3, Module.PRODUCTION_MODULE_1))
+    rate = 2.
+    # every lab uses one of each pack per research unit, at the research speed of the lab
+    packs_per_lab = lab.research_speed/lab.time
+    assert rate*lab.input_rates[SCIENCE_PACKS["a"]] == pytest.approx(rate*lab.machines_per_rate*packs_per_lab)
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+@pytest.mark.parametrize("time_limit", [0., 10.])
+def test_integer_plan_reaches_rate_and_is_not_reducible(path: str, time_limit: float):
+    factory: SubFactory = load_world(path)
+    for output_point in factory._output_points:
+        problem = factory.factory.compile(output_point)
+        target_rate = problem.solve().rate
+        plan = integer_plan(factory, output_point, time_limit=time_limit)
+        assert plan.result_rate >= target_rate-1e-9*max(1., target_rate)
+        # removing any single machine lowers the rate
+        counted = _CountedProblem(problem)
+        counts = [plan.machine_counts[group] for group in problem.machine_groups]
+        for i, count in enumerate(counts):
+            if count == 0:
+                continue
+            lowered = list(counts)
+            lowered[i] -= 1
+            solution = counted.solve(lowered)
+            assert solution is not None and solution.rate < target_rate-1e-9*max(1., target_rate)
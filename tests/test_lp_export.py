@@ -0,0 +1,89 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+import scipy.optimize
+from conftest import ROOT
+from facalc.cli import load_world
+from facalc.factories import FactoryAnalysisException
+from facalc.lp_export import (problem_variants, variable_names, read_primal, import_solution, MAX_RATE_VARIANT,
+                              TRASH_VARIANT)
+
+
+def solve_mps(path: str) -> dict[str, float]:
+    """ reads a free MPS file as written by ExportedProblem.to_mps and solves it with linprog in place of a solver """
+    rows: dict[str, str] = {}
+    columns: dict[str, dict[str, float]] = {}
+    rhs: dict[str, float] = {}
+    section = None
+    with open(path) as file:
+        for line in file:
+            tokens = line.split()
+            if not line.startswith(" "):
+                section = tokens[0]
+            elif section == "ROWS":
+                rows[tokens[1]] = tokens[0]
+            elif section == "COLUMNS":
+                columns.setdefault(tokens[0], {})[tokens[1]] = float(tokens[2])
+            elif section == "RHS":
+                rhs[tokens[1]] = float(tokens[2])
+    names = list(columns)
+    equalities = [row for row, kind in rows.items() if kind == "E"]
+    inequalities = [row for row, kind in rows.items() if kind == "L"]
+
+    def matrix(selected: list[str]) -> np.ndarray:
+        return np.array([[columns[name].get(row, 0.) for name in names] for row in selected]).reshape(-1, len(names))
+
+    costs = matrix([row for row, kind in rows.items() if kind == "N"])[0]
+    result = scipy.optimize.linprog(costs, matrix(inequalities), [rhs.get(row, 0.) for row in inequalities],
+                                    matrix(equalities), [rhs.get(row, 0.) for row in equalities])
+    assert result.status == 0
+    return dict(zip(names, result.x))
+
+
+def round_trip(problem, directory: str) -> dict[str, dict[str, float]]:
+    """
+    exports the maximal rate and trash variants of a problem to MPS, solves them and reads the primal values back from
+    solution files
+    """
+    solutions = {}
+    for exported, description in problem_variants(problem, "problem"):
+        if description["variant"] not in (MAX_RATE_VARIANT, TRASH_VARIANT):
+            continue
+        path = os.path.join(directory, f"{exported.name}.mps")
+        exported.write(path)
+        solution_path = os.path.join(directory, f"{exported.name}.sol")
+        with open(solution_path, "w") as file:
+            file.write("# Columns\n")
+            file.writelines(f"{name} {float(value)!r}\n" for name, value in solve_mps(path).items())
+        solutions[description["variant"]] = read_primal(solution_path, variable_names(problem))
+    return solutions
+
+
+@pytest.mark.parametrize("path", ["test.py", "trashing_test.py"])
+def test_imported_solution_matches_analyse(path: str, tmp_path):
+    factory = load_world(os.path.join(ROOT, "tests", path))
+    for output_point in factory._output_points:
+        problem = factory.factory.compile(output_point)
+        solutions = round_trip(problem, str(tmp_path))
+        imported = import_solution(problem, solutions[MAX_RATE_VARIANT], solutions.get(TRASH_VARIANT))
+        expected = problem.analyse()
+        assert imported.result_rate == pytest.approx(expected.result_rate, rel=1e-9)
+        assert [cap for _, cap in imported.bottlenecks] == [cap for _, cap in expected.bottlenecks]
+        assert [rate for rate, _ in imported.bottlenecks] == pytest.approx(
+            [rate for rate, _ in expected.bottlenecks], rel=1e-9)
+        assert imported.display(trash_rates=True, source_rates=True) == expected.display(trash_rates=True,
+                                                                                         source_rates=True)
+
+
+def test_import_solution_needs_the_trash_variant_when_trashing(tmp_path):
+    factory = load_world(os.path.join(ROOT, "tests", "trashing_test.py"))
+    problem = factory.factory.compile(factory._output_points[0])
+    solutions = round_trip(problem, str(tmp_path))
+    assert TRASH_VARIANT in solutions
+    with pytest.raises(ValueError):
+        import_solution(problem, solutions[MAX_RATE_VARIANT])
+    # a solution which does not keep the maximal rate is no solution of the trash variant
+    with pytest.raises(FactoryAnalysisException):
+        import_solution(problem, solutions[MAX_RATE_VARIANT], {name: value/2. for name, value in
+                                                               solutions[TRASH_VARIANT].items()})
@@ -0,0 +1,35 @@
+from facalc.factories import new_factory, OutputPoint, SubFactory
+from facalc.factorio_machines import Crafter, ElectronicFurnace, FURNACE_RECIPES, CRAFTER_RECIPES
+from facalc.macro_machines import collapse
+
+
+def build_factory():
+    # a sub factory supplying both iron plates and gears to belt crafters outside of it, where both lines compete for
+    # the same capped smelters
+    factory = new_factory()
+    sub_factory = SubFactory(factory)
+    iron_source = sub_factory.add_source("iron_ore")
+    iron_smelters = sub_factory.add_machine_group(ElectronicFurnace(FURNACE_RECIPES["iron_plate"]), 10)
+    factory.connect(iron_source, iron_smelters, "iron_ore")
+    iron_buffer = sub_factory.add_buffer("iron_buffer")
+    factory.connect(iron_smelters, iron_buffer, "iron_plate")
+    gear_crafters = sub_factory.add_machine_group(Crafter(CRAFTER_RECIPES["gear"], 3))
+    factory.connect(iron_buffer, gear_crafters, "iron_plate")
+    factory.connect(gear_crafters, iron_buffer, "gear")
+    belt_crafters = factory.add_machine_group(Crafter(CRAFTER_RECIPES["belt"], 3))
+    factory.connect(iron_buffer, belt_crafters, "iron_plate", "gear")
+    factory.add_output_point(OutputPoint(belt_crafters, "belt"))
+    return factory, sub_factory
+
+
+def test_collapsed_factory_matches_expanded_rate():
+    factory, sub_factory = build_factory()
+    expanded_rate = factory.analyse().single_results[factory._output_points[0]].result_rate
+    assert expanded_rate > 0.
+    collapsed = collapse(sub_factory)
+    with collapsed.stand_in():
+        output_point = factory._output_points[0]
+        collapsed_rate = factory.analyse().single_results[output_point].result_rate
+    assert abs(collapsed_rate-expanded_rate) <= 1e-7*expanded_rate
+    # restoring the sub factory restores its rate
+    assert factory.analyse().single_results[factory._output_points[0]].result_rate == expanded_rate
@@ -0,0 +1,101 @@
+from __future__ import annotations
+import os
+import pytest
+from facalc.cli import load_world
+from facalc.factories import (SubFactory, OutputPoint, SourceRateCap, BufferRateCap, OutputPointRateCap, Bottleneck,
+                              new_factory)
+from facalc.factorio_machines import Crafter, CrafterRecipe
+from facalc.min_cut import minimum_cut
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+
+def cap_bound(problem, cap: Bottleneck) -> float:
+    return problem.inequalities_bounds[problem.caps.index(cap)]
+
+
+def add_transport_network(factory):
+    """ three sources merged into a main line over buffers with rate caps, delivering at most 35 ore """
+    a_source = factory.add_source("ore", 10.)
+    b_source = factory.add_source("ore", 20.)
+    c_source = factory.add_source("ore", 5.)
+    collector = factory.add_buffer("collector", {"ore": 25.})
+    side_line = factory.add_buffer("side line", {"ore": 8.})
+    main_line = factory.add_buffer("main line", {"ore": 40.})
+    factory.connect(a_source, collector, "ore")
+    factory.connect(b_source, collector, "ore")
+    factory.connect(b_source, side_line, "ore")
+    factory.connect(c_source, main_line, "ore")
+    factory.connect(collector, main_line, "ore")
+    factory.connect(side_line, main_line, "ore")
+    return main_line
+
+
+@pytest.mark.parametrize("output_cap", [None, 28., 100.])
+def test_transport_cut_matches_linear_problem(output_cap: float | None):
+    factory = new_factory()
+    main_line = add_transport_network(factory)
+    output_point = OutputPoint(main_line, "ore", output_cap)
+
+    results = minimum_cut(factory, output_point)
+    problem = factory.factory.compile(output_point)
+    solution = problem.solve()
+    assert results.transport_only
+    assert results.result_rate == pytest.approx(solution.rate)
+    # the cut is a cut: its capacities add up to the rate, and each of its caps is binding in the linear problem
+    assert sum(cap_bound(problem, cap) for cap in results.cut) == pytest.approx(solution.rate)
+    for cap in results.cut:
+        assert solution.max_slack[problem.caps.index(cap)] < 1e-9
+    # raising all caps of the cut raises the rate, as no other caps limit it
+    raised = problem.with_caps({cap: cap_bound(problem, cap)+1. for cap in results.cut}).solve()
+    assert raised.rate > solution.rate+1e-9
+    assert sum(results.rates.source_rates.values()) == pytest.approx(solution.rate)
+
+
+def test_minimum_cut_falls_back_to_marginals():
+    factory: SubFactory = load_world(TEST_FACTORY)
+    for output_point in factory._output_points:
+        results = minimum_cut(factory, output_point)
+        problem = factory.factory.compile(output_point)
+        solution = problem.solve()
+        assert not results.transport_only
+        assert results.result_rate == pytest.approx(solution.rate)
+        assert results.cut
+        for cap in results.cut:
+            j = problem.caps.index(cap)
+            assert solution.max_slack[j] < 1e-9 and abs(solution.marginals[j]) > 1e-12
+        raised = problem.with_caps({cap: cap_bound(problem, cap)+1. for cap in results.cut}).solve()
+        assert raised.rate > solution.rate+1e-9
+
+
+@pytest.mark.parametrize("plate_cap", [20., 100.])
+def test_transport_regions_feeding_machines_are_cut_by_max_flow(plate_cap: float):
+    factory = new_factory()
+    main_line = add_transport_network(factory)
+    crafters = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="plate", outp_count=1, inp={"ore": 1}, supports_prod_modules=False), 1))
+    plates = factory.add_buffer("plates", {"plate": plate_cap})
+    factory.connect(main_line, crafters, "ore")
+    factory.connect(crafters, plates, "plate")
+    output_point = OutputPoint(plates, "plate")
+
+    results = minimum_cut(factory, output_point)
+    problem = factory.factory.compile(output_point)
+    solution = problem.solve()
+    assert not results.transport_only and results.transport_regions == 1
+    assert results.result_rate == pytest.approx(solution.rate)
+    assert results.result_rate == pytest.approx(min(plate_cap, 35.))
+    if plate_cap < 35.:
+        assert results.cut == (BufferRateCap(plates, "plate"),)
+    else:
+        # the cut of the transport region replaces the cap of its exit
+        assert set(results.cut) == {cap for cap in problem.caps if isinstance(cap, SourceRateCap)}
+    raised = problem.with_caps({cap: cap_bound(problem, cap)+1. for cap in results.cut}).solve()
+    assert raised.rate > solution.rate+1e-9
+    # the flows routed through the region respect its caps
+    for (buffer, material), rate in results.rates.buffer_throughput.items():
+        assert rate <= buffer.rate_caps.get(material, float("inf"))+1e-9
+    for source, rate in results.rates.source_rates.items():
+        assert rate <= source.max_rate+1e-9
+    assert results.rates.buffer_throughput[(main_line, "ore")] == pytest.approx(results.result_rate)
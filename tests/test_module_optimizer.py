@@ -0,0 +1,71 @@
+from __future__ import annotations
+import itertools
+import os
+import numpy as np
+import pytest
+import scipy
+from facalc.cli import load_world
+from facalc.factories import SubFactory
+from facalc.factorio_machines import Module, module_slots, supports_module, with_modules
+from facalc.module_optimizer import optimize_modules
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+
+def brute_force_rate(factory: SubFactory, output_point, module: Module, budget: float, levels: dict) -> float:
+    originals = {group: group.machine_type for group in levels}
+    try:
+        for group, level in levels.items():
+            group.machine_type = with_modules(originals[group], (module,)*level)
+        problem = factory.factory.compile(output_point)
+    finally:
+        for group, machine_type in originals.items():
+            group.machine_type = machine_type
+    # whole machine counts of the machine groups with modules follow the variables of the problem
+    groups = [i for i, group in enumerate(problem.machine_groups) if levels.get(group, 0) > 0]
+    count_rows = np.zeros((len(groups), problem.num_variables+len(groups)))
+    budget_row = np.zeros(problem.num_variables+len(groups))
+    for k, i in enumerate(groups):
+        group = problem.machine_groups[i]
+        count_rows[k, problem.machine_groups_start+i] = (
+            with_modules(originals[group], (module,)*levels[group]).machines_per_rate)
+        count_rows[k, problem.num_variables+k] = -1.
+        budget_row[problem.num_variables+k] = levels[group]
+    no_counts = np.zeros((problem.equalities_matrix.shape[0]+problem.inequalities_matrix.shape[0], len(groups)))
+    result = scipy.optimize.milp(
+        -np.concatenate((problem.objective, np.zeros(len(groups)))),
+        integrality=np.concatenate((np.zeros(problem.num_variables), np.ones(len(groups)))),
+        bounds=scipy.optimize.Bounds(0., np.inf),
+        constraints=[
+            scipy.optimize.LinearConstraint(np.hstack((problem.equalities_matrix,
+                                                       no_counts[:problem.equalities_matrix.shape[0]])),
+                                            problem.equalities_values, problem.equalities_values),
+            scipy.optimize.LinearConstraint(np.vstack((
+                np.hstack((problem.inequalities_matrix, no_counts[problem.equalities_matrix.shape[0]:])),
+                count_rows, budget_row)),
+                -np.inf, np.concatenate((problem.inequalities_bounds, np.zeros(len(groups)), [budget])))
+        ])
+    assert result.status == 0
+    return float(problem.objective.dot(result.x[:problem.num_variables]))
+
+
+@pytest.mark.parametrize("budget", [60, 150])
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_optimize_modules_matches_brute_force(jobs: int, budget: int):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    module = Module.PRODUCTION_MODULE_1
+    for output_point in factory._output_points:
+        groups = [group for group in factory.factory.compile(output_point).machine_groups
+                  if supports_module(group.machine_type, module)]
+        expected = max(
+            brute_force_rate(factory, output_point, module, budget, dict(zip(groups, levels)))
+            for levels in itertools.product(*(range(module_slots(group.machine_type)+1) for group in groups)))
+        allocation = optimize_modules(factory, output_point, module, budget, jobs=jobs)
+        assert allocation.optimal
+        assert allocation.result_rate >= allocation.base_rate
+        assert allocation.result_rate == pytest.approx(expected, rel=1e-7)
+        assert allocation.modules_used <= budget
+        # the allocation itself reaches its rate within the budget
+        assert brute_force_rate(factory, output_point, module, budget, allocation.modules_per_machine) == (
+            pytest.approx(allocation.result_rate, rel=1e-7))
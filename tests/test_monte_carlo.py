@@ -0,0 +1,36 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, Source, SourceRateCap
+from facalc.monte_carlo import monte_carlo
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+def test_monte_carlo_matches_fresh_solves(path: str):
+    factory: SubFactory = load_world(path)
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    results = monte_carlo(factory, {source: lambda rng, n: rng.uniform(0., 2*source.max_rate, n)}, 40, seed=1,
+                          jobs=1, chunk_size=15)
+    for output_point, single_results in results.single_results.items():
+        problem = factory.factory.compile(output_point)
+        for rate, source_rate in zip(single_results.result_rates, results.source_rates[0]):
+            expected = problem.with_caps({SourceRateCap(source): source_rate}).solve().rate
+            assert rate == pytest.approx(expected, rel=1e-7, abs=1e-9)
+
+
+def test_monte_carlo_workers_match_in_process():
+    factory: SubFactory = load_world(TEST_FACTORY)
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    distributions = {source: lambda rng, n: rng.uniform(0., 100., n)}
+    serial = monte_carlo(factory, distributions, 30, seed=2, jobs=1, chunk_size=10)
+    parallel = monte_carlo(factory, distributions, 30, seed=2, jobs=2, chunk_size=10)
+    np.testing.assert_array_equal(serial.source_rates, parallel.source_rates)
+    for output_point, single_results in serial.single_results.items():
+        np.testing.assert_allclose(parallel.single_results[output_point].result_rates, single_results.result_rates)
+        np.testing.assert_array_equal(parallel.single_results[output_point].binding, single_results.binding)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+import scipy.optimize
+from conftest import ROOT
+from facalc.cli import load_world
+from facalc.pareto import pareto_frontier
+
+
+def joint_maximum(factory, output_points, weights, fixed: dict[int, float] | None = None) -> float:
+    """ the maximal weighted sum of the rates of the output points taking output together, solved by linprog """
+    problem = factory.factory.compile_joint(output_points).numeric.dense()
+    objective = np.zeros(len(problem.objective), float)
+    objective[:len(output_points)] = weights
+    equalities_matrix, equalities_values = problem.equalities_matrix, problem.equalities_values
+    for k, rate in (fixed or {}).items():
+        row = np.zeros(len(problem.objective), float)
+        row[k] = 1.
+        equalities_matrix = np.vstack((equalities_matrix, row))
+        equalities_values = np.append(equalities_values, rate)
+    result = scipy.optimize.linprog(-objective, problem.inequalities_matrix, problem.inequalities_bounds,
+                                    equalities_matrix, equalities_values)
+    assert result.status == 0
+    return -result.fun
+
+
+@pytest.fixture
+def world():
+    factory = load_world(os.path.join(ROOT, "tests", "test.py"))
+    return factory, list(factory._output_points)
+
+
+@pytest.mark.parametrize("count", [2, 3])
+def test_pareto_endpoints_are_single_output_maxima(world, count: int):
+    factory, output_points = world
+    output_points = output_points[:count]
+    frontier = pareto_frontier(factory, output_points)
+    for k, output_point in enumerate(output_points):
+        weights = np.zeros(count, float)
+        weights[k] = 1.
+        assert frontier.max_rates[k] == pytest.approx(joint_maximum(factory, output_points, weights), rel=1e-7)
+        # on its own, the output point takes what the other output points would compete for
+        assert frontier.max_rates[k] == pytest.approx(factory.factory.compile(output_point).solve().rate, rel=1e-7)
+
+
+def test_pareto_breakpoints_are_optimal_for_their_facets(world):
+    factory, output_points = world
+    frontier = pareto_frontier(factory, output_points)
+    for facet, weights in zip(frontier.facets, frontier.weights):
+        optimum = joint_maximum(factory, output_points, weights)
+        for i in facet[facet >= 0]:
+            assert weights.dot(frontier.rates[i]) == pytest.approx(optimum, rel=1e-7)
+
+
+def test_pareto_trade_off_matches_linprog(world):
+    factory, output_points = world
+    output_points = output_points[:2]
+    frontier = pareto_frontier(factory, output_points)
+    for rate in np.linspace(0., frontier.max_rates[0], 7):
+        expected = joint_maximum(factory, output_points, np.array([0., 1.]), fixed={0: rate})
+        assert frontier.trade_off(rate) == pytest.approx(expected, rel=1e-7, abs=1e-9)
@@ -0,0 +1,89 @@
+"""
+Performance regression gate: measures the phases of analysing the world1 factory and the small test factories, and
+compares them against tests/perf_baseline.json, see conftest.py for the options. After an intended change in
+performance the baseline is updated with
+
+    python -m pytest tests/test_perf.py --perf-update-baseline
+
+The world1 phases are skipped before python 3.12, see requires_world1.
+"""
+from __future__ import annotations
+import os
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, LinearProblem, LinearSolution
+from conftest import ROOT, PerfRecorder, requires_world1
+
+pytestmark = pytest.mark.perf
+
+WORLD1 = os.path.join(ROOT, "world1", "main.py")
+SMALL_FACTORIES = {
+    "test": os.path.join(ROOT, "tests", "test.py"),
+    "trashing": os.path.join(ROOT, "tests", "trashing_test.py"),
+}
+
+
+@pytest.fixture(scope="module")
+def world1() -> SubFactory:
+    return load_world(WORLD1)
+
+
+@pytest.fixture(scope="module")
+def world1_problems(world1: SubFactory) -> list[LinearProblem]:
+    return [world1.factory.compile(output_point) for output_point in world1._output_points]
+
+
+@pytest.fixture(scope="module")
+def world1_solutions(world1_problems: list[LinearProblem]) -> list[LinearSolution | None]:
+    return [problem.solve() for problem in world1_problems]
+
+
+@requires_world1
+def test_world1_build(perf: PerfRecorder):
+    factory = perf.measure("world1/build", lambda: load_world(WORLD1))
+    assert factory._output_points
+
+
+@requires_world1
+def test_world1_compile(perf: PerfRecorder, world1: SubFactory):
+    problems = perf.measure("world1/compile", lambda: [
+        world1.factory.compile(output_point) for output_point in world1._output_points])
+    assert len(problems) == len(world1._output_points)
+
+
+@requires_world1
+def test_world1_solve(perf: PerfRecorder, world1_problems: list[LinearProblem]):
+    solutions = perf.measure("world1/solve", lambda: [problem.solve() for problem in world1_problems])
+    assert len(solutions) == len(world1_problems)
+
+
+@requires_world1
+def test_world1_bottlenecks(perf: PerfRecorder, world1_problems: list[LinearProblem],
+                            world1_solutions: list[LinearSolution | None]):
+    chains = perf.measure("world1/bottlenecks", lambda: [
+        problem.bottleneck_chain(solution).get()
+        for problem, solution in zip(world1_problems, world1_solutions) if solution is not None])
+    assert all(chains)
+
+
+@requires_world1
+def test_world1_analyse(perf: PerfRecorder, world1: SubFactory):
+    def run():
+        results = world1.analyse(jobs=1)
+        # displaying the results computes the first bottlenecks, as printing them in world1/main.py does
+        results.display()
+        return results
+
+    results = perf.measure("world1/analyse", run)
+    assert set(results.single_results) == set(world1._output_points)
+
+
+@pytest.mark.parametrize("name", SMALL_FACTORIES)
+def test_small_factory(perf: PerfRecorder, name: str):
+    def run():
+        results = load_world(SMALL_FACTORIES[name]).analyse(jobs=1)
+        results.display()
+        return results
+
+    results = perf.measure(f"{name}/build+analyse", run)
+    assert results.single_results
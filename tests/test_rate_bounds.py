@@ -0,0 +1,29 @@
+from __future__ import annotations
+import os
+import pytest
+from conftest import ROOT
+from facalc.cli import load_world
+from facalc.factories import Source, SourceRateCap
+from facalc.rate_bounds import output_rate_bounds, rate_bounds
+
+
+@pytest.mark.parametrize("path", ["test.py", "trashing_test.py"])
+def test_output_rate_bounds_are_at_or_above_solved_rates(path: str):
+    factory = load_world(os.path.join(ROOT, "tests", path))
+    bounds = output_rate_bounds(factory)
+    for output_point in factory._output_points:
+        solved = factory.factory.compile(output_point).solve().rate
+        assert bounds[output_point] >= solved*(1.-1e-9)
+
+
+@pytest.mark.parametrize("max_rate", [5., 30., 120.])
+def test_rate_bounds_with_patched_caps_are_at_or_above_solved_rates(max_rate: float):
+    factory = load_world(os.path.join(ROOT, "tests", "test.py"))
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    caps = {SourceRateCap(source): max_rate}
+    bounds = rate_bounds(factory, caps=caps)
+    assert bounds.source_rates[source] == max_rate
+    for output_point in factory._output_points:
+        solved = factory.factory.compile(output_point).with_caps(caps).solve().rate
+        assert bounds.output_point(output_point) >= solved*(1.-1e-9)
+        assert bounds.can_reach(output_point, solved)
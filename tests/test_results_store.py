@@ -0,0 +1,57 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, FullAnalysisResults
+from facalc.results_store import ResultsStore
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+def test_add_solutions_matches_add_scenario(path: str):
+    factory: SubFactory = load_world(path)
+    output_points = factory._output_points
+    problems = factory.factory.compile_many(output_points)
+    solutions = [problem.solve() for problem in problems]
+    results = FullAnalysisResults.from_single_analyses(
+        (output_point, problem.results_from(solution))
+        for output_point, problem, solution in zip(output_points, problems, solutions))
+    store = ResultsStore.for_factory(factory, capacity=1)
+    store.add_scenario("dicts", results)
+    store.add_solutions("solutions", problems, solutions)
+    store.add_solutions("vectors", problems, [solution.x for solution in solutions])
+    assert store.num_scenarios == 3
+    np.testing.assert_allclose(store.result_rates[1:], store.result_rates[[0, 0]])
+    np.testing.assert_allclose(store.rates[1:], store.rates[[0, 0]], atol=1e-9)
+
+
+def test_add_solutions_of_unbounded_problem():
+    factory: SubFactory = load_world(TEST_FACTORY)
+    output_point = factory._output_points[0]
+    problem = factory.factory.compile(output_point)
+    store = ResultsStore.for_factory(factory, [output_point])
+    store.add_solutions("unbounded", [problem], [None])
+    store.add_scenario("reference", FullAnalysisResults.from_single_analyses(
+        [(output_point, problem.infinite_results())]))
+    np.testing.assert_array_equal(store.rates[0], store.rates[1])
+    assert store.get_result_rate("unbounded", output_point) == float("inf")
+
+
+@pytest.mark.parametrize("name", ["store.npz", "store"])
+def test_save_and_load(tmp_path, name: str):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    store = ResultsStore.from_full_results(factory, {"base": factory.analyse(jobs=1)})
+    store.save(tmp_path/name)
+    loaded = ResultsStore.load(tmp_path/name, factory=factory)
+    assert loaded.scenario_names == ("base",)
+    np.testing.assert_array_equal(loaded.rates, store.rates)
+    output_point = factory._output_points[0]
+    assert loaded.get_result_rate("base", output_point) == store.get_result_rate("base", output_point)
+    if name.endswith(".npz"):
+        # the archive is closed after loading, so it can be replaced at once
+        os.replace(tmp_path/name, tmp_path/"moved.npz")
+        assert isinstance(loaded.rates, np.ndarray) and not isinstance(loaded.rates, np.memmap)
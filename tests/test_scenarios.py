@@ -0,0 +1,78 @@
+from __future__ import annotations
+import os
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, Source, Buffer, MachineGroup, BufferRateCap
+from facalc.factorio_machines import Module, supports_module, with_modules
+from facalc.scenarios import ScenarioManager, BASE_SCENARIO
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+
+def fresh_rates(factory: SubFactory, source_rate: float | None = None, buffer_caps: dict | None = None,
+                modules: dict | None = None) -> list[float]:
+    """ the rates of the output points after changing the factory itself and compiling it from scratch """
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    original_rate = source.max_rate
+    original_caps = {buffer: dict(buffer.rate_caps) for buffer, _ in (buffer_caps or {})}
+    original_types = {group: group.machine_type for group in (modules or {})}
+    try:
+        if source_rate is not None:
+            source.max_rate = source_rate
+        for (buffer, material), bound in (buffer_caps or {}).items():
+            buffer.rate_caps[material] = bound
+        for group, group_modules in (modules or {}).items():
+            group.machine_type = with_modules(group.machine_type, group_modules)
+        return [factory.factory.compile(output_point).solve().rate for output_point in factory._output_points]
+    finally:
+        source.max_rate = original_rate
+        for buffer, caps in original_caps.items():
+            buffer.rate_caps = caps
+        for group, machine_type in original_types.items():
+            group.machine_type = machine_type
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_scenarios_match_changed_factories(jobs: int):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    nodes = factory.factory.nodes
+    source = next(node for node in nodes if isinstance(node, Source))
+    iron_buffer = next(node for node in nodes if isinstance(node, Buffer) and node.name == "iron_buffer")
+    modules = {group: (Module.PRODUCTION_MODULE_2,)*2 for group in nodes
+               if isinstance(group, MachineGroup) and supports_module(group.machine_type, Module.PRODUCTION_MODULE_2)}
+    assert modules
+
+    manager = ScenarioManager(factory)
+    manager.add("more ore", source_rates={source: 90.})
+    manager.add("capped plates", caps={BufferRateCap(iron_buffer, "iron_plate"): 45.})
+    manager.add("modules", modules=modules, source_rates={source: 30.})
+    comparison = manager.run(jobs=jobs)
+    rates = comparison.result_rates
+    assert comparison.scenario_names == (BASE_SCENARIO, "more ore", "capped plates", "modules")
+    assert rates[0] == pytest.approx(fresh_rates(factory))
+    assert rates[1] == pytest.approx(fresh_rates(factory, source_rate=90.))
+    assert rates[2] == pytest.approx(fresh_rates(factory, buffer_caps={(iron_buffer, "iron_plate"): 45.}))
+    assert rates[3] == pytest.approx(fresh_rates(factory, source_rate=30., modules=modules))
+    # the scenarios did not change the factory itself
+    assert rates[0] == pytest.approx(fresh_rates(factory))
+    for name, scenario_rates in zip(comparison.scenario_names, rates):
+        bounds = manager.upper_bounds(name)
+        for output_point, rate in zip(comparison.output_points, scenario_rates):
+            assert bounds[output_point] >= rate*(1.-1e-9)
+
+
+def test_run_solves_in_process_by_default(monkeypatch):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    manager = ScenarioManager(factory)
+    manager.add("more ore", source_rates={source: 90.})
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("the default run should not start worker processes")
+
+    # pretend there are cpus to spare, so only the default keeps the run in this process
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr("facalc.scenarios.ProcessPoolExecutor", no_pool)
+    monkeypatch.setattr("facalc.scenarios.SharedProblems", no_pool)
+    assert manager.run().result_rates[1] == pytest.approx(fresh_rates(factory, source_rate=90.))
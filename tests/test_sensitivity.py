@@ -0,0 +1,48 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory
+from facalc.sensitivity import analyse_sensitivity
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+STEP = 1e-3
+
+
+def _rate(problem, bound_patches) -> float:
+    solution = problem.with_caps(bound_patches).solve()
+    return float("inf") if solution is None else solution.rate
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+def test_matrix_matches_finite_differences(path: str):
+    factory: SubFactory = load_world(path)
+    sensitivity = analyse_sensitivity(factory)
+    assert sensitivity.matrix.nnz > 0
+    for i, output_point in enumerate(sensitivity.output_points):
+        problem = factory.factory.compile(output_point)
+        assert sensitivity.result_rates[i] == pytest.approx(problem.solve().rate)
+        for j, cap in enumerate(sensitivity.caps):
+            derivative = sensitivity.matrix[i, j]
+            if cap not in problem.caps:
+                assert derivative == 0.
+                continue
+            bound = problem.inequalities_bounds[problem.caps.index(cap)]
+            rate = sensitivity.result_rates[i]
+            raised = (_rate(problem, {cap: bound+STEP})-rate)/STEP
+            lowered = (rate-_rate(problem, {cap: max(0., bound-STEP)}))/min(STEP, bound) if bound > 0. else raised
+            # at a kink the marginal is a one-sided derivative, between the two difference quotients
+            assert min(raised, lowered)-1e-6 <= derivative <= max(raised, lowered)+1e-6, (output_point, cap)
+
+
+def test_jobs_and_cache_give_the_same_matrix(tmp_path):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    serial = analyse_sensitivity(factory)
+    parallel = analyse_sensitivity(factory, jobs=2, cache_dir=str(tmp_path))
+    cached = analyse_sensitivity(factory, cache_dir=str(tmp_path))
+    for other in (parallel, cached):
+        np.testing.assert_allclose(other.result_rates, serial.result_rates)
+        np.testing.assert_allclose(other.matrix.toarray(), serial.matrix.toarray())
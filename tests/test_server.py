@@ -0,0 +1,94 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, Source, SourceRateCap
+from facalc.server import AnalysisSession, make_server
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+
+
+@pytest.fixture
+def server():
+    factory: SubFactory = load_world(TEST_FACTORY)
+    with AnalysisSession(factory) as session:
+        session.warm()
+        http_server = make_server(session, port=0)
+        thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield factory, session, f"http://127.0.0.1:{http_server.server_address[1]}"
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            thread.join()
+
+
+def request(url: str, body: dict | None = None) -> tuple[int, dict]:
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_server_round_trip(server):
+    factory, session, url = server
+    status, body = request(url+"/outputs")
+    assert status == 200
+    assert [output["material"] for output in body["outputs"]] == [op.material for op in factory._output_points]
+    assert [output["node"] for output in body["outputs"]] == [
+        factory.factory.nodes.index(op.location) for op in factory._output_points]
+    for k, output_point in enumerate(factory._output_points):
+        status, body = request(url+"/query", {"output": k})
+        assert status == 200
+        assert body["rate"] == pytest.approx(factory.factory.compile(output_point).solve().rate)
+
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    node = factory.factory.nodes.index(source)
+    status, body = request(url+"/patch", {"patches": [{"node": node, "cap": 24.}]})
+    assert status == 200 and body == {"patches": 1}
+    for k, output_point in enumerate(factory._output_points):
+        expected = factory.factory.compile(output_point).with_caps({SourceRateCap(source): 24.}).solve().rate
+        assert request(url+"/query", {"output": output_point.material})[1]["rate"] == pytest.approx(expected)
+    # removing the only cap makes every output point unbounded, which is sent as null
+    request(url+"/patch", {"patches": [{"node": node, "cap": None}]})
+    assert request(url+"/query", {"output": 0})[1]["rate"] is None
+    assert request(url+"/reset", {}) == (200, {"patches": 0})
+    assert request(url+"/query", {"output": 0})[1]["rate"] == pytest.approx(
+        factory.factory.compile(factory._output_points[0]).solve().rate)
+
+
+def test_server_errors(server, monkeypatch):
+    factory, session, url = server
+    assert request(url+"/unknown")[0] == 404
+    assert request(url+"/query", {})[0] == 400
+    assert request(url+"/query", {"output": 99})[0] == 400
+    assert request(url+"/patch", {"patches": [{"node": 0, "cap": -1.}]})[0] == 400
+
+    def fail(*args):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(session, "handle", fail)
+    status, body = request(url+"/outputs")
+    assert status == 500 and "broken" in body["error"]
+    monkeypatch.undo()
+    assert request(url+"/outputs")[0] == 200
+
+
+def test_partially_invalid_patch_changes_nothing(server):
+    factory, session, url = server
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    node = factory.factory.nodes.index(source)
+    expected = request(url+"/query", {"output": 0})[1]["rate"]
+    for patches in ([{"node": node, "cap": 1.}, {"node": node, "cap": -1.}],
+                    [{"node": node, "cap": 1.}, {"node": len(factory.factory.nodes)}]):
+        assert request(url+"/patch", {"patches": patches})[0] == 400
+        assert session.patches == {}
+        assert request(url+"/query", {"output": 0})[1]["rate"] == pytest.approx(expected)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory
+from facalc.shared_problems import SharedProblems, attach, detach, solve_in_workers
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+def numeric_problems():
+    problems = []
+    for path in (TEST_FACTORY, TRASHING_FACTORY):
+        factory: SubFactory = load_world(path)
+        problems.extend(problem.numeric for problem in factory.factory.compile_many(factory._output_points))
+    return problems
+
+
+def test_attached_problems_equal_originals():
+    problems = numeric_problems()
+    with SharedProblems(problems) as shared:
+        attached = attach(shared.handle)
+        try:
+            for problem, shared_problem in zip(problems, attached):
+                for name in ("objective", "equalities_values", "inequalities_bounds", "trash_weights_vector"):
+                    np.testing.assert_array_equal(getattr(shared_problem, name), getattr(problem, name))
+                for name in ("equalities_matrix", "inequalities_matrix"):
+                    np.testing.assert_array_equal(getattr(shared_problem, name).toarray(),
+                                                  np.asarray(getattr(problem, name)))
+                assert shared_problem.trash_points_start == problem.trash_points_start
+                assert shared_problem.num_trash_points == problem.num_trash_points
+        finally:
+            del attached
+            detach(shared.handle)
+    assert shared.closed
+
+
+def test_workers_solve_like_serial_solves():
+    problems = numeric_problems()
+    serial = [problem.solve() for problem in problems]
+    parallel = solve_in_workers(problems, 2)
+    for expected, solution in zip(serial, parallel):
+        assert solution.rate == pytest.approx(expected.rate, rel=1e-9)
+        np.testing.assert_allclose(solution.x, expected.x, atol=1e-9)
+        np.testing.assert_array_equal(solution.max_slack < 1e-9, expected.max_slack < 1e-9)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, OutputPoint, BottleneckChain, LinearProblem, new_factory
+from facalc.factorio_machines import Crafter, CrafterRecipe
+from facalc.simplex import WarmSimplex
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+def linprog_chain(problem: LinearProblem) -> list[tuple[float, int]]:
+    """ the bottleneck chain of a problem with every step solved from scratch by linprog """
+    active = list(range(len(problem.caps)))
+    solution = problem.solve()
+    steps = []
+    while solution is not None:
+        binding = [i for i, slack in enumerate(solution.max_slack) if slack < 1e-9]
+        if not binding:
+            break
+        steps.append((solution.rate, active[binding[0]]))
+        active.pop(binding[0])
+        solution = problem.solve(np.array(active, dtype=int))
+    return steps
+
+
+def degenerate_factory() -> tuple[SubFactory, list[OutputPoint]]:
+    # the source, the buffer and the machine cap all bind at the same rate, so the optimal vertex is degenerate
+    factory = new_factory()
+    source = factory.add_source("ore", 6.)
+    line = factory.add_buffer("line", {"ore": 6.})
+    factory.connect(source, line, "ore")
+    crafters = factory.add_machine_group(Crafter(CrafterRecipe(
+        time=1., outp="plate", outp_count=1, inp={"ore": 2}, supports_prod_modules=False), 3), 6.)
+    factory.connect(line, crafters)
+    output_points = [OutputPoint(crafters, "plate"), OutputPoint(line, "ore")]
+    for output_point in output_points:
+        factory.add_output_point(output_point)
+    return factory, output_points
+
+
+def problems() -> list[LinearProblem]:
+    found = []
+    for path in (TEST_FACTORY, TRASHING_FACTORY):
+        factory: SubFactory = load_world(path)
+        found.extend(factory.factory.compile(output_point) for output_point in factory._output_points)
+    factory, output_points = degenerate_factory()
+    found.extend(factory.factory.compile(output_point) for output_point in output_points)
+    return found
+
+
+@pytest.mark.parametrize("problem", problems())
+def test_warm_chain_matches_linprog(problem: LinearProblem):
+    solution = problem.solve()
+    chain = BottleneckChain(problem, solution)
+    steps = chain.get_steps()
+    expected = linprog_chain(problem)
+    assert [i for _, i in steps] == [i for _, i in expected]
+    np.testing.assert_allclose([rate for rate, _ in steps], [rate for rate, _ in expected], rtol=1e-9)
+    # every step after the first was solved by pivoting, without falling back to linprog
+    assert len(steps) < 2 or chain._simplex is not None
+
+
+def test_degenerate_vertex_binds_several_caps():
+    factory, output_points = degenerate_factory()
+    problem = factory.factory.compile(output_points[0])
+    solution = problem.solve()
+    assert np.count_nonzero(solution.max_slack < 1e-9) >= 2
+    steps = BottleneckChain(problem, solution).get_steps()
+    # removing one of the caps binding at the degenerate vertex does not raise the rate
+    assert len(steps) >= 2 and steps[0][0] == pytest.approx(steps[1][0])
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+def test_warm_solve_matches_linprog(path: str):
+    factory: SubFactory = load_world(path)
+    for output_point in factory._output_points:
+        problem = factory.factory.compile(output_point)
+        numeric = problem.numeric
+        solution = problem.solve()
+        simplex = numeric.warm_simplex(solution)
+        warm = numeric.solve_warm(simplex)
+        assert warm.rate == pytest.approx(solution.rate, rel=1e-9)
+        np.testing.assert_allclose(warm.max_slack, solution.max_slack, atol=1e-9)
+        # nondegenerate vertices have unique marginals
+        np.testing.assert_allclose(warm.marginals, solution.marginals, atol=1e-9)
+        # the trash rates are minimized as well
+        trash = slice(problem.trash_points_start, problem.trash_points_start+len(problem.trash_points))
+        assert numeric.trash_weights_vector[trash].dot(warm.x[trash]) == pytest.approx(
+            numeric.trash_weights_vector[trash].dot(solution.x[trash]), abs=1e-9)
+
+
+def test_trash_minimisation_after_relaxing_a_cap():
+    factory: SubFactory = load_world(TRASHING_FACTORY)
+    problem = factory.factory.compile(factory._output_points[0])
+    numeric = problem.numeric
+    assert problem.trash_points
+    solution = problem.solve()
+    first = int(np.flatnonzero(solution.max_slack < 1e-9)[0])
+    simplex = numeric.warm_simplex(solution)
+    simplex.relax(first)
+    warm = numeric.solve_warm(simplex)
+    active = np.array([j for j in range(len(problem.caps)) if j != first], dtype=int)
+    expected = problem.solve(active)
+    if expected is None:
+        assert warm is None
+        return
+    assert warm.rate == pytest.approx(expected.rate, rel=1e-9)
+    trash = slice(problem.trash_points_start, problem.trash_points_start+len(problem.trash_points))
+    assert numeric.trash_weights_vector[trash].dot(warm.x[trash]) == pytest.approx(
+        numeric.trash_weights_vector[trash].dot(expected.x[trash]), abs=1e-9)
+
+
+def test_max_iterations_raises_instead_of_returning_a_non_optimal_basis():
+    # maximize x+y subject to x <= 1 and y <= 1, starting from the vertex at the origin
+    simplex = WarmSimplex(np.array([1., 1.]), np.zeros((0, 2)), np.zeros(0), np.eye(2), np.ones(2), np.zeros(2))
+    with pytest.raises(np.linalg.LinAlgError):
+        simplex.maximize(max_iterations=1)
+    assert simplex.maximize(max_iterations=1)
+    np.testing.assert_allclose(simplex.solution(), [1., 1.])
+    # an optimal basis needs no pivots at all
+    assert simplex.maximize(max_iterations=0)
+
+
+def test_bottleneck_chain_falls_back_when_pivoting_fails(monkeypatch: pytest.MonkeyPatch):
+    factory: SubFactory = load_world(TEST_FACTORY)
+    problem = factory.factory.compile(factory._output_points[-1])
+    expected = linprog_chain(problem)
+    original = WarmSimplex.maximize
+    monkeypatch.setattr(WarmSimplex, "maximize",
+                        lambda self, objective=None, allowed=None, max_iterations=10000: original(self, objective,
+                                                                                                  allowed, 0))
+    chain = BottleneckChain(problem, problem.solve())
+    steps = chain.get_steps()
+    assert [i for _, i in steps] == [i for _, i in expected]
+    np.testing.assert_allclose([rate for rate, _ in steps], [rate for rate, _ in expected], rtol=1e-9)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os
+import sys
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, OutputPoint, new_factory
+from facalc.factorio_machines import Module
+from facalc.simulation import simulate
+from conftest import ROOT, requires_world1
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+def test_simulation_converges_to_linear_rates(path: str):
+    factory: SubFactory = load_world(path)
+    for output_point in factory._output_points:
+        rate = factory.factory.compile(output_point).solve().rate
+        # uncapped machine groups get their rates in the analysis of the output point
+        results = simulate(factory, 100., output_points=[output_point])
+        assert results.get_output_rates(output_point)[-1] == pytest.approx(rate, rel=1e-6)
+
+
+def test_simulation_needs_machine_counts_without_output_points():
+    factory: SubFactory = load_world(TEST_FACTORY)
+    with pytest.raises(ValueError):
+        simulate(factory, 10.)
+
+
+@requires_world1
+@pytest.mark.parametrize("material", ["nuclear_fuel", "uranium_fuel_cell"])
+def test_simulation_converges_through_kovarex_loop(material: str):
+    sys.path.insert(0, os.path.join(ROOT, "world1"))
+    try:
+        from nuclear_factory import NuclearFactory
+    finally:
+        sys.path.remove(os.path.join(ROOT, "world1"))
+    factory = new_factory()
+    lines = []
+    for supply in ("iron_plate", "sulfuric_acid", "rocket_fuel"):
+        source = factory.add_source(supply)
+        lines.append(factory.add_buffer(f"test {supply} line"))
+        factory.connect(source, lines[-1])
+    nuclear_factory = NuclearFactory(
+        factory, *lines, num_nuclear_reactors=100, num_drills=40, resource_bonus=.3,
+        centrifuge_modules=(Module.PRODUCTION_MODULE_1,)*2, crafter_modules=(Module.PRODUCTION_MODULE_3,)*4,
+        crafter_level=3, drill_modules=(Module.PRODUCTION_MODULE_2,)*3
+    )
+    output_point = OutputPoint(nuclear_factory.output_line, material, 7.5)
+    problem = factory.factory.compile(output_point)
+    solution = problem.solve()
+    enrichment_rate = problem.get_rates(solution.x).machine_rates[nuclear_factory.enrichment_centrifuges]
+    assert enrichment_rate > 0.
+    # like in the game, the kovarex loop only runs once it holds enough uranium-235 to start
+    loop_stock = 40.*np.ceil(enrichment_rate)
+    results = simulate(factory, 2000., output_points=[output_point], record_every=10,
+                       initial_contents={(nuclear_factory.uranium_loop, "uranium-235"): loop_stock})
+    assert results.get_output_rates(output_point)[-1] == pytest.approx(solution.rate, rel=1e-6)
+    assert results.settling_time(nuclear_factory.enrichment_centrifuges) is not None
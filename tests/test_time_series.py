@@ -0,0 +1,29 @@
+from __future__ import annotations
+import os
+import numpy as np
+import pytest
+from facalc.cli import load_world
+from facalc.factories import SubFactory, Source, SourceRateCap
+from facalc.time_series import analyse_over_time, exponential_yield, depleting_yield, evaluate_yield_curve
+from conftest import ROOT
+
+TEST_FACTORY = os.path.join(ROOT, "tests", "test.py")
+TRASHING_FACTORY = os.path.join(ROOT, "tests", "trashing_test.py")
+
+
+@pytest.mark.parametrize("path", [TEST_FACTORY, TRASHING_FACTORY])
+@pytest.mark.parametrize("curve", [exponential_yield(100., 20., 5.), depleting_yield(40., 1000.),
+                                   ([0., 10., 30.], [0., 80., 20.])])
+def test_analyse_over_time_matches_fresh_solves(path: str, curve):
+    factory: SubFactory = load_world(path)
+    source = next(node for node in factory.factory.nodes if isinstance(node, Source))
+    times = np.linspace(0., 60., 31)
+    results = analyse_over_time(factory, {source: curve}, times)
+    np.testing.assert_allclose(results.source_rates[0], np.maximum(evaluate_yield_curve(curve, times), 0.))
+    for output_point in results.output_points:
+        problem = factory.factory.compile(output_point)
+        for rate, source_rate in zip(results.get_rates(output_point), results.source_rates[0]):
+            expected = problem.with_caps({SourceRateCap(source): source_rate}).solve().rate
+            assert rate == pytest.approx(expected, rel=1e-7, abs=1e-9)
+        changes = results.bottleneck_changes(output_point)
+        assert changes[0][0] == times[0]
@@ -1,7 +1,7 @@
-from facalc.factories import new_factory, OutputPoint
+from facalc.factories import new_factory, OutputPoint, SubFactory
 from facalc.factorio_machines import OilRefinery, CompleteRecipe, Crafter, CrafterRecipe
 
-def main():
+def build_factory() -> SubFactory:
     factory = new_factory()
 
     a_source = factory.add_source("A", 10)
@@ -32,6 +32,11 @@ def main():
     factory.connect(crafters, main_line, "D")
     factory.add_output_point(OutputPoint(main_line, "D"))
 
+    return factory
+
+
+def main():
+    factory = build_factory()
     factory.default_print_info(factory.analyse())
 
 if __name__ == '__main__':
@@ -1,4 +1,5 @@
-from facalc.factories import OutputPoint, new_factory
+from types import SimpleNamespace
+from facalc.factories import OutputPoint, SubFactory, new_factory
 from facalc.factorio_machines import Module
 from iron_factory import IronFactory
 from copper_factory import CopperFactory
@@ -11,8 +12,7 @@ from module_factory import ModuleFactory
 from mini_factories import LDSFactory, RailFactory
 from nuclear_factory import NuclearFactory
 
-def main():
-    factory = new_factory()
+def add_factories(factory: SubFactory) -> SimpleNamespace:
     # global parameters
     resource_bonus = .3
 
@@ -311,38 +311,69 @@ def main():
         science_types=["al", "alm", "alc", "alcp", "alcm", "alcpu", "alcpum"]
     )
 
+    return SimpleNamespace(
+        factory=factory,
+        main_belt=main_belt,
+        iron_factory=iron_factory,
+        copper_factory=copper_factory,
+        stone_factory=stone_factory,
+        circuit_factory=circuit_factory,
+        module_factory=module_factory,
+        nuclear_factory=nuclear_factory,
+        misc_factory=misc_factory,
+        science_factory=science_factory,
+    )
+
+
+def build_world() -> SimpleNamespace:
+    factory = new_factory()
+    # the connections of all factories are validated together once they are all added
+    with factory.bulk():
+        return add_factories(factory)
+
+
+def build_factory() -> SubFactory:
+    """
+    The factory of this world without analysing it, as loaded by the facalc command line runner.
+    """
+    return build_world().factory
+
+
+def main():
+    world = build_world()
+
     # analyse the factory
-    result = factory.analyse(print_progress=True)
+    result = world.factory.analyse(print_progress=True)
 
     # print info
     print(" --- output rates")
     print(result.display())
 
     print("\n\n\n")
-    misc_factory.print_info(result)
+    world.misc_factory.print_info(result)
     print("")
-    science_factory.print_info(result, "alcpum")
+    world.science_factory.print_info(result, "alcpum")
     print("")
     print(" --- productivity module 2")
-    print(result.single_results[OutputPoint(main_belt, "productivity_module_2")].display())
+    print(result.single_results[OutputPoint(world.main_belt, "productivity_module_2")].display())
     print("")
     print(" --- productivity module 3")
-    print(result.single_results[OutputPoint(main_belt, "productivity_module_3")].display())
+    print(result.single_results[OutputPoint(world.main_belt, "productivity_module_3")].display())
     print("")
-    iron_factory.print_info(result)
+    world.iron_factory.print_info(result)
     print("")
-    copper_factory.print_info(result)
+    world.copper_factory.print_info(result)
     print("")
-    stone_factory.print_info(result)
+    world.stone_factory.print_info(result)
     print("")
-    circuit_factory.print_info(result)
+    world.circuit_factory.print_info(result)
     print("")
-    module_factory.print_info(result)
+    world.module_factory.print_info(result)
     print("")
-    nuclear_factory.print_info(result)
+    world.nuclear_factory.print_info(result)
     print("")
     print(" --- fuel cell power")
-    print(result.single_results[nuclear_factory.power_output_point].display())
+    print(result.single_results[world.nuclear_factory.power_output_point].display())
 
 
 if __name__ == '__main__':
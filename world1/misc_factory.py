@@ -1,6 +1,6 @@
 from itertools import chain
 from facalc.factories import SubFactory, OutputPoint, FullAnalysisResults
-from facalc.factorio_machines import Crafter, CRAFTER_RECIPES, Module
+from facalc.factorio_machines import Crafter, CRAFTER_RECIPES, Module, interned
 
 class MiscFactory(SubFactory):
     def __init__(
@@ -35,9 +35,10 @@ class MiscFactory(SubFactory):
         for material in stations:
             recipe = CRAFTER_RECIPES[material]
             if recipe.supports_prod_modules:
-                crafter_type = Crafter(recipe, productivity_crafter_level, productivity_crafter_modules)
+                crafter_type = interned(Crafter(recipe, productivity_crafter_level, productivity_crafter_modules))
             else:
-                crafter_type = Crafter(recipe, non_productivity_crafter_level, non_productivity_crafter_modules)
+                crafter_type = interned(Crafter(recipe, non_productivity_crafter_level,
+                                                non_productivity_crafter_modules))
             if material in crafter_caps:
                 crafters = self.add_machine_group(crafter_type, crafter_caps[material])
             else: